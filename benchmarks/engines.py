@@ -0,0 +1,138 @@
+"""
+This file benchmarks the compute engines on the bundled Iris and wine datasets scaled up synthetically.
+
+Usage:
+    python -m benchmarks.engines --rows 1000000
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from tab_automl.automl.fet_engineering import FeatureEngineering
+from tab_automl.automl.processing import PreProcessing
+from tab_automl.utils.datasets import read_data
+from tab_automl.utils.engines import engines
+
+# Bundled datasets with their target feature
+datasets = {
+    "Iris": ("Iris.csv", "Species"),
+    "wine": ("wine.csv", "quality"),
+}
+dataset_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tab_automl", "datasets")
+
+parser = argparse.ArgumentParser(description="compute engine benchmark")
+parser.add_argument("-r", "--rows", type=int, default=1000000, metavar="", help="Number of rows of every dataset")
+parser.add_argument("-n", "--null-ratio", type=float, default=0.05, metavar="",
+                    help="Ratio of null items put into every feature")
+parser.add_argument("-s", "--seed", type=int, default=42, metavar="", help="Seed of the synthetic data")
+
+
+def scale_up(data, target, n_rows, null_ratio, seed):
+    """
+    Draws rows with replacement and jitters the numerical features, text
+    features and null items are added so that every processing and
+    encoding branch runs
+
+    Args:
+        data: (pandas.DataFrame) Bundled dataset
+        target: (str) Target feature
+        n_rows: (int) Number of rows of the scaled dataset
+        null_ratio: (float) Ratio of null items put into every feature
+        seed: (int) Seed of the synthetic data
+
+    Returns:
+        data: (pandas.DataFrame) Scaled dataset
+    """
+    rng = np.random.default_rng(seed)
+    data = data.iloc[rng.integers(0, data.shape[0], n_rows)].reset_index(drop=True)
+    features = [feature for feature in data.columns if feature != target]
+    numerical_features = [feature for feature in features if data[feature].dtype.kind == "f"]
+    # jittering the numbers by about 1 % and keeping 4 decimals like the bundled files
+    noise = rng.normal(1, 0.01, size=(n_rows, len(numerical_features)))
+    data[numerical_features] = (data[numerical_features] * noise).round(4)
+    data["grade"] = rng.choice(["low", "medium", "high", "premium"], n_rows, p=[0.4, 0.3, 0.2, 0.1])
+    for feature in features + ["grade"]:
+        data.loc[rng.random(n_rows) < null_ratio, feature] = np.nan
+    # a literal None item, read as null or as text depending on the pandas version, both engines must agree
+    data["batch"] = rng.choice(["1.5", "2.5", "None"], n_rows)
+
+    return data
+
+
+def timed(function, *args, **kwargs):
+    """
+    Args:
+        function: (Any) Function to be timed, its prints are silenced
+
+    Returns:
+        result: (Any) Returned value of the function
+        wall_time: (float) Wall time in seconds
+    """
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+
+    return result, time.perf_counter() - start_time
+
+
+def run_pipeline(data, target, engine):
+    """
+    Args:
+        data: (pandas.DataFrame) Dataset
+        target: (str) Target feature
+        engine: (str) Compute engine
+
+    Returns:
+        x: (pandas.DataFrame) Feature engineered feature set
+        y: (pandas.DataFrame) Feature engineered target feature
+        times: (dict) Wall time of every stage in seconds
+    """
+    x, y = data.drop(columns=[target]), data[[target]].copy()
+    (x, y), processing_time = timed(PreProcessing(x, y, engine=engine).run)
+    (x, y), engineering_time = timed(FeatureEngineering(x, y, engine=engine).run)
+
+    return x, y, {"preprocessing": processing_time, "feature engineering": engineering_time}
+
+
+def main():
+    args = parser.parse_args()
+    rows = list()
+    with tempfile.TemporaryDirectory() as folder:
+        for dataset_name, (file_name, target) in datasets.items():
+            data = scale_up(pd.read_csv(os.path.join(dataset_folder, file_name)), target, args.rows,
+                            args.null_ratio, args.seed)
+            csv_path = os.path.join(folder, f"{dataset_name}.csv")
+            parquet_path = os.path.join(folder, f"{dataset_name}.parquet")
+            data.to_csv(csv_path, index=False)
+            data.to_parquet(parquet_path, index=False)
+            outputs = dict()
+            for engine in engines:
+                times = dict()
+                csv_data, times["csv load"] = timed(read_data, csv_path, engine=engine)
+                parquet_data, times["parquet load"] = timed(read_data, parquet_path, engine=engine)
+                # every engine processes the same frame so that the outputs can be compared exactly
+                x, y, stage_times = run_pipeline(data, target, engine)
+                times.update(stage_times)
+                outputs[engine] = (csv_data, parquet_data, x, y)
+                rows.append({"dataset": dataset_name, "engine": engine, **times, "total": sum(times.values())})
+            reference = outputs[engines[0]]
+            for engine in engines[1:]:
+                # text parsing may round the last bit of a float differently, everything else must be identical
+                pd.testing.assert_frame_equal(reference[0], outputs[engine][0], check_exact=False)
+                for reference_output, output in zip(reference[1:], outputs[engine][1:]):
+                    pd.testing.assert_frame_equal(reference_output, output, check_exact=True)
+            print(f"{dataset_name} : outputs of {engines} are identical on {args.rows} rows")
+
+    results = pd.DataFrame(rows).set_index(["dataset", "engine"])
+    print(f"\nWall time in seconds on {os.cpu_count()} cores\n")
+    print(results.round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+This file benchmarks the startup time of the CLI and the import time of the package modules.
+
+Usage:
+    python -m benchmarks.import_time --repeats 5 --max-help-time 0.5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+# Modules timed on their own, from the lightest to the heaviest
+modules = [
+    "tab_automl.automl.models",
+    "tab_automl.utils.misc",
+    "tab_automl.automl.inference",
+    "tab_automl.automl.training",
+    "tab_automl.main",
+]
+# Model libraries which must only be imported once a model of theirs is trained
+model_libraries = ["lightgbm", "xgboost", "sklearn.cluster", "sklearn.ensemble", "sklearn.svm"]
+package_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description="import time benchmark")
+parser.add_argument("-r", "--repeats", type=int, default=5, metavar="", help="Number of runs of every measurement")
+parser.add_argument("-m", "--max-help-time", type=float, default=None, metavar="",
+                    help="Fail if the median time of the --help command exceeds this many seconds")
+
+# Timing an import inside a fresh interpreter and reporting the model libraries it pulled in
+import_script = """
+import sys, time
+start_time = time.perf_counter()
+import {module}
+print(time.perf_counter() - start_time)
+print(",".join(library for library in {libraries} if library in sys.modules))
+"""
+
+
+def run_python(*arguments):
+    """
+    Args:
+        arguments: (str) Arguments of a fresh python interpreter started on the package folder
+
+    Returns:
+        output: (str) Standard output of the interpreter
+        wall_time: (float) Wall time of the whole process in seconds
+    """
+    start_time = time.perf_counter()
+    completed = subprocess.run([sys.executable, *arguments], cwd=package_folder, capture_output=True, text=True,
+                               check=True)
+
+    return completed.stdout, time.perf_counter() - start_time
+
+
+def time_import(module, repeats):
+    """
+    Args:
+        module: (str) Import path of the module
+        repeats: (int) Number of fresh interpreters the module is imported on
+
+    Returns:
+        import_time: (float) Median import time in seconds
+        libraries: (str) Model libraries imported along with the module
+    """
+    import_times = list()
+    libraries = ""
+    for _ in range(repeats):
+        output, _ = run_python("-c", import_script.format(module=module, libraries=model_libraries))
+        import_time, libraries = output.split("\n")[:2]
+        import_times.append(float(import_time))
+
+    return statistics.median(import_times), libraries
+
+
+def main():
+    args = parser.parse_args()
+    rows = list()
+    for module in modules:
+        import_time, libraries = time_import(module, args.repeats)
+        rows.append({"measurement": f"import {module}", "seconds": import_time, "model libraries": libraries})
+    # the whole command including the interpreter startup, as a user sees it
+    help_time = statistics.median(run_python("-m", "tab_automl.main", "--help")[1] for _ in range(args.repeats))
+    rows.append({"measurement": "python -m tab_automl.main --help", "seconds": help_time, "model libraries": ""})
+    interpreter_time = statistics.median(run_python("-c", "pass")[1] for _ in range(args.repeats))
+    rows.append({"measurement": "python -c pass", "seconds": interpreter_time, "model libraries": ""})
+
+    results = pd.DataFrame(rows).set_index("measurement")
+    print(f"\nMedian of {args.repeats} runs in seconds\n")
+    print(results.round(3).to_string())
+    if rows[0]["model libraries"]:
+        sys.exit(f"\nThe model zoo imported {rows[0]['model libraries']} on import")
+    if args.max_help_time is not None and help_time > args.max_help_time:
+        sys.exit(f"\n--help took {help_time:.3f} s, over the limit of {args.max_help_time} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+This file benchmarks the end-to-end AutoML pipeline on synthetic tables, every stage
+is timed and memory-profiled and the results are written as JSON.
+
+Usage:
+    python -m benchmarks.pipeline --rows 100000 --numerical 20 --categorical 5 --cardinality 50
+    python -m benchmarks.pipeline --output current.json --baseline previous.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib import metadata
+
+import numpy as np
+import pandas as pd
+from termcolor import cprint
+
+from tab_automl.automl.datasets import ClassificationDataset, RegressionDataset
+from tab_automl.automl.fet_engineering import Encode
+from tab_automl.automl.models import single_model_dict
+from tab_automl.automl.processing import NullProcessing
+from tab_automl.utils.losses import loss_fn_dict
+from tab_automl.utils.telemetry import RSSSampler
+from tab_automl.utils.training import to_training_matrix, train_validation_split
+
+# Libraries whose versions are recorded with the results
+libraries = ["numpy", "pandas", "scikit-learn", "lightgbm", "xgboost", "polars", "pyarrow"]
+# Metric every model is scored on per problem type
+metrics = {"classification": "accuracy_score", "regression": "mse"}
+package_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Sampler of the resident memory of the measured functions
+rss_sampler = RSSSampler()
+
+parser = argparse.ArgumentParser(description="end-to-end pipeline benchmark")
+parser.add_argument("-r", "--rows", type=int, default=100000, metavar="", help="Number of rows of the table")
+parser.add_argument("-nm", "--numerical", type=int, default=20, metavar="", help="Number of numerical features")
+parser.add_argument("-ct", "--categorical", type=int, default=5, metavar="", help="Number of categorical features")
+parser.add_argument("-cc", "--cardinality", type=int, default=20, metavar="",
+                    help="Number of distinct items of every categorical feature")
+parser.add_argument("-n", "--null-rate", type=float, default=0.05, metavar="",
+                    help="Ratio of null items put into every feature")
+parser.add_argument("-t", "--problem-type", type=str, default="classification", metavar="",
+                    help="classification or regression")
+parser.add_argument("-k", "--classes", type=int, default=2, metavar="", help="Number of classes of classification")
+parser.add_argument("-m", "--models", type=str, default=None, metavar="",
+                    help="Comma separated models of the model zoo, all models of the problem type if not given")
+parser.add_argument("-f", "--format", type=str, default="csv", metavar="", help="Format of the table file, csv or parquet")
+parser.add_argument("-e", "--engine", type=str, default="pandas", metavar="", help="Compute engine, pandas or polars")
+parser.add_argument("-j", "--n-jobs", type=int, default=1, metavar="", help="Number of threads processing columns")
+parser.add_argument("-s", "--seed", type=int, default=42, metavar="", help="Seed of the synthetic table")
+parser.add_argument("-o", "--output", type=str, default="benchmark_results.json", metavar="",
+                    help="JSON file the results are written to")
+parser.add_argument("-b", "--baseline", type=str, default=None, metavar="",
+                    help="JSON results of an earlier run, the times are compared against it")
+parser.add_argument("-tol", "--tolerance", type=float, default=1.25, metavar="",
+                    help="Ratio over the baseline time a measurement is reported as a regression")
+
+
+def generate_table(n_rows, n_numerical, n_categorical, cardinality, null_rate, problem_type, n_classes=2, seed=42):
+    """
+    Generates a table whose target depends on every feature so that the models have something to learn
+
+    Args:
+        n_rows: (int) Number of rows
+        n_numerical: (int) Number of numerical features
+        n_categorical: (int) Number of categorical features
+        cardinality: (int) Number of distinct items of every categorical feature
+        null_rate: (float) Ratio of null items put into every feature
+        problem_type: (str) classification or regression
+        n_classes: (int) Number of classes of classification
+        seed: (int) Seed of the table
+
+    Returns:
+        data: (pandas.DataFrame) Table with the features and the target feature "target"
+    """
+    rng = np.random.default_rng(seed)
+    numbers = rng.normal(size=(n_rows, n_numerical))
+    signal = numbers @ rng.normal(size=n_numerical)
+    columns = {f"num_{index}": numbers[:, index] for index in range(n_numerical)}
+    for index in range(n_categorical):
+        codes = rng.integers(0, cardinality, n_rows)
+        # every item shifts the target by its own effect
+        signal += rng.normal(size=cardinality)[codes]
+        columns[f"cat_{index}"] = np.array([f"c{index}_{item}" for item in range(cardinality)], dtype=object)[codes]
+    for feature, values in columns.items():
+        values = values.copy()
+        values[rng.random(n_rows) < null_rate] = None if values.dtype == object else np.nan
+        columns[feature] = values
+    signal += rng.normal(scale=signal.std() * 0.3 + 1e-12, size=n_rows)
+    if problem_type == "classification":
+        # classes of about the same size from the quantiles of the signal
+        columns["target"] = np.digitize(signal, np.quantile(signal, np.linspace(0, 1, n_classes + 1)[1:-1]))
+    else:
+        columns["target"] = signal
+
+    return pd.DataFrame(columns)
+
+
+def profiled(function):
+    """
+    Runs the function twice, the first pass is timed and its resident memory sampled, the second
+    pass traces the python and numpy allocations, tracing would slow the timed pass down
+
+    Args:
+        function: (Any) Function without arguments to be profiled, its prints are silenced
+
+    Returns:
+        result: (Any) Returned value of the timed pass
+        measurement: (dict) Wall time in seconds, peak of the python and numpy allocations, resident memory
+            kept by the function and sampled peak of the resident memory over its start in megabytes
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_rss = rss_sampler.start(function)
+        start_time = time.perf_counter()
+        result = function()
+        wall_time = time.perf_counter() - start_time
+        end_rss, peak_rss = rss_sampler.stop(function)
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    # native buffers of the model libraries are not traced, they show on the resident memory only
+    rss_deltas = [rss - start_rss if start_rss is not None else None for rss in (end_rss, peak_rss)]
+
+    return result, {"seconds": wall_time, "peak_traced_mb": peak / (1 << 20), "rss_delta_mb": rss_deltas[0],
+                    "peak_rss_delta_mb": rss_deltas[1]}
+
+
+def environment():
+    """
+    Returns:
+        environment: (dict) Machine, python, library versions and commit of the run
+    """
+    versions = dict()
+    for library in libraries:
+        try:
+            versions[library] = metadata.version(library)
+        except metadata.PackageNotFoundError:
+            versions[library] = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=package_folder, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "libraries": versions, "commit": commit}
+
+
+def load_table(path, problem_type, engine):
+    """
+    Returns:
+        x: (pandas.DataFrame) Feature set read from the table file
+        y: (pandas.DataFrame) Target feature read from the table file
+    """
+    dataset_class = ClassificationDataset if problem_type == "classification" else RegressionDataset
+    dataset = dataset_class(path, engine=engine)
+    features = [feature for feature in dataset.data.columns if feature != "target"]
+
+    return dataset.prepare_x_and_y(feature_set_columns=features, target_column="target")
+
+
+def run_benchmark(args, folder):
+    """
+    Args:
+        args: (argparse.Namespace) arguments parsed by the benchmark
+        folder: (str) Directory the table file is written to
+
+    Returns:
+        stages: (dict) Measurement of every data stage
+        models: (dict) Fit and predict measurements and the validation score of every model
+    """
+    data = generate_table(args.rows, args.numerical, args.categorical, args.cardinality, args.null_rate,
+                          args.problem_type, n_classes=args.classes, seed=args.seed)
+    path = os.path.join(folder, f"table.{args.format}")
+    if args.format == "parquet":
+        data.to_parquet(path, index=False)
+    else:
+        data.to_csv(path, index=False)
+    del data
+    stages = dict()
+    (x, y), stages["load"] = profiled(lambda: load_table(path, args.problem_type, args.engine))
+    (x, y), stages["null processing"] = profiled(
+        lambda: NullProcessing(x, y, engine=args.engine, n_jobs=args.n_jobs).run())
+    (x, y), stages["encode"] = profiled(lambda: Encode(x, y, engine=args.engine, n_jobs=args.n_jobs).run())
+    (x_train, y_train, x_val, y_val), stages["split"] = profiled(lambda: train_validation_split(x, y))
+    (x_train, x_val), stages["training matrix"] = profiled(
+        lambda: (to_training_matrix(x_train), to_training_matrix(x_val)))
+    stages["encode"]["output_columns"] = x.shape[1]
+
+    model_zoo = single_model_dict[args.problem_type]
+    model_names = list(model_zoo.keys()) if args.models is None else \
+        [model_name.strip() for model_name in args.models.split(",")]
+    metric_name = metrics[args.problem_type]
+    metric, _ = loss_fn_dict[metric_name]
+    models = dict()
+    for model_name in model_names:
+        assert model_name in model_zoo, f"{model_name} not found in the {args.problem_type} model zoo..."
+        model, fit_measurement = profiled(lambda: model_zoo[model_name]().fit(x_train, y_train.to_numpy().ravel()))
+        val_pred, predict_measurement = profiled(lambda: model.predict(x_val))
+        models[model_name] = {"fit": fit_measurement, "predict": predict_measurement,
+                              f"val_{metric_name}": float(metric(y_val.to_numpy().ravel(), val_pred))}
+        print(f"{model_name} : fit {fit_measurement['seconds']:.3f} s, predict {predict_measurement['seconds']:.3f} s")
+
+    return stages, models
+
+
+def compare(results, baseline, tolerance):
+    """
+    Args:
+        results: (dict) Results of this run
+        baseline: (dict) Results of an earlier run
+        tolerance: (float) Ratio over the baseline time a measurement is reported as a regression
+
+    Returns:
+        comparison: (pandas.DataFrame) Baseline time, current time and their ratio of every common measurement
+    """
+    rows = list()
+    for stage, measurement in results["stages"].items():
+        if stage in baseline.get("stages", {}):
+            rows.append((stage, baseline["stages"][stage]["seconds"], measurement["seconds"]))
+    for model_name, measurements in results["models"].items():
+        for step in ("fit", "predict"):
+            if model_name in baseline.get("models", {}):
+                rows.append((f"{model_name} {step}", baseline["models"][model_name][step]["seconds"],
+                             measurements[step]["seconds"]))
+    comparison = pd.DataFrame(rows, columns=["measurement", "baseline s", "current s"]).set_index("measurement")
+    comparison["ratio"] = comparison["current s"] / comparison["baseline s"]
+    comparison["regression"] = comparison["ratio"] > tolerance
+
+    return comparison
+
+
+def main():
+    args = parser.parse_args()
+    assert args.problem_type in metrics, f"Problem type must be one of {list(metrics)}..."
+    assert args.format in ("csv", "parquet"), "Format must be csv or parquet..."
+    with tempfile.TemporaryDirectory() as folder:
+        stages, models = run_benchmark(args, folder)
+    results = {"parameters": {key: value for key, value in vars(args).items()
+                              if key not in ("output", "baseline", "tolerance")},
+               "environment": environment(), "stages": stages, "models": models}
+    with open(args.output, "w") as outfile:
+        json.dump(results, outfile, indent=2)
+
+    print(f"\nStages on {args.rows} rows\n")
+    print(pd.DataFrame(stages).T.round(3).to_string())
+    print(f"\nModels\n")
+    print(pd.DataFrame({model_name: {"fit s": values["fit"]["seconds"], "predict s": values["predict"]["seconds"],
+                                     "fit peak traced mb": values["fit"]["peak_traced_mb"],
+                                     f"val {metrics[args.problem_type]}": values[f"val_{metrics[args.problem_type]}"]}
+                        for model_name, values in models.items()}).T.round(4).to_string())
+    print(f"\nResults written to {os.path.abspath(args.output)}")
+    if args.baseline is not None:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+        comparison = compare(results, baseline, args.tolerance)
+        print(f"\nComparison with {args.baseline}\n")
+        if baseline.get("parameters") != results["parameters"]:
+            cprint(f"The baseline was run with other parameters : {baseline.get('parameters')}\n", "yellow")
+        print(comparison.round(3).to_string())
+        if comparison["regression"].any():
+            sys.exit(f"\n{comparison['regression'].sum()} measurements are slower than "
+                     f"{args.tolerance} times the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 """
 This file holds all codes for custom and defined datasets.
 """
-import sqlite3
-
 import pandas as pd
 
+from tab_automl.utils.datasets import ColumnStatistics, optimize_dtypes, read_data, read_data_chunks
+
 
 class ClassificationDataset:
     """
@@ -14,22 +14,21 @@ class ClassificationDataset:
 
     """
 
-    def __init__(self, path):
-        # reading the dataset from source
-        if path.endswith(".txt"):
-            self.data = pd.read_table(path, delimiter='\s')
-        elif path.endswith(".json"):
-            self.data = pd.read_json(path)
-        elif path.endswith(".xlsx"):
-            self.data = pd.read_excel(path)
-        elif path.endswith(".sqlite"):
-            table_name = input("table name :")
-            db = sqlite3.connect(path)
-            self.data = pd.read_sql_query(f'Select * from {table_name}', db)
-        elif path.endswith(".csv"):
-            self.data = pd.read_csv(path)
-        else:
-            print(f"File type not supported")
+    def __init__(self, path, optimize_memory=False, columns=None, engine="pandas", table_name=None):
+        """
+        Args:
+          path: (str) File path
+          optimize_memory: (bool) whether the dtypes will be shrunk after loading
+          columns: (List) Columns to read from the source, all columns are read if None
+          engine: (str) Compute engine csv and parquet sources are parsed on, pandas or polars
+          table_name: (str) Table to read from a sqlite database, asked if not given
+
+        """
+        # reading the dataset from source, only the required columns
+        self.data = read_data(path, columns=columns, table_name=table_name, engine=engine)
+        if optimize_memory:
+            # downcasting numbers and turning low-cardinality text into category
+            self.data = optimize_dtypes(self.data)
         # storing the columns overview
         self.columns = pd.Series([str(self.data[feature].dtype) for feature in self.data.columns])
         self.labels = None
@@ -66,22 +65,21 @@ class RegressionDataset:
 
     """
 
-    def __init__(self, path):
-        # reading the dataset from source
-        if path.endswith(".txt"):
-            self.data = pd.read_table(path, delimiter='\s')
-        elif path.endswith(".json"):
-            self.data = pd.read_json(path)
-        elif path.endswith(".xlsx"):
-            self.data = pd.read_excel(path)
-        elif path.endswith(".sqlite"):
-            table_name = input("table name :")
-            db = sqlite3.connect(path)
-            self.data = pd.read_sql_query(f'Select * from {table_name}', db)
-        elif path.endswith(".csv"):
-            self.data = pd.read_csv(path)
-        else:
-            print(f"File type not supported")
+    def __init__(self, path, optimize_memory=False, columns=None, engine="pandas", table_name=None):
+        """
+        Args:
+          path: (str) File path
+          optimize_memory: (bool) whether the dtypes will be shrunk after loading
+          columns: (List) Columns to read from the source, all columns are read if None
+          engine: (str) Compute engine csv and parquet sources are parsed on, pandas or polars
+          table_name: (str) Table to read from a sqlite database, asked if not given
+
+        """
+        # reading the dataset from source, only the required columns
+        self.data = read_data(path, columns=columns, table_name=table_name, engine=engine)
+        if optimize_memory:
+            # downcasting numbers and turning low-cardinality text into category
+            self.data = optimize_dtypes(self.data)
 
         # storing the columns overview
         self.columns = pd.Series([str(self.data[feature].dtype) for feature in self.data.columns])
@@ -116,28 +114,124 @@ class ClusteringDataset:
 
     """
 
-    def __init__(self, path):
-        # reading the dataset from source
-        if path.endswith(".txt"):
-            self.data = pd.read_table(path, delimiter='\s')
-        elif path.endswith(".json"):
-            self.data = pd.read_json(path)
-        elif path.endswith(".xlsx"):
-            self.data = pd.read_excel(path)
-        elif path.endswith(".sqlite"):
-            table_name = input("table name :")
-            db = sqlite3.connect(path)
-            self.data = pd.read_sql_query(f'Select * from {table_name}', db)
-        elif path.endswith(".csv"):
-            self.data = pd.read_csv(path)
-        else:
-            print(f"File type not supported")
+    def __init__(self, path, optimize_memory=False, columns=None, engine="pandas", table_name=None):
+        """
+        Args:
+          path: (str) File path
+          optimize_memory: (bool) whether the dtypes will be shrunk after loading
+          columns: (List) Columns to read from the source, all columns are read if None
+          engine: (str) Compute engine csv and parquet sources are parsed on, pandas or polars
+          table_name: (str) Table to read from a sqlite database, asked if not given
+
+        """
+        # reading the dataset from source, only the required columns
+        self.data = read_data(path, columns=columns, table_name=table_name, engine=engine)
+        if optimize_memory:
+            # downcasting numbers and turning low-cardinality text into category
+            self.data = optimize_dtypes(self.data)
         # storing the columns overview
         self.columns = pd.Series([str(self.data[feature].dtype) for feature in self.data.columns])
         self.labels = None
         print(f"Populated the dataframe with data records...")
 
 
+class StreamingDataset:
+    """
+
+    Dataset Class for data sources larger than memory.
+    The source is read in fixed-size chunks, column statistics
+    and a random subsample of rows are collected in one pass,
+    so the peak memory is bounded by the chunk and sample size.
+    Currently supports single feature target only.
+
+    """
+
+    def __init__(self, path, chunk_size=100000, sample_size=100000, table_name=None, optimize_memory=False,
+                 columns=None):
+        """
+        Args:
+          path: (str) File path
+          chunk_size: (int) Number of rows read at once
+          sample_size: (int) Number of rows kept in memory as subsample
+          table_name: (str) Table to read from a sqlite database, asked if not given
+          optimize_memory: (bool) whether the dtypes of the subsample will be shrunk
+          columns: (List) Columns to read from the source, all columns are read if None
+
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        if path.endswith(".sqlite") and table_name is None:
+            table_name = input("table name :")
+        self.table_name = table_name
+        self.selected_columns = columns
+        # collecting the statistics and the subsample in one pass
+        self.statistics = ColumnStatistics(sample_size=sample_size)
+        for chunk in self.iter_chunks():
+            self.statistics.update(chunk)
+        # the subsample stands for the whole data in memory
+        self.data = self.statistics.sample.reset_index(drop=True)
+        if optimize_memory:
+            # downcasting numbers and turning low-cardinality text into category
+            self.data = optimize_dtypes(self.data)
+        # storing the columns overview
+        self.columns = pd.Series([str(self.data[feature].dtype) for feature in self.data.columns])
+        self.labels = None
+        print(f"Streamed {self.statistics.row_count} data records, kept {self.data.shape[0]} records as subsample...")
+
+    def iter_chunks(self, columns=None):
+        """
+        Function to read the data source again chunk by chunk
+
+        Args:
+          columns: (List) Columns to keep, the selected columns of the dataset are kept if None
+
+        Returns:
+          chunks: (Iterator[pandas.DataFrame]) Chunks of the data source
+        """
+
+        return read_data_chunks(self.path, self.chunk_size, columns=columns or self.selected_columns,
+                                table_name=self.table_name)
+
+    def prepare_x_and_y(self,
+                        feature_set_columns,
+                        target_column):
+        """
+        Function to segregate X and y from the subsample
+
+        Args:
+          feature_set_columns: (List) Columns that'll be present on X.
+          target_column: (Any) Column that'll be present on Y.
+
+        Returns:
+          x: (pandas.DataFrame) Feature set / Affecting features.
+          y: (pandas) Target set / dependent feature.
+        """
+
+        x = self.data[feature_set_columns]
+        y = self.data[[target_column]]
+        self.labels = pd.Series(y.all()).unique()
+        print(f"X feature set and target feature has been split...")
+
+        return x, y
+
+    def iter_x_and_y(self,
+                     feature_set_columns,
+                     target_column):
+        """
+        Function to segregate X and y from every chunk of the data source
+
+        Args:
+          feature_set_columns: (List) Columns that'll be present on X.
+          target_column: (Any) Column that'll be present on Y.
+
+        Returns:
+          chunks: (Iterator[tuple]) X and y of every chunk
+        """
+
+        for chunk in self.iter_chunks(columns=feature_set_columns + [target_column]):
+            yield chunk[feature_set_columns], chunk[[target_column]]
+
+
 class Iris:
     """
 
@@ -0,0 +1,160 @@
+"""
+This file holds all codes for ensembling the trained models of a model search without training them again.
+"""
+import numpy as np
+from joblib import Parallel, cpu_count, delayed
+
+from tab_automl.utils.losses import loss_fn_dict
+
+
+def vote_matrix(predictions, classes):
+    """
+    Args:
+        predictions: (numpy.ndarray) Predicted labels of a model
+        classes: (numpy.ndarray) Sorted labels of all members
+
+    Returns:
+        votes: (numpy.ndarray) One hot float matrix of the predicted labels, one column per class
+    """
+    votes = np.zeros((len(predictions), len(classes)))
+    votes[np.arange(len(predictions)), np.searchsorted(classes, predictions)] = 1.0
+
+    return votes
+
+
+def member_scores(model, x, problem_type, classes=None):
+    """
+    Args:
+        model: (Any) Trained model
+        x: (Any) Feature set / Affecting features
+        problem_type: (str) classification or regression
+        classes: (numpy.ndarray) Sorted labels of all members, required on classification
+
+    Returns:
+        scores: (numpy.ndarray) Class probabilities on the columns of the classes on classification,
+            predictions on regression
+    """
+    if problem_type != "classification":
+        return np.asarray(model.predict(x), dtype=float).ravel()
+    if hasattr(model, "predict_proba"):
+        probabilities = np.zeros((x.shape[0], len(classes)))
+        probabilities[:, np.searchsorted(classes, model.classes_)] = model.predict_proba(x)
+        return probabilities
+
+    # models without probabilities take part with a full vote on their predicted label
+    return vote_matrix(np.asarray(model.predict(x)).ravel(), classes)
+
+
+def combine_scores(total, weight, classes=None):
+    """
+    Args:
+        total: (numpy.ndarray) Weighted sum of the scores of the members
+        weight: (float) Sum of the weights of the members
+        classes: (numpy.ndarray) Sorted labels of all members, None on regression
+
+    Returns:
+        predictions: (numpy.ndarray) Class with the highest mean probability, or mean prediction on regression
+    """
+    if classes is not None:
+        return classes[np.argmax(total, axis=1)]
+
+    return total / weight
+
+
+def greedy_ensemble_selection(scores, y, metric_name, classes=None, n_rounds=50):
+    """
+    Caruana style forward selection with replacement. The ensemble starts
+    from the best single model and every round adds the model which scores
+    the ensemble best, a model picked several times gets a larger weight.
+    The weights of the best round are kept, so that the ensemble never
+    scores below the best single model on the given predictions.
+
+    Args:
+        scores: (dict) Validation scores of every candidate model, see member_scores
+        y: (numpy.ndarray) Target feature of the validation rows
+        metric_name: (str) Metric the ensemble is selected on
+        classes: (numpy.ndarray) Sorted labels of all members on classification, None on regression
+        n_rounds: (int) Number of selection rounds
+
+    Returns:
+        weights: (dict) Weight of every selected model, the weights add up to 1
+        score: (float) Validation score of the weighted ensemble
+    """
+    metric, metric_type = loss_fn_dict[metric_name]
+    sign = -1 if metric_type == "-" else 1
+    model_names = list(scores.keys())
+    total = 0.0
+    counts = dict()
+    best_weights, best_score = None, None
+    for selection_round in range(1, n_rounds + 1):
+        # scoring the ensemble with every candidate added once more, the first candidate wins the ties
+        round_scores = {model_name: metric(y, combine_scores(total + scores[model_name], selection_round, classes))
+                        for model_name in model_names}
+        selected = max(model_names, key=lambda model_name: sign * round_scores[model_name])
+        total = total + scores[selected]
+        counts[selected] = counts.get(selected, 0) + 1
+        if best_score is None or sign * round_scores[selected] > sign * best_score:
+            best_score = round_scores[selected]
+            best_weights = {model_name: count / selection_round for model_name, count in counts.items()}
+
+    return best_weights, best_score
+
+
+class EnsembleModel:
+    """
+
+    Weighted ensemble of trained models which predicts like a single model.
+    Classification members vote on their labels, regression members are
+    averaged. The members are predicted at the same time on a thread pool,
+    the model libraries release the GIL while predicting.
+
+    """
+
+    def __init__(self, members, weights, problem_type, classes=None, n_jobs=-1):
+        """
+        Args:
+            members: (dict) Trained model of every member
+            weights: (dict) Weight of every member, the weights add up to 1
+            problem_type: (str) classification or regression
+            classes: (numpy.ndarray) Sorted labels of all members, required on classification
+            n_jobs: (int) Number of threads predicting the members, -1 uses one thread per member up to the cores
+
+        """
+        self.members = members
+        self.weights = weights
+        self.problem_type = problem_type
+        self.classes = classes
+        self.n_jobs = n_jobs
+
+    def __repr__(self):
+        return f"EnsembleModel({', '.join(f'{name}: {weight:.3f}' for name, weight in self.weights.items())})"
+
+    def predict_members(self, x):
+        """
+        Args:
+            x: (Any) Feature set / Affecting features
+
+        Returns:
+            scores: (List[numpy.ndarray]) Scores of every member on the order of the members, see member_scores
+        """
+        n_workers = min(len(self.members), cpu_count() if self.n_jobs < 0 else self.n_jobs)
+        if n_workers == 1:
+            return [member_scores(model, x, self.problem_type, self.classes) for model in self.members.values()]
+
+        # threads share the feature matrix without copying it
+        return Parallel(n_jobs=n_workers, prefer="threads")(
+            delayed(member_scores)(model, x, self.problem_type, self.classes) for model in self.members.values())
+
+    def predict(self, x):
+        """
+        Args:
+            x: (Any) Feature set / Affecting features
+
+        Returns:
+            predictions: (numpy.ndarray) Class with the highest weighted mean probability, or weighted
+                mean prediction on regression
+        """
+        total = sum(self.weights[model_name] * scores
+                    for model_name, scores in zip(self.members, self.predict_members(x)))
+
+        return combine_scores(total, 1.0, self.classes)
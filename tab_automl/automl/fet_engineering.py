@@ -5,6 +5,12 @@ import numpy as np
 import os
 import pandas as pd
 
+from tab_automl.utils.datasets import save_formats, write_data
+from tab_automl.utils.engines import get_engine
+from tab_automl.utils.fet_engineering import EncodeTransform, LabelEncoding
+from tab_automl.utils.processing import is_categorical_feature, map_column_chunks
+from tab_automl.utils.telemetry import telemetry
+
 
 class Encode:
     """
@@ -14,62 +20,125 @@ class Encode:
 
     """
 
-    def __init__(self, x, y):
+    def __init__(self, x, y, sparse_one_hot=False, engine="pandas", n_jobs=1):
         """
         Args:
           x: (pandas.DataFrame) Feature set / Affecting features
           y: (pandas.Dataframe) Target set / dependent feature
+          sparse_one_hot: (bool) whether the one hot columns of all features are built at once as a sparse matrix
+          engine: (str) Compute engine the features are scanned on, pandas or polars
+          n_jobs: (int) Number of threads encoding chunks of features at the same time, -1 uses all cores
 
         """
         self.x = x
         self.y = y
         assert x.shape[0] == y.shape[0], "Data shape mismatched!"
         self.length = self.x.shape[0]
+        self.sparse_one_hot = sparse_one_hot
+        self.engine = get_engine(engine)
+        self.n_jobs = n_jobs
+        # fitted encodings which can be applied again on new data
+        self.transformer = EncodeTransform(self.x.columns, sparse_one_hot=sparse_one_hot)
+        self.label_encodings = self.transformer.label_encodings
+        self.target_encoding = None
 
     def encode_single_feature(self, feature, hot_encode_threshold=5, least_present_unique_item_ratio=0.1):
         """
+        Encodes a feature without changing the dataframe, so that many features can be encoded at the same time
+
         Args:
             feature: (string) name of the feature that has to be processed
             hot_encode_threshold: (int) Maximum number of unique items to decide the encoding technique
             least_present_unique_item_ratio: (float) Minimum ratio of least present unique number in feature
 
         Returns:
-            None
+            encoding: (tuple) "one_hot", the categories and the dummy columns, or the feature itself on
+                sparse one hot mode, else "label", the label encoding and the encoded feature
 
         """
 
-        unique_items = self.x[feature].unique()
-        least_present_unique_item_count = self.x[feature].value_counts().values[-1]
+        column = self.x[feature]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            # categories which are not present anymore are left out like on text features
+            column = column.cat.remove_unused_categories()
+        unique_items = self.engine.unique_items(column)
+        least_present_unique_item_count = self.engine.item_counts(column).values[-1]
         if len(unique_items) <= hot_encode_threshold or \
                 (least_present_unique_item_count / self.length) >= least_present_unique_item_ratio:
             # perform one hot encoding
-            encoded_feature = pd.get_dummies(self.x[feature])
-            # dropping the parent feature after encoding
-            self.x.drop(feature, 1, inplace=True)
-            # adding the encoded feature set to x
-            self.x = pd.concat([self.x, encoded_feature], axis=1)
-        else:
-            # perform label encoding
-            for index, item in enumerate(unique_items):
-                # replacing the unique items with integer values
-                self.x[feature].replace(item, index, inplace=True)
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                # sorting the categories to get the dummy columns on the same order as text features
+                column = column.cat.reorder_categories(sorted(column.cat.categories))
+            if self.sparse_one_hot:
+                # only the categories are kept, the one hot columns of all features are built at once later
+                return "one_hot", pd.Categorical(column).categories.tolist(), column
+            encoded_feature = pd.get_dummies(column)
+            return "one_hot", encoded_feature.columns.tolist(), encoded_feature
+        # perform label encoding, the unique items are coded on their order of appearance
+        label_encoding = LabelEncoding(pd.Index(unique_items))
+        # replacing all items with their integer codes at once
+        return "label", label_encoding, label_encoding.transform(column)
+
+    def encode_features(self, features):
+        """
+        Args:
+            features: (List) Chunk of categorical features
+
+        Returns:
+            encodings: (dict) Encoding of every feature
+        """
+        encodings = dict()
+        for feature in features:
+            with telemetry.span("encode_feature", rows=self.length, feature=feature) as span:
+                encodings[feature] = self.encode_single_feature(feature=feature)
+                span["technique"] = encodings[feature][0]
+
+        return encodings
 
     def run(self):
         """
         Returns:
-            x: (pandas.DataFrame) Feature set / Affecting features
+            x: (pandas.DataFrame or scipy.sparse.csr_matrix) Feature set / Affecting features
             y: (pandas.Dataframe) Target set / dependent feature
         """
 
-        # Iterating through features
-        for feature in self.x.columns:
-            if self.x[feature].dtype == "object":
-                # Encoding the feature items if the feature is categorical
-                self.encode_single_feature(feature=feature)
-        if self.y.dtypes[0] == "object":
-            unique_items = self.y.iloc[:,0].unique()
-            for index, item in enumerate(unique_items):
-                self.y.replace(item, index, inplace=True)
+        categorical_features = [feature for feature in self.x.columns if is_categorical_feature(self.x[feature])]
+        # Encoding the categorical features on chunks of features at the same time
+        encodings = map_column_chunks(self.encode_features, categorical_features, self.n_jobs)
+        if encodings:
+            columns = dict()
+            dummy_frames = list()
+            for feature in self.x.columns:
+                if feature not in encodings:
+                    columns[feature] = self.x[feature]
+                    continue
+                technique, encoding, encoded_feature = encodings[feature]
+                if technique == "label":
+                    self.label_encodings[feature] = encoding
+                    columns[feature] = encoded_feature
+                    continue
+                self.transformer.one_hot_categories[feature] = encoding
+                if self.sparse_one_hot:
+                    # the feature is kept for building the one hot columns later
+                    columns[feature] = encoded_feature
+                else:
+                    # the dummy columns are added after the other features on the order of encoding
+                    dummy_frames.append(encoded_feature)
+            # Building the encoded feature set with a single concatenation
+            self.x = pd.concat([pd.DataFrame(columns, index=self.x.index)] + dummy_frames, axis=1)
+        if is_categorical_feature(self.y.iloc[:, 0]):
+            target = self.y.columns[0]
+            self.target_encoding = LabelEncoding.fit(self.y[target])
+            # replacing all target items with their integer codes at once
+            self.y[target] = self.target_encoding.transform(self.y[target])
+        self.transformer.target_encoding = self.target_encoding
+        if self.sparse_one_hot:
+            self.transformer.output_columns = self.transformer.sparse_output_columns(self.x)
+            # Building a single sparse matrix of all features
+            self.x = self.transformer.to_sparse(self.x)
+            print(f"Sparse feature matrix built : {self.x.shape}, {self.x.nnz} stored items")
+        else:
+            self.transformer.output_columns = self.x.columns.tolist()
 
         return self.x, self.y
 
@@ -85,16 +154,23 @@ class FeatureEngineering:
 
     """
 
-    def __init__(self, x, y):
+    def __init__(self, x, y, sparse_one_hot=False, engine="pandas", n_jobs=1):
         """
         Args:
           x: (pandas.DataFrame) Feature set / Affecting features
           y: (pandas.Dataframe) Target set / dependent feature
+          sparse_one_hot: (bool) whether the encoded features are built as a sparse matrix
+          engine: (str) Compute engine the features are scanned on, pandas or polars
+          n_jobs: (int) Number of threads encoding chunks of features at the same time, -1 uses all cores
 
         """
         self.x = x
         self.y = y
         assert x.shape[0] == y.shape[0], "Data shape mismatched!"
+        self.sparse_one_hot = sparse_one_hot
+        self.engine = engine
+        self.n_jobs = n_jobs
+        self.transformer = None
 
     def save_data(self, save_format="csv"):
         """
@@ -102,40 +178,68 @@ class FeatureEngineering:
         a file on respective format
 
         Args:
-            save_format: (Any) the required format on which the files will be saved.
+            save_format: (Any) the required format on which the files will be saved, csv, parquet or feather.
 
         Returns:
             processed_dataframe: (pandas.DataFrame) Processed feature set / Affecting features
         """
 
+        x = self.x
+        if self.sparse_one_hot:
+            # Keeping the sparse matrix sparse inside the dataframe
+            x = pd.DataFrame.sparse.from_spmatrix(x, index=self.y.index, columns=self.transformer.output_columns)
         # Joining the x and y feature set to prepare full dataframe
-        processed_dataframe = pd.concat([self.x, self.y], axis=1)
-        if save_format == "csv":
-            # Writing to csv
-            processed_dataframe.to_csv("feature_engineered_dataframe.csv", index=False)
-            # Validating output path
-            output_path = os.path.join(os.getcwd(), "feature_engineered_dataframe.csv")
-            assert os.path.isfile(output_path), "Processed data saved on different location!"
-            print(f"Feature engineered data saved at {output_path}")
-        else:
-            # Will be updated soon
-            pass
+        processed_dataframe = pd.concat([x, self.y], axis=1)
+        assert save_format in save_formats, f"Save format not supported, choose one of {save_formats}..."
+        # Writing on the required format
+        output_path = write_data(processed_dataframe, "feature_engineered_dataframe", save_format=save_format)
+        # Validating output path
+        assert os.path.isfile(output_path), "Processed data saved on different location!"
+        print(f"Feature engineered data saved at {output_path}")
 
     def run(self):
         """
 
         Returns:
-            x: (pandas.DataFrame) Processed feature set / Affecting features
+            x: (pandas.DataFrame or scipy.sparse.csr_matrix) Processed feature set / Affecting features
             y: (pandas.DataFrame) Processed target feature
 
         """
         print(f"Initiating Feature Engineering...")
         # Using Encoder
         print(f"Encoding features...")
-        encoder = Encode(self.x, self.y)
-        self.x, self.y = encoder.run()
+        encoder = Encode(self.x, self.y, sparse_one_hot=self.sparse_one_hot, engine=self.engine, n_jobs=self.n_jobs)
+        with telemetry.span("feature_engineering", rows=self.x.shape[0], columns=self.x.shape[1]):
+            self.x, self.y = encoder.run()
+        # Keeping the fitted encodings to apply them again on new data
+        self.transformer = encoder.transformer
         print(f"Encoding finished...")
 
         print(f"Finishing Feature Engineering...")
 
         return self.x, self.y
+
+    def fit(self):
+        """
+        Fits the feature engineering on the data of the class
+
+        Returns:
+            transformer: (EncodeTransform) Fitted feature engineering
+        """
+        self.run()
+
+        return self.transformer
+
+    def transform(self, x):
+        """
+        Applies the fitted feature engineering on new data
+
+        Args:
+            x: (pandas.DataFrame) Feature set / Affecting features
+
+        Returns:
+            x: (pandas.DataFrame or scipy.sparse.csr_matrix) Engineered feature set
+        """
+        assert self.transformer is not None, "Feature engineering is not fitted yet..."
+
+        return self.transformer.transform(x)
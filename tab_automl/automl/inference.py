@@ -0,0 +1,141 @@
+"""
+This file holds all codes for predicting new data with the saved best model.
+"""
+import os
+import pickle
+
+import pandas as pd
+
+from tab_automl.utils.datasets import read_data_chunks
+from tab_automl.utils.training import to_training_matrix
+
+
+class InferencePipeline:
+    """
+
+    Fitted preprocessing and feature engineering transforms saved
+    together with the best model, new data goes through every
+    transform and the model in one vectorized pass per batch.
+
+    """
+
+    def __init__(self, transforms, model, input_columns, target_column=None, target_encoding=None):
+        """
+        Args:
+            transforms: (List[Any]) Fitted transforms on the order they are applied e.g. NullTransform, EncodeTransform
+            model: (Any) Trained best model
+            input_columns: (List) Feature columns the pipeline was fitted on
+            target_column: (Any) Name of the target feature, used to name the predictions
+            target_encoding: (LabelEncoding) Label encoding of the target, predictions are decoded with it
+
+        """
+        self.transforms = transforms
+        self.model = model
+        self.input_columns = list(input_columns)
+        self.target_column = target_column
+        self.target_encoding = target_encoding
+
+    def transform(self, x):
+        """
+        Args:
+            x: (pandas.DataFrame) Raw feature set
+
+        Returns:
+            x: (Any) Feature set as received by the model, a float matrix for numerical features
+        """
+        x = x[self.input_columns]
+        for transform in self.transforms:
+            x = transform.transform(x)
+
+        # the model was trained on a float matrix of the same values
+        return to_training_matrix(x)
+
+    def update(self, x):
+        """
+        Updates the fitted statistics of the transforms with new rows, every transform
+        is updated on the output of the transforms before it
+
+        Args:
+            x: (pandas.DataFrame) New rows of the raw feature set
+
+        Returns:
+            x: (Any) New rows as received by the model, on the updated transforms
+        """
+        x = x[self.input_columns]
+        for transform in self.transforms:
+            transform.update(x)
+            x = transform.transform(x)
+
+        return to_training_matrix(x)
+
+    def predict(self, x):
+        """
+        Args:
+            x: (pandas.DataFrame) Raw feature set, extra columns are ignored
+
+        Returns:
+            predictions: (numpy.ndarray) Predictions of the model, decoded to the target items if encoded
+        """
+        predictions = self.model.predict(self.transform(x))
+        if self.target_encoding is not None:
+            predictions = self.target_encoding.inverse_transform(predictions)
+
+        return predictions
+
+    def predict_file(self, path, output_path="predictions.csv", chunk_size=100000, table_name=None):
+        """
+        Predicts a data source of any size chunk by chunk and writes
+        the predictions of every chunk as soon as they are ready
+
+        Args:
+            path: (str) File path of the new data
+            output_path: (str) CSV file the predictions are written into
+            chunk_size: (int) Number of rows predicted at once
+            table_name: (str) Table to read from a sqlite database
+
+        Returns:
+            row_count: (int) Number of predicted rows
+        """
+        prediction_column = f"predicted_{self.target_column}" if self.target_column is not None else "prediction"
+        row_count = 0
+        for chunk in read_data_chunks(path, chunk_size, columns=self.input_columns, table_name=table_name):
+            predictions = pd.DataFrame({prediction_column: self.predict(chunk)})
+            # Writing the header with the first chunk only
+            predictions.to_csv(output_path, mode="w" if row_count == 0 else "a", header=row_count == 0, index=False)
+            row_count += chunk.shape[0]
+            print(f"Predicted {row_count} records...")
+
+        return row_count
+
+    def save(self, path="inference_pipeline.pkl"):
+        """
+        Writes the pipeline into a pickle file
+
+        Args:
+            path: (str) File path of the pipeline
+
+        Returns:
+            output_path: (str) Absolute path of the saved pipeline
+        """
+        with open(path, "wb") as outfile:
+            pickle.dump(self, outfile)
+        output_path = os.path.abspath(path)
+        # Validating output path
+        assert os.path.isfile(output_path), "Pipeline saved on different location!"
+        print(f"Inference pipeline saved at {output_path}")
+
+        return output_path
+
+    @staticmethod
+    def load(path="inference_pipeline.pkl"):
+        """
+        Args:
+            path: (str) File path of the pipeline
+
+        Returns:
+            pipeline: (InferencePipeline) Saved pipeline
+        """
+        with open(path, "rb") as infile:
+            pipeline = pickle.load(infile)
+
+        return pipeline
@@ -1,60 +1,198 @@
 """
 This files holds all codes for defined and used models through the life cycle of the package.
 """
-from lightgbm import LGBMClassifier, LGBMRegressor
-from xgboost import XGBClassifier
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.linear_model import Lasso, LinearRegression, Ridge
-from sklearn.svm import SVR 
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.neighbors import KNeighborsRegressor
-from sklearn.cluster import AffinityPropagation
-from sklearn.cluster import AgglomerativeClustering
-from sklearn.cluster import Birch
-from sklearn.cluster import DBSCAN
-from sklearn.cluster import KMeans
-from sklearn.cluster import MiniBatchKMeans
-from sklearn.cluster import MeanShift
-from sklearn.cluster import OPTICS
-from sklearn.cluster import SpectralClustering
-from sklearn.mixture import GaussianMixture
-from sklearn.tree import DecisionTreeRegressor
-from sklearn.naive_bayes import GaussianNB
-from sklearn.svm import LinearSVC
-from sklearn.svm import SVC
+import importlib
+
+
+class LazyModel:
+    """
+
+    Reference to a model class which is imported only when the model
+    is instantiated, so that importing the model zoo does not import
+    LightGBM, XGBoost or scikit-learn
+
+    """
+
+    def __init__(self, module, name):
+        """
+        Args:
+            module: (str) Import path of the module holding the model class
+            name: (str) Name of the model class inside the module
+
+        """
+        self.module = module
+        self.name = name
+
+    def __repr__(self):
+        return f"{self.module}.{self.name}"
+
+    def __reduce__(self):
+        # only the import path is pickled, worker processes import the class on their own
+        return LazyModel, (self.module, self.name)
+
+    def load(self):
+        """
+        Returns:
+            model_class: (Any) The model class, imported on the first call
+        """
+        return getattr(importlib.import_module(self.module), self.name)
+
+    def __call__(self, **params):
+        return self.load()(**params)
+
 
 single_model_dict = {
     "regression": {
-        "Linear Regression": LinearRegression,
-        "Lasso Regression": Lasso,
-        "Ridge Regression": Ridge,
-        "Random Forest Regression": RandomForestRegressor,
-        "Support Vector Regression": SVR,
-        "KNN Regressor": KNeighborsRegressor,
-        "Decision Tree Regressor": DecisionTreeRegressor,
-        "Light Gradient Boosting Regressor": LGBMRegressor,
+        "Linear Regression": LazyModel("sklearn.linear_model", "LinearRegression"),
+        "Lasso Regression": LazyModel("sklearn.linear_model", "Lasso"),
+        "Ridge Regression": LazyModel("sklearn.linear_model", "Ridge"),
+        "Random Forest Regression": LazyModel("sklearn.ensemble", "RandomForestRegressor"),
+        "Support Vector Regression": LazyModel("sklearn.svm", "SVR"),
+        "KNN Regressor": LazyModel("sklearn.neighbors", "KNeighborsRegressor"),
+        "Decision Tree Regressor": LazyModel("sklearn.tree", "DecisionTreeRegressor"),
+        "Light Gradient Boosting Regressor": LazyModel("lightgbm", "LGBMRegressor"),
     },
     "classification": {
-        "Decision Tree Classifier": DecisionTreeClassifier,
-        "Light Gradient Boosting Classifier": LGBMClassifier,
-        "Random Forest Classifier": RandomForestClassifier,
-        "XGBoost Classifier": XGBClassifier,
-        "KNN Classifier": KNeighborsClassifier,
-        "Gaussian Naive Bayes": GaussianNB,
-        "Linear Support Vector Classifier": LinearSVC,
-        "Support Vector Classifier": SVC,
+        "Decision Tree Classifier": LazyModel("sklearn.tree", "DecisionTreeClassifier"),
+        "Light Gradient Boosting Classifier": LazyModel("lightgbm", "LGBMClassifier"),
+        "Random Forest Classifier": LazyModel("sklearn.ensemble", "RandomForestClassifier"),
+        "XGBoost Classifier": LazyModel("xgboost", "XGBClassifier"),
+        "KNN Classifier": LazyModel("sklearn.neighbors", "KNeighborsClassifier"),
+        "Gaussian Naive Bayes": LazyModel("sklearn.naive_bayes", "GaussianNB"),
+        "Linear Support Vector Classifier": LazyModel("sklearn.svm", "LinearSVC"),
+        "Support Vector Classifier": LazyModel("sklearn.svm", "SVC"),
     },
     "clustering": {
-        "Affinity Propagation": AffinityPropagation,
-        "Agglomerative Clustering": AgglomerativeClustering,
-        "Birch": Birch,
-        "DBSCAN": DBSCAN,
-        "KMeans": KMeans,
-        "MiniBatchKMeans": MiniBatchKMeans,
-        "MeanShift": MeanShift,
-        "OPTICS": OPTICS,
-        "SpectralClustering": SpectralClustering,
-        "GaussianMixture": GaussianMixture
+        "Affinity Propagation": LazyModel("sklearn.cluster", "AffinityPropagation"),
+        "Agglomerative Clustering": LazyModel("sklearn.cluster", "AgglomerativeClustering"),
+        "Birch": LazyModel("sklearn.cluster", "Birch"),
+        "DBSCAN": LazyModel("sklearn.cluster", "DBSCAN"),
+        "KMeans": LazyModel("sklearn.cluster", "KMeans"),
+        "MiniBatchKMeans": LazyModel("sklearn.cluster", "MiniBatchKMeans"),
+        "MeanShift": LazyModel("sklearn.cluster", "MeanShift"),
+        "OPTICS": LazyModel("sklearn.cluster", "OPTICS"),
+        "SpectralClustering": LazyModel("sklearn.cluster", "SpectralClustering"),
+        "GaussianMixture": LazyModel("sklearn.mixture", "GaussianMixture")
     }
 }
+
+# Models of the out-of-core training, LightGBM and XGBoost are trained on chunked datasets
+# and the other models take row blocks with partial_fit
+out_of_core_model_dict = {
+    "regression": {
+        "SGD Regressor": LazyModel("sklearn.linear_model", "SGDRegressor"),
+        "Light Gradient Boosting Regressor": LazyModel("lightgbm", "LGBMRegressor"),
+        "XGBoost Regressor": LazyModel("xgboost", "XGBRegressor"),
+    },
+    "classification": {
+        "SGD Classifier": LazyModel("sklearn.linear_model", "SGDClassifier"),
+        "Gaussian Naive Bayes": LazyModel("sklearn.naive_bayes", "GaussianNB"),
+        "Light Gradient Boosting Classifier": LazyModel("lightgbm", "LGBMClassifier"),
+        "XGBoost Classifier": LazyModel("xgboost", "XGBClassifier"),
+    },
+}
+
+# Approximate growth of the training and scoring time with the number of rows (time ~ rows ** exponent),
+# models which are not listed here are expected to grow linearly
+model_time_complexity = {
+    "Support Vector Regression": 2,
+    "KNN Regressor": 2,
+    "Support Vector Classifier": 2,
+    "KNN Classifier": 2,
+}
+
+# Models which can not be trained on sparse matrices, they get a dense copy only when the data is sparse
+dense_input_models = [
+    "Gaussian Naive Bayes",
+]
+
+# Supported samplers of the hyperparameter search
+samplers = ["tpe", "random"]
+
+# Search space of every model for the hyperparameter search, a parameter is
+# ("int", low, high), ("float", low, high) or ("choice", [items]), "log" as 4th item samples on log scale.
+# Models without a search space are only trained once with their default arguments
+search_spaces = {
+    "Lasso Regression": {
+        "alpha": ("float", 1e-4, 10.0, "log"),
+    },
+    "Ridge Regression": {
+        "alpha": ("float", 1e-3, 100.0, "log"),
+    },
+    "Random Forest Regression": {
+        "n_estimators": ("int", 50, 300),
+        "max_depth": ("int", 2, 32, "log"),
+        "min_samples_leaf": ("int", 1, 20, "log"),
+        "max_features": ("choice", [1.0, "sqrt", 0.5]),
+    },
+    "Support Vector Regression": {
+        "C": ("float", 1e-2, 100.0, "log"),
+        "epsilon": ("float", 1e-3, 1.0, "log"),
+        "gamma": ("choice", ["scale", "auto"]),
+    },
+    "KNN Regressor": {
+        "n_neighbors": ("int", 1, 50, "log"),
+        "weights": ("choice", ["uniform", "distance"]),
+    },
+    "Decision Tree Regressor": {
+        "max_depth": ("int", 2, 32, "log"),
+        "min_samples_leaf": ("int", 1, 50, "log"),
+    },
+    "Light Gradient Boosting Regressor": {
+        "n_estimators": ("int", 50, 1000, "log"),
+        "learning_rate": ("float", 0.01, 0.3, "log"),
+        "num_leaves": ("int", 8, 256, "log"),
+        "min_child_samples": ("int", 5, 100, "log"),
+        "colsample_bytree": ("float", 0.5, 1.0),
+        "reg_lambda": ("float", 1e-3, 10.0, "log"),
+    },
+    "Decision Tree Classifier": {
+        "max_depth": ("int", 2, 32, "log"),
+        "min_samples_leaf": ("int", 1, 50, "log"),
+        "criterion": ("choice", ["gini", "entropy"]),
+    },
+    "Light Gradient Boosting Classifier": {
+        "n_estimators": ("int", 50, 1000, "log"),
+        "learning_rate": ("float", 0.01, 0.3, "log"),
+        "num_leaves": ("int", 8, 256, "log"),
+        "min_child_samples": ("int", 5, 100, "log"),
+        "colsample_bytree": ("float", 0.5, 1.0),
+        "reg_lambda": ("float", 1e-3, 10.0, "log"),
+    },
+    "Random Forest Classifier": {
+        "n_estimators": ("int", 50, 300),
+        "max_depth": ("int", 2, 32, "log"),
+        "min_samples_leaf": ("int", 1, 20, "log"),
+        "max_features": ("choice", ["sqrt", 0.5, 1.0]),
+    },
+    "XGBoost Classifier": {
+        "n_estimators": ("int", 50, 1000, "log"),
+        "learning_rate": ("float", 0.01, 0.3, "log"),
+        "max_depth": ("int", 2, 10),
+        "subsample": ("float", 0.5, 1.0),
+        "colsample_bytree": ("float", 0.5, 1.0),
+        "reg_lambda": ("float", 1e-3, 10.0, "log"),
+    },
+    "KNN Classifier": {
+        "n_neighbors": ("int", 1, 50, "log"),
+        "weights": ("choice", ["uniform", "distance"]),
+    },
+    "Gaussian Naive Bayes": {
+        "var_smoothing": ("float", 1e-12, 1e-6, "log"),
+    },
+    "Linear Support Vector Classifier": {
+        "C": ("float", 1e-3, 100.0, "log"),
+    },
+    "Support Vector Classifier": {
+        "C": ("float", 1e-2, 100.0, "log"),
+        "gamma": ("choice", ["scale", "auto"]),
+    },
+}
+
+# Boosting models which are trained round after round while searching, their intermediate scores are taken
+# on growing numbers of boosting rounds, the other models are scored on growing row subsamples
+boosting_models = [
+    "Light Gradient Boosting Regressor",
+    "Light Gradient Boosting Classifier",
+    "XGBoost Classifier",
+]
@@ -5,6 +5,12 @@ import numpy as np
 import os
 import pandas as pd
 
+from tab_automl.utils.datasets import save_formats, write_data
+from tab_automl.utils.engines import get_engine
+from tab_automl.utils.processing import ColumnProfile, FillStatistic, NullTransform, is_categorical_feature, \
+    map_column_chunks
+from tab_automl.utils.telemetry import telemetry
+
 
 class NullProcessing:
 
@@ -15,11 +21,13 @@ class NullProcessing:
 
     """
 
-    def __init__(self, x, y):
+    def __init__(self, x, y, engine="pandas", n_jobs=1):
         """
         Args:
           x: (pandas.DataFrame) Feature set / Affecting features
           y: (pandas.Dataframe) Target set / dependent feature
+          engine: (str) Compute engine the columns are scanned on, pandas or polars
+          n_jobs: (int) Number of threads fitting and filling chunks of columns at the same time, -1 uses all cores
 
         """
 
@@ -27,52 +35,44 @@ class NullProcessing:
         self.y = y
         assert x.shape[0] == y.shape[0], "Data shape mismatched!"
         self.length = self.x.shape[0]
-
-    def numerical_feature_processing(self, feature, feature_drop_threshold=0.8, continuous_threshold=50):
+        self.engine = get_engine(engine)
+        self.n_jobs = n_jobs
+        # fitted null processing which can be applied again on new data
+        self.transformer = NullTransform(self.x.columns)
+        # column statistics all null processing decisions are read from
+        self.profile = None
+        # rows every filled feature was decided on, its fill value is fitted on the same rows
+        self.fill_rows = dict()
+
+    def numerical_feature_processing(self, feature, feature_drop_threshold=0.8):
         """
-        Processes features with null values of integer / float / double data-types
+        Processes features with null values of integer / float / double data-types,
+        the fill value of a kept feature is fitted afterwards by fit_fill_values
 
         Args:
           feature: (string) name of the feature that has to be processed
           feature_drop_threshold: (float) Minimum ratio of null and regular items to drop the feature
-          continuous_threshold: (int) Minimum count of unique feature to be declared as continuous feature
 
         Returns:
-            None
+            decision: (str) drop_feature or fill
 
         """
 
-        null_ratio = self.x[feature].isna().sum() / self.length
+        null_ratio = self.profile.null_counts[feature] / self.length
         # Checking if null value ratio is higher than expected
         if null_ratio >= feature_drop_threshold:
-            # Dropping the whole feature
-            self.x.drop(feature, 1, inplace=True)
-        else:
-            unique_count = self.x[feature].nunique()
-            # Checking if the feature is continuous or not
-            if unique_count >= continuous_threshold:
-                # calculating the median of the series
-                median_value = np.nanmedian(self.x[feature])
-                # filling the missing values with the median of the continuous series
-                self.x[feature].fillna(median_value, inplace=True)
-            elif unique_count >= continuous_threshold // 3:
-                # calculating the mean of the series
-                mean_value = np.nanmean(self.x[feature])
-                # filling the missing values with the mean value of the series
-                self.x[feature].fillna(mean_value, inplace=True)
-            else:
-                # calculating the mode
-                mode_value = self.x[feature].dropna().value_counts().index[0]
-                # Checking if the most abundant feature is null
-                if mode_value == np.nan:
-                    # Updating the mode value with most abundant regular item
-                    mode_value = self.x[feature].dropna().value_counts().index[1]
-                # filling the missing values with the mode of the integer series
-                self.x[feature].fillna(mode_value, inplace=True)
+            # Dropping the whole feature, along with the other drops
+            self.transformer.dropped_features.append(feature)
+            return "drop_feature"
+        # the missing values will be filled with a statistic of the currently kept rows
+        self.fill_rows[feature] = self.profile.kept_rows()
+
+        return "fill"
 
     def categorical_feature_processing(self, feature, feature_drop_threshold=0.6, row_drop_threshold=0.3):
         """
-        Processes features with null values of categorical type
+        Processes features with null values of categorical type,
+        the fill value of a kept feature is fitted afterwards by fit_fill_values
 
         Args:
           feature: (string) name of the feature that has to be processed
@@ -80,65 +80,172 @@ class NullProcessing:
           row_drop_threshold: (float) Minimum ratio of null and regular items to drop the rows with null feature
 
         Returns:
-            None
+            decision: (str) drop_feature, drop_rows or fill
 
         """
 
-        null_ratio = self.x[feature].isna().sum() / self.length
+        null_ratio = self.profile.null_counts[feature] / self.length
         if null_ratio >= feature_drop_threshold:
-            self.x.drop(feature, 1, inplace=True)
+            # Dropping the whole feature, along with the other drops
+            self.transformer.dropped_features.append(feature)
+            return "drop_feature"
         elif null_ratio >= row_drop_threshold:
-            # stored the feature names of x and y so that they can be retrieved again.
-            x_features = self.x.columns
-            y_feature = self.y.columns
-
-            # Joined and prepare the whole dataframe
-            joined_dataframe = pd.concat([self.x, self.y], axis=1)
-            # Dropped all extra null values
-            joined_dataframe.dropna(subset=[feature], inplace=True)
-            # Retrieved X and y again
-            self.x = joined_dataframe[x_features]
-            self.y = joined_dataframe[y_feature]
-        else:
-            # calculating the mode
-            abundant_item = self.x[feature].value_counts().index[0]
-            # Checking if the most abundant feature is null
-            if abundant_item == np.nan:
-                # Updating the mode value with most abundant regular item
-                abundant_item = self.x[feature].value_counts().index[1]
-            # filling the missing values with the mode of the integer series
-            self.x[feature].fillna(abundant_item, inplace=True)
+            # new rows can not be dropped, they will be filled with the most abundant item
+            self.fill_rows[feature] = self.profile.kept_rows()
+            # leaving the null rows out of the profile for the decisions of the next features, they are dropped later
+            self.profile.drop_rows(self.x[feature].isna().to_numpy())
+            return "drop_rows"
+        # the missing values will be filled with the most abundant item of the currently kept rows
+        self.fill_rows[feature] = self.profile.kept_rows()
+
+        return "fill"
+
+    def fit_fill_value(self, feature, continuous_threshold=50):
+        """
+        Args:
+          feature: (string) name of the feature that has to be filled
+          continuous_threshold: (int) Minimum count of unique feature to be declared as continuous feature
+
+        Returns:
+            fill_value: (Any) Item the null values of the feature are filled with
+
+        """
+
+        rows = self.fill_rows[feature]
+        unique_count = None if is_categorical_feature(self.x[feature]) else self.profile.unique_count(feature, rows)
+        # Checking if the feature is continuous or not
+        if unique_count is not None and unique_count >= continuous_threshold // 3:
+            values = self.profile.column(feature, rows).dropna()
+            # keeping a running statistic of the fill value to update it with new rows
+            statistic = FillStatistic("median" if unique_count >= continuous_threshold else "mean")
+            statistic.update(values)
+            self.transformer.fill_statistics[feature] = statistic
+            if statistic.kind == "median":
+                # calculating the median of the series, on double precision whatever the column width is
+                return np.median(values.to_numpy(dtype=np.float64))
+            # calculating the mean of the series, on double precision whatever the column width is
+            return np.mean(values.to_numpy(dtype=np.float64))
+        # reading the mode of categorical and integer features, null values are not counted on the profile
+        self.transformer.fill_statistics[feature] = FillStatistic("mode")
+        self.transformer.fill_statistics[feature].add_counts(self.profile.item_counts(feature, rows))
+        return self.profile.mode(feature, rows)
+
+    def fit_fill_values(self, features):
+        """
+        Args:
+          features: (List) Chunk of features that have to be filled
+
+        Returns:
+            fill_values: (dict) Fill value of every feature
+        """
+        fill_values = dict()
+        for feature in features:
+            with telemetry.span("fill_value", feature=feature):
+                fill_values[feature] = self.fit_fill_value(feature)
+
+        return fill_values
+
+    def apply_drops(self):
+        """
+        Drops the collected features and rows with a single boolean mask, without
+        joining x and y, and fills the null values of the kept features on the way
+
+        Returns:
+            None
+
+        """
+
+        # rows with null target can not be used for training
+        self.profile.drop_rows(self.y.isna().any(axis=1).to_numpy())
+        kept_features = self.x.columns.drop(self.transformer.dropped_features)
+        kept_rows = self.profile.rows
+        x = self.x
+        if not kept_rows.all():
+            print(f"Dropping {(~kept_rows).sum()} rows with null values...")
+            # taking the kept rows of every dtype block at once
+            row_positions = np.flatnonzero(kept_rows)
+            x = x.take(row_positions)
+            self.y = self.y.take(row_positions)
+        fill_values = {feature: value for feature, value in self.transformer.fill_values.items() if value is not None}
+
+        def fill_columns(features):
+            # Filling the features of a chunk, the other features are kept as they are
+            return {feature: x[feature].fillna(fill_values[feature]) if feature in fill_values else x[feature]
+                    for feature in features}
+
+        # Building the kept features column by column, filled features are filled on the way
+        # the index is given so that x keeps its rows even when every feature is dropped
+        self.x = pd.DataFrame(map_column_chunks(fill_columns, kept_features, self.n_jobs), index=x.index,
+                              columns=kept_features)
 
     def run(self):
-        # Iterating through features
+        # Profiling all columns in a single pass
+        self.profile = ColumnProfile(self.x, engine=self.engine)
+        # Iterating through features, only the decisions are taken here
         for feature in self.x.columns:
-            # Checking if the column has any null value
-            if self.x[feature].isnull().sum() > 0:
-                print(f"{feature} has null values, total count : {self.x[feature].isnull().sum()} .")
-                # Checking whether the feature is categorical
-                if self.x[feature].dtype == "object":
-                    self.categorical_feature_processing(feature=feature)
-                else:
-                    # Processing on the other data type features
-                    self.numerical_feature_processing(feature=feature)
+            # Checking if the column has any null value on the kept rows
+            if self.profile.null_counts[feature] > 0:
+                print(f"{feature} has null values, total count : {self.profile.null_counts[feature]} .")
+                with telemetry.span("null_decision", feature=feature,
+                                    null_count=int(self.profile.null_counts[feature])) as span:
+                    # Checking whether the feature is categorical
+                    if is_categorical_feature(self.x[feature]):
+                        span["decision"] = self.categorical_feature_processing(feature=feature)
+                    else:
+                        # Processing on the other data type features
+                        span["decision"] = self.numerical_feature_processing(feature=feature)
                 print(f"Null values at {feature} processed...")
 
-        # Checking if there's any null value on target feature
-        if self.y.all().isnull().sum() > 0:
-            # stored the feature names of x and y so that they can be retrieved again.
-            x_features = self.x.columns
-            y_feature = self.y.columns
-
-            # Joined and prepare the whole dataframe
-            joined_dataframe = pd.concat([self.x, self.y], axis=1)
-            # Dropped all extra null values
-            joined_dataframe.dropna(inplace=True)
-            # Retrieved X and y again
-            self.x = joined_dataframe[x_features]
-            self.y = joined_dataframe[y_feature]
+        # Fitting the fill values of all features at once on chunks of columns
+        self.transformer.fill_values.update(map_column_chunks(self.fit_fill_values, self.fill_rows, self.n_jobs))
+        self.apply_drops()
+        # the remaining data is profiled again for the default fill values
+        self.profile.refresh(self.x)
+        self.fit_default_fill_values()
+        # the counted columns are kept for reporting without holding the data
+        self.profile.release()
 
         return self.x, self.y
 
+    def fit_default_fill_values(self):
+        """
+        Stores fill values for the kept features which had no null value,
+        medians for the numerical features and the most abundant item
+        for the categorical features, so that null values of new data
+        can be filled as well
+
+        Returns:
+            None
+
+        """
+
+        features = [feature for feature in self.x.columns if feature not in self.transformer.fill_values]
+        numerical_features = [feature for feature in features if not is_categorical_feature(self.x[feature])]
+        # calculating the medians of all numerical features at once
+        self.transformer.fill_values.update(self.x[numerical_features].median().to_dict())
+        for feature in numerical_features:
+            self.transformer.fill_statistics[feature] = FillStatistic("median")
+            self.transformer.fill_statistics[feature].update(self.x[feature].dropna())
+        categorical_features = [feature for feature in features
+                                if feature not in numerical_features and self.x[feature].notna().any()]
+        self.transformer.fill_values.update(map_column_chunks(self.fit_modes, categorical_features, self.n_jobs))
+
+    def fit_modes(self, features):
+        """
+        Args:
+          features: (List) Chunk of features
+
+        Returns:
+            modes: (dict) Most abundant item of every feature
+        """
+        modes = dict()
+        for feature in features:
+            self.transformer.fill_statistics[feature] = FillStatistic("mode")
+            self.transformer.fill_statistics[feature].add_counts(self.profile.item_counts(feature))
+            modes[feature] = self.profile.mode(feature)
+
+        return modes
+
 
 class PreProcessing:
     """
@@ -151,16 +258,22 @@ class PreProcessing:
 
     """
 
-    def __init__(self, x, y):
+    def __init__(self, x, y, engine="pandas", n_jobs=1):
         """
         Args:
           x: (pandas.DataFrame) Feature set / Affecting features
           y: (pandas.Dataframe) Target set / dependent feature
+          engine: (str) Compute engine the columns are scanned on, pandas or polars
+          n_jobs: (int) Number of threads processing chunks of columns at the same time, -1 uses all cores
 
         """
         self.x = x
         self.y = y
         assert x.shape[0] == y.shape[0], "Data shape mismatched!"
+        self.engine = engine
+        self.n_jobs = n_jobs
+        self.transformer = None
+        self.profile = None
 
     def save_data(self, save_format="csv"):
         """
@@ -168,7 +281,7 @@ class PreProcessing:
         a file on respective format
 
         Args:
-            save_format: (Any) the required format on which the files will be saved.
+            save_format: (Any) the required format on which the files will be saved, csv, parquet or feather.
 
         Returns:
             processed_dataframe: (pandas.DataFrame) Processed feature set / Affecting features
@@ -176,16 +289,12 @@ class PreProcessing:
 
         # Joining the x and y feature set to prepare full dataframe
         processed_dataframe = pd.concat([self.x, self.y], axis=1)
-        if save_format == "csv":
-            # Writing to csv
-            processed_dataframe.to_csv("processed_dataframe.csv", index=False)
-            # Validating output path
-            output_path = os.path.join(os.getcwd(), "processed_dataframe.csv")
-            assert os.path.isfile(output_path), "Processed data saved on different location!"
-            print(f"Processed data saved at {output_path}")
-        else:
-            # Will be updated soon
-            pass
+        assert save_format in save_formats, f"Save format not supported, choose one of {save_formats}..."
+        # Writing on the required format
+        output_path = write_data(processed_dataframe, "processed_dataframe", save_format=save_format)
+        # Validating output path
+        assert os.path.isfile(output_path), "Processed data saved on different location!"
+        print(f"Processed data saved at {output_path}")
 
     def run(self):
         """
@@ -198,10 +307,40 @@ class PreProcessing:
         print(f"Initiating Preprocessing...")
         # Using Null Processor
         print(f"Going through null values and features...")
-        null_dropper = NullProcessing(self.x, self.y)
-        self.x, self.y = null_dropper.run()
+        null_dropper = NullProcessing(self.x, self.y, engine=self.engine, n_jobs=self.n_jobs)
+        with telemetry.span("preprocessing", rows=self.x.shape[0], columns=self.x.shape[1]):
+            self.x, self.y = null_dropper.run()
+        # Keeping the fitted null processing to apply it again on new data
+        self.transformer = null_dropper.transformer
+        # Keeping the column profile for reporting
+        self.profile = null_dropper.profile
         print(f"Null values and features processed...")
 
         print(f"Finishing Preprocessing...")
 
         return self.x, self.y
+
+    def fit(self):
+        """
+        Fits the preprocessing on the data of the class
+
+        Returns:
+            transformer: (NullTransform) Fitted preprocessing
+        """
+        self.run()
+
+        return self.transformer
+
+    def transform(self, x):
+        """
+        Applies the fitted preprocessing on new data
+
+        Args:
+            x: (pandas.DataFrame) Feature set / Affecting features
+
+        Returns:
+            x: (pandas.DataFrame) Processed feature set
+        """
+        assert self.transformer is not None, "Preprocessing is not fitted yet..."
+
+        return self.transformer.transform(x)
@@ -0,0 +1,386 @@
+"""
+This file holds all codes for serving the saved inference pipeline over HTTP.
+"""
+import asyncio
+import collections
+import json
+import os
+import signal
+import time
+
+import numpy as np
+import pandas as pd
+
+# Reason phrases of the status codes the server answers with
+status_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def to_json(value):
+    """
+    Args:
+        value: (Any) Item json can not write e.g. a numpy number
+
+    Returns:
+        value: (Any) Plain python item
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return str(value)
+
+
+def parse_records(payload):
+    """
+    Args:
+        payload: (Any) Decoded request body, {"records": [{column: item}]} or {"columns": [...], "data": [[...]]}
+
+    Returns:
+        x: (pandas.DataFrame) Raw feature set of the request
+    """
+    if isinstance(payload, dict) and "records" in payload:
+        return pd.DataFrame.from_records(payload["records"])
+    if isinstance(payload, dict) and "data" in payload:
+        return pd.DataFrame(payload["data"], columns=payload.get("columns"))
+    if isinstance(payload, list):
+        return pd.DataFrame.from_records(payload)
+    raise ValueError("Body must hold records or columns and data")
+
+
+class ServingMetrics:
+    """
+
+    Throughput and latency counters of the server, the latencies are
+    kept on a window of the latest requests for the percentiles
+
+    """
+
+    def __init__(self, window=10000):
+        """
+        Args:
+            window: (int) Number of latest requests the latency percentiles are taken on
+
+        """
+        self.start_time = time.time()
+        self.requests = 0
+        self.records = 0
+        self.batches = 0
+        self.batch_records = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=window)
+        self.predict_seconds = 0.0
+
+    def record_request(self, n_records, latency):
+        self.requests += 1
+        self.records += n_records
+        self.latencies.append(latency)
+
+    def record_batch(self, n_records, predict_seconds):
+        self.batches += 1
+        self.batch_records += n_records
+        self.predict_seconds += predict_seconds
+
+    def snapshot(self, queue_size=0):
+        """
+        Args:
+            queue_size: (int) Number of requests waiting for a batch
+
+        Returns:
+            metrics: (dict) Counters, throughput and latency percentiles in milliseconds
+        """
+        uptime = time.time() - self.start_time
+        latencies = np.array(self.latencies) * 1000
+        percentiles = dict(zip(["latency_p50_ms", "latency_p95_ms", "latency_p99_ms"],
+                               np.percentile(latencies, [50, 95, 99]).tolist() if len(latencies) else [None] * 3))
+
+        return {"uptime_s": uptime, "requests": self.requests, "records": self.records, "errors": self.errors,
+                "batches": self.batches, "mean_batch_records": self.batch_records / max(self.batches, 1),
+                "requests_per_s": self.requests / uptime, "records_per_s": self.records / uptime,
+                "predict_seconds": self.predict_seconds, **percentiles,
+                "latency_max_ms": float(latencies.max()) if len(latencies) else None, "queue_size": queue_size}
+
+
+class MicroBatcher:
+    """
+
+    Gathers the records of concurrent requests into a single vectorized
+    predict call. A batch is closed once it holds max_batch_records
+    records or max_wait_ms passed since its first request, requests
+    arriving while a batch is predicted wait for the next batch.
+
+    """
+
+    def __init__(self, pipeline, metrics, max_batch_records=4096, max_wait_ms=5):
+        """
+        Args:
+            pipeline: (InferencePipeline) Loaded transforms and best model
+            metrics: (ServingMetrics) Counters the batches are recorded on
+            max_batch_records: (int) Maximum number of records predicted at once
+            max_wait_ms: (float) Maximum wait of the first request of a batch for other requests
+
+        """
+        self.pipeline = pipeline
+        self.metrics = metrics
+        self.max_batch_records = max_batch_records
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+
+    async def predict(self, x):
+        """
+        Args:
+            x: (pandas.DataFrame) Raw feature set of a request
+
+        Returns:
+            predictions: (numpy.ndarray) Predictions of the request
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((x, future))
+
+        return await future
+
+    async def collect(self):
+        """
+        Returns:
+            batch: (List[tuple]) (x, future) of the requests of the next batch
+        """
+        batch = [await self.queue.get()]
+        n_records = batch[0][0].shape[0]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while n_records < self.max_batch_records:
+            remaining_time = deadline - asyncio.get_running_loop().time()
+            if remaining_time <= 0 and self.queue.empty():
+                break
+            try:
+                # requests already waiting are always taken, new ones only until the deadline
+                request = self.queue.get_nowait() if not self.queue.empty() else \
+                    await asyncio.wait_for(self.queue.get(), remaining_time)
+            except asyncio.TimeoutError:
+                break
+            batch.append(request)
+            n_records += request[0].shape[0]
+
+        return batch
+
+    def predict_batch(self, frames):
+        """
+        Runs on a worker thread so that the event loop keeps accepting requests
+
+        Args:
+            frames: (List[pandas.DataFrame]) Raw feature sets of the requests of the batch
+
+        Returns:
+            predictions: (List[Any]) Predictions of every request, or the exception it raised
+        """
+        start_time = time.perf_counter()
+        try:
+            predictions = self.pipeline.predict(pd.concat(frames, ignore_index=True))
+            sizes = np.cumsum([frame.shape[0] for frame in frames])[:-1]
+            results = np.split(np.asarray(predictions), sizes)
+        except Exception:
+            # a single broken request must not fail the others, they are predicted one by one
+            results = list()
+            for frame in frames:
+                try:
+                    results.append(np.asarray(self.pipeline.predict(frame)))
+                except Exception as error:
+                    results.append(error)
+        self.metrics.record_batch(sum(frame.shape[0] for frame in frames), time.perf_counter() - start_time)
+
+        return results
+
+    async def run(self):
+        """
+        Predicts the batches one after another until cancelled
+
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.collect()
+            results = await loop.run_in_executor(None, self.predict_batch, [x for x, _ in batch])
+            for (_, future), result in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+class InferenceServer:
+    """
+
+    Minimal asyncio HTTP/1.1 server of the inference pipeline, on a TCP
+    port or a Unix socket. The pipeline is loaded once and every request
+    goes through the micro-batcher.
+
+        POST /predict   {"records": [{column: item}]} or {"columns": [...], "data": [[...]]}
+        GET  /metrics   throughput and latency counters
+        GET  /health    liveness check
+
+    """
+
+    def __init__(self, pipeline, max_batch_records=4096, max_wait_ms=5, max_body_mb=64, backlog=1024):
+        """
+        Args:
+            pipeline: (InferencePipeline) Loaded transforms and best model
+            max_batch_records: (int) Maximum number of records predicted at once
+            max_wait_ms: (float) Maximum wait of the first request of a batch for other requests
+            max_body_mb: (float) Maximum size of a request body in megabytes
+            backlog: (int) Number of connections waiting to be accepted, bursts of clients over it are refused
+
+        """
+        self.pipeline = pipeline
+        self.metrics = ServingMetrics()
+        self.max_batch_records = max_batch_records
+        self.max_wait_ms = max_wait_ms
+        self.max_body_size = int(max_body_mb * (1 << 20))
+        self.backlog = backlog
+        self.batcher = None
+
+    async def read_request(self, reader):
+        """
+        Args:
+            reader: (asyncio.StreamReader) Stream of the connection
+
+        Returns:
+            request: (tuple) (method, path, headers, body), None once the client closed the connection
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        content_length = int(headers.get("content-length", 0))
+        if content_length > self.max_body_size:
+            # the body is left unread, so that the connection is closed after the answer
+            headers["connection"] = "close"
+            return method, path, headers, None
+        body = await reader.readexactly(content_length) if content_length else b""
+
+        return method, path, headers, body
+
+    async def respond(self, method, path, body):
+        """
+        Args:
+            method: (str) HTTP method
+            path: (str) Requested path
+            body: (bytes) Request body, None if it was too large
+
+        Returns:
+            status: (int) HTTP status code
+            payload: (dict) Response body
+        """
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/metrics":
+            return 200, self.metrics.snapshot(queue_size=self.batcher.queue.qsize())
+        if path != "/predict":
+            return 404, {"error": f"{path} not found"}
+        if method != "POST":
+            return 405, {"error": "predictions are requested with POST"}
+        if body is None:
+            return 413, {"error": f"body over {self.max_body_size} bytes"}
+        start_time = time.perf_counter()
+        try:
+            x = parse_records(json.loads(body))
+        except (ValueError, TypeError) as error:
+            self.metrics.errors += 1
+            return 400, {"error": str(error)}
+        if x.shape[0] == 0:
+            return 200, {"predictions": []}
+        # checked before batching, a batch would fill the features a request misses with nulls
+        missing_features = [feature for feature in self.pipeline.input_columns if feature not in x.columns]
+        if missing_features:
+            self.metrics.errors += 1
+            return 400, {"error": f"missing features : {missing_features}"}
+        try:
+            predictions = await self.batcher.predict(x)
+        except KeyError as error:
+            self.metrics.errors += 1
+            return 400, {"error": f"missing features : {error.args[0]}"}
+        except Exception as error:
+            self.metrics.errors += 1
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+        self.metrics.record_request(x.shape[0], time.perf_counter() - start_time)
+
+        return 200, {"predictions": predictions.tolist()}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Answers the requests of a connection until the client closes it, connections are kept alive
+
+        Args:
+            reader: (asyncio.StreamReader) Stream of the connection
+            writer: (asyncio.StreamWriter) Stream of the connection
+
+        """
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError):
+                    request = ("", "", {"connection": "close"}, b"")
+                    status, payload = 400, {"error": "malformed request"}
+                else:
+                    if request is None:
+                        break
+                    try:
+                        status, payload = await self.respond(request[0], request[1], request[3])
+                    except Exception as error:
+                        # an unexpected failure is answered instead of dropping the connection
+                        self.metrics.errors += 1
+                        status, payload = 500, {"error": f"{type(error).__name__}: {error}"}
+                content = json.dumps(payload, default=to_json).encode()
+                keep_alive = request[2].get("connection", "keep-alive").lower() != "close"
+                writer.write(f"HTTP/1.1 {status} {status_reasons[status]}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(content)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8000, unix_socket=None):
+        """
+        Serves until the process is interrupted or terminated
+
+        Args:
+            host: (str) Interface of the TCP server
+            port: (int) Port of the TCP server
+            unix_socket: (str) Path of a Unix socket served instead of the TCP port if given
+
+        """
+        self.batcher = MicroBatcher(self.pipeline, self.metrics, max_batch_records=self.max_batch_records,
+                                    max_wait_ms=self.max_wait_ms)
+        batcher_task = asyncio.create_task(self.batcher.run())
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket, backlog=self.backlog)
+            print(f"Serving predictions on unix socket {unix_socket}")
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port, backlog=self.backlog)
+            print(f"Serving predictions on http://{host}:{port}")
+        # stopping cleanly on ctrl-c and on termination, the unix socket file is removed on the way out
+        stop = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signal_number, stop.set)
+            except NotImplementedError:
+                # windows event loops have no signal handlers, ctrl-c interrupts the loop instead
+                pass
+        try:
+            async with server:
+                await stop.wait()
+            print(f"Server stopped...")
+        finally:
+            batcher_task.cancel()
+            if unix_socket is not None and os.path.exists(unix_socket):
+                os.remove(unix_socket)
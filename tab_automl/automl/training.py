@@ -1,12 +1,26 @@
 """
 This file holds all codes for training models of processed feature engineered data.
 """
+import copy
 import pickle
 import os
+import shutil
+import tempfile
 import numpy as np
-from tab_automl.automl.models import single_model_dict
-from tab_automl.utils.losses import fetch_metric_scores
-from tab_automl.utils.losses import loss_fn_dict
+from functools import partial
+from joblib import Parallel, cpu_count, delayed
+from scipy import sparse
+from tab_automl.automl.ensemble import EnsembleModel, combine_scores, greedy_ensemble_selection, member_scores
+from tab_automl.automl.models import dense_input_models, model_time_complexity, out_of_core_model_dict, \
+    single_model_dict
+from tab_automl.automl.tuning import HyperparameterSearch
+from tab_automl.utils.cache import fingerprint
+from tab_automl.utils.losses import fetch_metric_scores, fetch_streaming_metric_scores, loss_fn_dict
+from tab_automl.utils.training import DenseInput, continue_training, cross_validation_folds, estimate_fit_times, \
+    fit_and_score_fold, fit_and_score_model, fit_and_score_shared_model, sample_rows, schedule_within_budget, share_training_data, \
+    to_training_matrix
+from tab_automl.utils.streaming import fit_out_of_core, fit_scaler, write_chunk_matrices
+from tab_automl.utils.telemetry import telemetry
 from termcolor import cprint
 import time
 import warnings
@@ -20,14 +34,21 @@ class Trainer:
     and find the best model and tuning
 
     """
-    def __init__(self, problem_type):
+    def __init__(self, problem_type, cache=None, memmap_min_mb=256, train_score_size=None):
         """
 
         Args:
             problem_type: (string) The problem statement to find right models
+            cache: (StageCache) Cache of the trained models, models are always trained if None
+            memmap_min_mb: (float) Minimum size in megabytes of a training matrix to memory-map it from disk
+            train_score_size: (int) Number of training rows the training metrics are scored on, all rows if None
 
         """
         self.problem_type = problem_type
+        self.cache = cache
+        self.memmap_min_mb = memmap_min_mb
+        self.train_score_size = train_score_size
+        self.matrix_folder = None
 
     def single_model_trainer(self, x_train, y_train,
                              x_val, y_val,
@@ -35,7 +56,10 @@ class Trainer:
                              model_dict=single_model_dict,
                              result_monitor="accuracy_score",
                              check_on="val",
-                             save_model=True):
+                             save_model=True,
+                             n_jobs=1,
+                             time_budget_s=None,
+                             ensemble_size=0):
         """
         Trains models of selected problem type and find the best results
 
@@ -49,6 +73,10 @@ class Trainer:
             result_monitor: (Any) Model metric to monitor best results
             check_on: (Any) The responsible dataset for model update
             save_model: (bool) whether the best model will be saved
+            n_jobs: (int) Number of worker processes training the models at the same time, -1 uses all cores
+            time_budget_s: (float) Wall time budget of the search in seconds, models projected to overrun it
+                are skipped and the best model found so far is kept
+            ensemble_size: (int) Number of selection rounds of an ensemble of the trained models, no ensemble if 0
 
         """
         # Checking the data shape whether iit has same number of records
@@ -57,42 +85,795 @@ class Trainer:
         print(f"Problem statement selected : {self.problem_type} .")
         print(f"Best model validator : {check_on}_{result_monitor}")
         # Selecting required models
+        models = self.select_models(model_dict, x_train)
+        try:
+            # Materializing the feature sets once for every fit and prediction
+            x_train, x_val = self.prepare_matrices(x_train, x_val)
+            # Model Training
+            print(f"Initiating Model Training...")
+            # Declaring the best model
+            self.reset_best_model(result_monitor, check_on, keep_candidates=ensemble_size > 0)
+            start_time = time.time()
+            data = (x_train, y_train, x_val, y_val)
+            data_key = self.data_key(data)
+            model_names = list(models.keys())
+            if time_budget_s is not None:
+                print(f"Time budget : {time_budget_s} s")
+                # Cached models cost nothing, only the others are projected
+                cached_models = [model_name for model_name in model_names
+                                 if self.is_cached(model_name, models[model_name], data_key, metric_list)]
+                # Projecting the cost of every model from a quick fit on a sample
+                projected_times, errors = estimate_fit_times(
+                    {model_name: model_class for model_name, model_class in models.items()
+                     if model_name not in cached_models}, data, metric_list, complexity=model_time_complexity,
+                    stratify=self.problem_type == "classification")
+                projected_times.update({model_name: 0.0 for model_name in cached_models})
+                for model_name, error in errors.items():
+                    self.skip_model(model_name, f"quick fit on sample failed ({error})")
+                # Training the cheapest models first
+                model_names = sorted([model_name for model_name in model_names if model_name not in errors],
+                                     key=projected_times.get)
+            if n_jobs == 1:
+                # Iterating through models
+                for model_name in model_names:
+                    if time_budget_s is not None:
+                        remaining_time = time_budget_s - (time.time() - start_time)
+                        if projected_times[model_name] > remaining_time:
+                            self.skip_model(model_name,
+                                            f"projected time {projected_times[model_name]:.2f} s "
+                                            f"exceeds the remaining budget of {max(remaining_time, 0):.2f} s")
+                            continue
+                    cprint(f"\n{model_name} taken for training...", "blue")
+                    result = self.fit_model(model_name, models[model_name], data, metric_list, data_key=data_key)
+                    self.register_result(*result)
+            else:
+                if time_budget_s is not None:
+                    # Keeping the models which are projected to finish in time on the worker pool
+                    remaining_time = time_budget_s - (time.time() - start_time)
+                    n_workers = cpu_count() if n_jobs < 0 else n_jobs
+                    model_names, overruns = schedule_within_budget(model_names, projected_times,
+                                                                   remaining_time, n_workers)
+                    for model_name, finish_time in overruns.items():
+                        self.skip_model(model_name, f"projected to finish after {finish_time:.2f} s "
+                                                    f"on the remaining budget of {max(remaining_time, 0):.2f} s")
+                results = self.fit_models(models, model_names, data, metric_list, n_jobs, data_key=data_key)
+                # Results are checked on the submission order so that the same winner as the serial run is picked
+                for result in results:
+                    cprint(f"\n{result[0]} trained...", "blue")
+                    self.register_result(*result)
+            if self.skipped_models:
+                cprint(f"\nSkipped models : {list(self.skipped_models.keys())}", "yellow")
+            if ensemble_size > 0:
+                # Ensembling the trained models on their validation predictions, nothing is trained again
+                self.ensemble_trainer(x_val, y_val, metric_list, data_key, models, ensemble_size)
+        finally:
+            # the shared matrices are removed even if a model failed
+            self.release_matrices()
+
+        print(f"Model training completed...")
+        # Saving the best model
+        if save_model:
+            self.save_best_model()
+
+    def successive_halving_trainer(self, x_train, y_train,
+                                   x_val, y_val,
+                                   metric_list=["accuracy_score"],
+                                   model_dict=single_model_dict,
+                                   result_monitor="accuracy_score",
+                                   check_on="val",
+                                   save_model=True,
+                                   n_jobs=1,
+                                   min_samples=1000,
+                                   halving_factor=3,
+                                   n_finalists=2):
+        """
+        Races the models of selected problem type on growing row subsamples,
+        only the best fraction of every round moves up to the next larger
+        subsample and only the finalists are trained on the full data
+
+        Args:
+            x_train: (pandas.DataFrame) Feature set / Affecting features for training
+            y_train: (pandas.Dataframe) Target set / dependent feature for training
+            x_val: (pandas.DataFrame) Feature set / Affecting features for validation
+            y_val: (pandas.Dataframe) Target set / dependent feature for validation
+            metric_list: (List[Any]) List of metric on which the model will be tested
+            model_dict: (Any) Model zoo for problem type
+            result_monitor: (Any) Model metric to monitor best results
+            check_on: (Any) The responsible dataset for model update
+            save_model: (bool) whether the best model will be saved
+            n_jobs: (int) Number of worker processes training the models at the same time, -1 uses all cores
+            min_samples: (int) Number of training rows of the first round
+            halving_factor: (int) Growth of the subsample and shrink of the candidates on every round
+            n_finalists: (int) Maximum number of models trained on the full data
+
+        """
+        # Checking the data shape whether iit has same number of records
+        assert x_train.shape[0] == y_train.shape[0] or x_val.shape[0] == y_val.shape[0], "Data shape mismatched..."
+        assert result_monitor in metric_list, "metric not found in metric list..."
+        assert halving_factor > 1, "Halving factor must be greater than 1..."
+        print(f"Problem statement selected : {self.problem_type} .")
+        print(f"Best model validator : {check_on}_{result_monitor}")
+        # Selecting required models
+        models = self.select_models(model_dict, x_train)
+        try:
+            # Materializing the feature sets once for every fit and prediction
+            x_train, x_val = self.prepare_matrices(x_train, x_val)
+            print(f"Initiating Successive Halving Model Selection...")
+            self.reset_best_model(result_monitor, check_on)
+            stratify = self.problem_type == "classification"
+            model_names = list(models.keys())
+            n_rows = min_samples
+            round_index = 1
+            # Racing the candidates until only the finalists are left or the subsample reaches the full data
+            while len(model_names) > n_finalists and n_rows < x_train.shape[0]:
+                cprint(f"\nRound {round_index} : {len(model_names)} models on {n_rows} rows...", "blue")
+                x_sample, y_sample = sample_rows(x_train, y_train, n_rows, stratify=stratify)
+                # Validating on a subsample of the same size to keep the round cheap
+                x_val_sample, y_val_sample = sample_rows(x_val, y_val, n_rows, stratify=stratify)
+                results = self.fit_models(models, model_names, (x_sample, y_sample, x_val_sample, y_val_sample),
+                                          metric_list, n_jobs)
+                # Ranking the models on the monitored score, best first
+                results = sorted(results, key=lambda result: result[2][f"{check_on}_{result_monitor}"][0],
+                                 reverse=not self.is_loss)
+                for model_name, _, metric_scores, fit_time in results:
+                    print(f"{model_name} : {check_on}_{result_monitor} = "
+                          f"{metric_scores[f'{check_on}_{result_monitor}'][0]:.5f} ({fit_time:.3f} s)")
+                n_promoted = max(n_finalists, int(np.ceil(len(model_names) / halving_factor)))
+                # Keeping the model zoo order among the promoted models
+                promoted = {result[0] for result in results[:n_promoted]}
+                for result in results[n_promoted:]:
+                    self.skip_model(result[0], f"eliminated on round {round_index} with {n_rows} rows")
+                model_names = [model_name for model_name in model_names if model_name in promoted]
+                n_rows *= halving_factor
+                round_index += 1
+
+            cprint(f"\nFinalists : {model_names}", "blue")
+            data = (x_train, y_train, x_val, y_val)
+            for result in self.fit_models(models, model_names, data, metric_list, n_jobs):
+                cprint(f"\n{result[0]} trained...", "blue")
+                self.register_result(*result)
+        finally:
+            # the shared matrices are removed even if a model failed
+            self.release_matrices()
+
+        print(f"Model training completed...")
+        # Saving the best model
+        if save_model:
+            self.save_best_model()
+
+    def cross_validation_trainer(self, x, y,
+                                 metric_list=["accuracy_score"],
+                                 model_dict=single_model_dict,
+                                 result_monitor="accuracy_score",
+                                 check_on="val",
+                                 save_model=True,
+                                 n_jobs=1,
+                                 n_folds=5):
+        """
+        Scores the models of selected problem type on k folds, stratified for
+        classification, all folds of all models are fitted at the same time on
+        a process pool if n_jobs is not 1. The best mean score picks the model
+        which is trained again on all rows, the out-of-fold predictions of every
+        model are kept on oof_predictions for stacking
+
+        Args:
+            x: (pandas.DataFrame) Feature set / Affecting features
+            y: (pandas.Dataframe) Target set / dependent feature
+            metric_list: (List[Any]) List of metric on which the model will be tested
+            model_dict: (Any) Model zoo for problem type
+            result_monitor: (Any) Model metric to monitor best results
+            check_on: (Any) The responsible dataset for model update
+            save_model: (bool) whether the best model will be saved
+            n_jobs: (int) Number of worker processes training the folds at the same time, -1 uses all cores
+            n_folds: (int) Number of folds
+
+        """
+        assert x.shape[0] == y.shape[0], "Data shape mismatched..."
+        assert result_monitor in metric_list, "metric not found in metric list..."
+        print(f"Problem statement selected : {self.problem_type} .")
+        print(f"Best model validator : {check_on}_{result_monitor} mean of {n_folds} folds")
+        models = self.select_models(model_dict, x)
+        try:
+            # Materializing the feature set once, every fold only addresses its rows
+            x = self.prepare_matrices(x)[0]
+            self.folds = cross_validation_folds(y, n_folds=n_folds, stratify=self.problem_type == "classification")
+            print(f"Initiating Cross Validation Model Training...")
+            self.reset_best_model(result_monitor, check_on)
+            self.oof_predictions = dict()
+            model_names = list(models.keys())
+            data_key = self.data_key((x, y))
+            results = dict()
+            model_keys = dict()
+            if self.cache is not None:
+                for model_name in model_names:
+                    model_keys[model_name] = fingerprint(self.model_key(model_name, models[model_name], data_key,
+                                                                        metric_list), {"n_folds": n_folds})
+                    hit, result = self.cache.load("cross_validation", model_keys[model_name])
+                    if hit:
+                        print(f"{model_name} loaded from cache...")
+                        results[model_name] = result
+            tasks = [(model_name, fold_index) for model_name in model_names if model_name not in results
+                     for fold_index in range(n_folds)]
+            if tasks:
+                fold_results = self.fit_folds(models, tasks, (x, y), metric_list, n_jobs)
+                for model_name in model_names:
+                    if model_name in results:
+                        continue
+                    results[model_name] = self.merge_folds(y, [fold_results[(model_name, fold_index)]
+                                                               for fold_index in range(n_folds)])
+                    if self.cache is not None:
+                        self.cache.save("cross_validation", model_keys[model_name], results[model_name])
+            for model_name in model_names:
+                metric_scores, fold_scores, oof_predictions, fit_time = results[model_name]
+                self.oof_predictions[model_name] = oof_predictions
+                cprint(f"\n{model_name} cross validated...", "blue")
+                print(f"{check_on}_{result_monitor} of every fold : "
+                      f"{[round(score, 5) for score in fold_scores]} (std {np.std(fold_scores):.5f})")
+                self.register_result(model_name, None, metric_scores, fit_time)
+
+            if self.best_model_name is not None:
+                cprint(f"\nTraining {self.best_model_name} on all {x.shape[0]} records...", "blue")
+                # the scores of the full data model are not used, only the model itself
+                self.best_model = models[self.best_model_name]()
+                self.best_model.fit(x, y)
+        finally:
+            # the shared matrices are removed even if a model failed
+            self.release_matrices()
+        print(f"Model training completed...")
+        # Saving the best model
+        if save_model:
+            self.save_best_model()
+
+    def fit_folds(self, models, tasks, data, metric_list, n_jobs):
+        """
+        Trains and scores the folds of the models, at the same time on a process pool if n_jobs is not 1
+
+        Args:
+            models: (dict) Model zoo of the problem type
+            tasks: (List[tuple]) (model_name, fold_index) of every fit
+            data: (tuple) (x, y)
+            metric_list: (List[Any]) List of metric on which the model will be tested
+            n_jobs: (int) Number of worker processes, -1 uses all cores
+
+        Returns:
+            fold_results: (dict) (metric_scores, val_pred, fit_time) of every (model_name, fold_index)
+        """
+        if n_jobs == 1:
+            results = [fit_and_score_fold(model_name, models[model_name], data, *self.folds[fold_index],
+                                          metric_list, train_score_size=self.train_score_size)
+                       for model_name, fold_index in tasks]
+        else:
+            cprint(f"\nTraining {len(tasks)} folds in parallel...", "blue")
+            shared_folder = tempfile.mkdtemp(prefix="tab_automl_")
+            # Writing a single copy of the data which is memory-mapped by every worker
+            try:
+                data_path = share_training_data(data, shared_folder)
+                results = Parallel(n_jobs=n_jobs)(
+                    delayed(fit_and_score_fold)(model_name, models[model_name], data_path, *self.folds[fold_index],
+                                                metric_list, train_score_size=self.train_score_size)
+                    for model_name, fold_index in tasks)
+            finally:
+                # the shared copy is removed even if a worker failed
+                shutil.rmtree(shared_folder, ignore_errors=True)
+
+        return {task: result[1:] for task, result in zip(tasks, results)}
+
+    def merge_folds(self, y, fold_results):
+        """
+        Args:
+            y: (pandas.Dataframe) Target set / dependent feature
+            fold_results: (List[tuple]) (metric_scores, val_pred, fit_time) of every fold
+
+        Returns:
+            metric_scores: (dict) Mean train and validation scores of the folds
+            fold_scores: (List[float]) Monitored score of every fold
+            oof_predictions: (numpy.ndarray) Out-of-fold prediction of every row
+            fit_time: (float) Total wall time of the folds in seconds
+        """
+        metric_scores = {metric: [float(np.mean([fold_scores[metric][0] for fold_scores, _, _ in fold_results])),
+                                  metric_type]
+                         for metric, (_, metric_type) in fold_results[0][0].items()}
+        fold_scores = [fold_scores[f"{self.check_on}_{self.result_monitor}"][0]
+                       for fold_scores, _, _ in fold_results]
+        # every row is predicted by the model of the fold which did not train on it
+        oof_predictions = np.empty(y.shape[0], dtype=np.asarray(fold_results[0][1]).dtype)
+        for (_, val_index), (_, val_pred, _) in zip(self.folds, fold_results):
+            oof_predictions[val_index] = np.ravel(val_pred)
+        fit_time = sum(fit_time for _, _, fit_time in fold_results)
+
+        return metric_scores, fold_scores, oof_predictions, fit_time
+
+    def hyperparameter_search_trainer(self, x_train, y_train,
+                                      x_val, y_val,
+                                      metric_list=["accuracy_score"],
+                                      model_dict=single_model_dict,
+                                      result_monitor="accuracy_score",
+                                      check_on="val",
+                                      save_model=True,
+                                      n_jobs=1,
+                                      n_trials=50,
+                                      sampler="tpe",
+                                      time_budget_s=None,
+                                      history_path="tuning_history.jsonl"):
+        """
+        Searches the models of selected problem type and their hyperparameters,
+        the trials are compared on the validation score of result_monitor and
+        the best trial is trained again and scored on all metrics
+
+        Args:
+            x_train: (pandas.DataFrame) Feature set / Affecting features for training
+            y_train: (pandas.Dataframe) Target set / dependent feature for training
+            x_val: (pandas.DataFrame) Feature set / Affecting features for validation
+            y_val: (pandas.Dataframe) Target set / dependent feature for validation
+            metric_list: (List[Any]) List of metric on which the model will be tested
+            model_dict: (Any) Model zoo for problem type
+            result_monitor: (Any) Model metric to monitor best results
+            check_on: (Any) The responsible dataset for model update
+            save_model: (bool) whether the best model will be saved
+            n_jobs: (int) Number of worker processes training trials at the same time, -1 uses all cores
+            n_trials: (int) Number of trials including the ones resumed from the history
+            sampler: (str) tpe or random
+            time_budget_s: (float) Wall time budget of the search in seconds
+            history_path: (str) JSON lines file the trials are appended to and resumed from
+
+        """
+        assert x_train.shape[0] == y_train.shape[0] or x_val.shape[0] == y_val.shape[0], "Data shape mismatched..."
+        assert result_monitor in metric_list, "metric not found in metric list..."
+        print(f"Problem statement selected : {self.problem_type} .")
+        print(f"Best model validator : val_{result_monitor} of {n_trials} trials")
+        models = self.select_models(model_dict, x_train)
+        try:
+            x_train, x_val = self.prepare_matrices(x_train, x_val)
+            print(f"Initiating Hyperparameter Search...")
+            self.reset_best_model(result_monitor, check_on)
+            data = (x_train, y_train, x_val, y_val)
+            search = HyperparameterSearch(self.problem_type, models, metric=result_monitor, sampler=sampler,
+                                          n_trials=n_trials, time_budget_s=time_budget_s, n_jobs=n_jobs,
+                                          history_path=history_path)
+            self.best_trial = search.run(data)
+            self.trials = search.trials
+            if self.best_trial is not None:
+                model_name = self.best_trial["model"]
+                cprint(f"\nTraining {model_name} of trial {self.best_trial['trial']} with "
+                       f"{self.best_trial['params']}...", "blue")
+                model_class = partial(models[model_name], **self.best_trial["params"])
+                result = fit_and_score_model(model_name, model_class, data, metric_list,
+                                             train_score_size=self.train_score_size)
+                self.register_result(*result)
+        finally:
+            # the shared matrices are removed even if a model failed
+            self.release_matrices()
+        print(f"Model training completed...")
+        # Saving the best model
+        if save_model:
+            self.save_best_model()
+
+    def out_of_core_trainer(self, chunks,
+                            metric_list=["accuracy_score"],
+                            model_dict=out_of_core_model_dict,
+                            result_monitor="accuracy_score",
+                            check_on="val",
+                            save_model=True,
+                            n_epochs=3,
+                            val_ratio=0.2,
+                            block_rows=65536):
+        """
+        Trains the out-of-core models of selected problem type on a data source
+        larger than memory. The chunks are written once into memory-mapped
+        training and validation matrices, every model reads them block by block
+        and is scored block by block, so that only a block is held in memory.
+
+        Args:
+            chunks: (Iterator[tuple]) Feature matrix and target feature of every chunk, numerical
+            metric_list: (List[Any]) List of metric on which the model will be tested
+            model_dict: (Any) Out-of-core model zoo for problem type
+            result_monitor: (Any) Model metric to monitor best results
+            check_on: (Any) The responsible dataset for model update
+            save_model: (bool) whether the best model will be saved
+            n_epochs: (int) Number of passes over the rows of the partial_fit models
+            val_ratio: (float) Ratio of rows kept for validation
+            block_rows: (int) Number of rows read at once
+
+        """
+        assert result_monitor in metric_list, "metric not found in metric list..."
+        print(f"Problem statement selected : {self.problem_type} .")
+        print(f"Best model validator : {check_on}_{result_monitor}")
         models = model_dict[self.problem_type]
-        # Model Training
-        print(f"Initiating Model Training...")
-        # Declaring the best model
+        self.matrix_folder = tempfile.mkdtemp(prefix="tab_automl_")
+        try:
+            with telemetry.span("training_matrix"):
+                x_train, y_train, x_val, y_val = write_chunk_matrices(chunks, self.matrix_folder, val_ratio=val_ratio)
+            print(f"Training matrices on disk : {x_train.shape}, {x_val.shape}")
+            classes = None
+            if self.problem_type == "classification":
+                # collecting the labels block by block
+                classes = np.unique(np.concatenate([np.unique(y[start:start + block_rows]) for y in (y_train, y_val)
+                                                    for start in range(0, y.shape[0], block_rows)]))
+            print(f"Initiating Out-of-core Model Training...")
+            self.reset_best_model(result_monitor, check_on)
+            scaler = None
+            for model_name, model_class in models.items():
+                cprint(f"\n{model_name} taken for training...", "blue")
+                start_time = time.time()
+                model = model_class()
+                if scaler is None and hasattr(model, "partial_fit"):
+                    # a single pass fits the scaler of every partial_fit model
+                    scaler = fit_scaler(x_train, block_rows)
+                with telemetry.span("model", model=model_name):
+                    with telemetry.span("fit", rows=x_train.shape[0]):
+                        model = fit_out_of_core(model, x_train, y_train, classes, n_epochs=n_epochs,
+                                                block_rows=block_rows, folder=self.matrix_folder, scaler=scaler)
+                    metric_scores = fetch_streaming_metric_scores((x_train, y_train), (x_val, y_val), model,
+                                                                  metrics=metric_list,
+                                                                  train_score_size=self.train_score_size,
+                                                                  block_rows=block_rows)
+                self.register_result(model_name, model, metric_scores, time.time() - start_time)
+        finally:
+            # the matrices and the external memory pages are removed even if a model failed
+            self.release_matrices()
+
+        print(f"Model training completed...")
+        # Saving the best model
+        if save_model:
+            self.save_best_model()
+
+    def incremental_trainer(self, model, x_train, y_train,
+                            x_val, y_val,
+                            metric_list=["accuracy_score"],
+                            result_monitor="accuracy_score",
+                            save_model=True,
+                            n_rounds=100):
+        """
+        Trains the previous best model further on new rows instead of training every
+        model again on the whole history. The previous and the updated model are
+        scored on the validation rows of the new data and the better one is kept,
+        the updated model wins a tie.
+
+        Args:
+            model: (Any) Previous best model
+            x_train: (Any) Feature set / Affecting features of the new rows for training
+            y_train: (pandas.Dataframe) Target set / dependent feature of the new rows for training
+            x_val: (Any) Feature set / Affecting features of the new rows for validation
+            y_val: (pandas.Dataframe) Target set / dependent feature of the new rows for validation
+            metric_list: (List[Any]) List of metric on which the models will be tested
+            result_monitor: (Any) Model metric to monitor best results
+            save_model: (bool) whether the best model will be saved
+            n_rounds: (int) Number of additional boosting rounds of boosting models
+
+        """
+        assert x_train.shape[0] == y_train.shape[0] or x_val.shape[0] == y_val.shape[0], "Data shape mismatched..."
+        assert result_monitor in metric_list, "metric not found in metric list..."
+        print(f"Problem statement selected : {self.problem_type} .")
+        print(f"Best model validator : val_{result_monitor} on the new rows")
+        try:
+            x_train, x_val = self.prepare_matrices(x_train, x_val)
+            print(f"Initiating Incremental Training...")
+            self.reset_best_model(result_monitor, "val")
+            start_time = time.time()
+            try:
+                # the previous model is kept untouched to compare against it
+                updated_model, technique = continue_training(copy.deepcopy(model), x_train, y_train, n_rounds=n_rounds)
+            except Exception as error:
+                updated_model, technique = None, None
+                self.skip_model("Updated model", f"continued training failed ({error})")
+            if technique is not None:
+                cprint(f"\nUpdated model trained further with {technique}...", "blue")
+                metric_scores = fetch_metric_scores((x_train, y_train), (x_val, y_val), trained_model=updated_model,
+                                                    metrics=metric_list, verbose=False,
+                                                    train_score_size=self.train_score_size)
+                self.register_result("Updated model", updated_model, metric_scores, time.time() - start_time)
+            elif updated_model is not None:
+                self.skip_model("Updated model", f"{type(model).__name__} can not be trained further, "
+                                                 f"train the models on the whole history instead")
+            cprint(f"\nPrevious model scored on the new rows...", "blue")
+            metric_scores = fetch_metric_scores((x_train, y_train), (x_val, y_val), trained_model=model,
+                                                metrics=metric_list, verbose=False,
+                                                train_score_size=self.train_score_size)
+            self.register_result("Previous model", model, metric_scores, 0.0)
+        finally:
+            # the shared matrices are removed even if a model failed
+            self.release_matrices()
+        print(f"Model training completed...")
+        # Saving the best model
+        if save_model:
+            self.save_best_model()
+
+    def ensemble_trainer(self, x_val, y_val, metric_list, data_key, models, ensemble_size=50):
+        """
+        Selects a weighted ensemble of the trained candidates on their validation
+        predictions, it replaces the best model if it scores better on validation
+
+        Args:
+            x_val: (Any) Feature set / Affecting features for validation
+            y_val: (pandas.Dataframe) Target set / dependent feature for validation
+            metric_list: (List[Any]) List of metric on which the models were tested
+            data_key: (str) Fingerprint of the data, the validation predictions are cached under it
+            models: (dict) Model zoo of the problem type
+            ensemble_size: (int) Number of selection rounds, a member picked several times gets a larger weight
+
+        """
+        if len(self.candidates) < 2 or self.best_model_name is None:
+            cprint(f"\nEnsemble needs at least 2 trained models...", "yellow")
+            return
+        cprint(f"\nSelecting an ensemble of {len(self.candidates)} models...", "blue")
+        # members are averaged on their class probabilities, on the columns of every label of the candidates
+        classes = np.unique(np.concatenate([np.asarray(model.classes_) for model in self.candidates.values()])) \
+            if self.problem_type == "classification" else None
+        scores = {model_name: self.validation_scores(model_name, model, x_val, classes, data_key,
+                                                     models[model_name], metric_list)
+                  for model_name, model in self.candidates.items()}
+        # scoring on the first target column like the model metrics
+        y = np.asarray(y_val)[:, 0] if np.ndim(y_val) > 1 else np.asarray(y_val)
+        weights, score = greedy_ensemble_selection(scores, y, self.result_monitor, classes, n_rounds=ensemble_size)
+        best_val_score = loss_fn_dict[self.result_monitor][0](y, combine_scores(scores[self.best_model_name], 1.0,
+                                                                                classes))
+        print(f"Ensemble weights : {', '.join(f'{name} {weight:.3f}' for name, weight in weights.items())}")
+        print(f"Ensemble val_{self.result_monitor} : {score:.5f}, "
+              f"{self.best_model_name} val_{self.result_monitor} : {best_val_score:.5f}")
+        if len(weights) < 2 or (score >= best_val_score if self.is_loss else score <= best_val_score):
+            cprint(f"Ensemble does not improve on {self.best_model_name}...", "red")
+            return
+        # the members are predicted on a thread per member at inference, independently of the training jobs
+        self.best_model = EnsembleModel({model_name: self.candidates[model_name] for model_name in weights},
+                                        weights, self.problem_type, classes=classes)
+        self.best_model_name = "Ensemble"
+        self.best_score = score
+        self.ensemble_weights = weights
+        cprint(f"Current best model : {self.best_model}", "green")
+
+    def validation_scores(self, model_name, model, x_val, classes, data_key, model_class, metric_list):
+        """
+        Args:
+            model_name: (str) Name of the model inside the model zoo
+            model: (Any) Trained model
+            x_val: (Any) Feature set / Affecting features for validation
+            classes: (numpy.ndarray) Sorted labels of all candidates, None on regression
+            data_key: (str) Fingerprint of the data
+            model_class: (Any) Model class the model was trained from
+            metric_list: (List[Any]) List of metric on which the model was tested
+
+        Returns:
+            scores: (numpy.ndarray) Validation class probabilities or predictions of the model, loaded
+                from the cache if present
+        """
+        if self.cache is None:
+            return member_scores(model, x_val, self.problem_type, classes)
+        # the scores belong to the cached model, they are keyed on it
+        scores_key = fingerprint(self.model_key(model_name, model_class, data_key, metric_list), classes)
+        hit, scores = self.cache.load("validation_scores", scores_key)
+        if not hit:
+            scores = member_scores(model, x_val, self.problem_type, classes)
+            self.cache.save("validation_scores", scores_key, scores)
+
+        return scores
+
+    def select_models(self, model_dict, x_train):
+        """
+        Args:
+            model_dict: (Any) Model zoo for problem type
+            x_train: (Any) Feature set / Affecting features for training
+
+        Returns:
+            models: (dict) Models of the problem type, the ones which need dense input are
+                converted to dense on their own when the features are a sparse matrix
+        """
+        models = model_dict[self.problem_type]
+        if sparse.issparse(x_train):
+            models = {model_name: DenseInput(model_class) if model_name in dense_input_models else model_class
+                      for model_name, model_class in models.items()}
+
+        return models
+
+    def prepare_matrices(self, *feature_sets):
+        """
+        Converts the feature sets once into contiguous float matrices, memory-mapped
+        from a temporary folder when they are large, so that all fits, predictions and
+        worker processes share the same buffer
+
+        Args:
+            feature_sets: (Any) Feature sets e.g. x_train and x_val
+
+        Returns:
+            matrices: (tuple) Matrix of every feature set
+        """
+        self.matrix_folder = tempfile.mkdtemp(prefix="tab_automl_")
+        matrices = tuple(to_training_matrix(x, folder=self.matrix_folder, memmap_min_mb=self.memmap_min_mb)
+                         for x in feature_sets)
+        print(f"Training matrices : {', '.join(f'{type(x).__name__} {x.shape}' for x in matrices)}")
+
+        return matrices
+
+    def release_matrices(self):
+        """
+        Removes the memory-mapped matrices of the finished search, mappings held by the trained models stay valid
+
+        """
+        if self.matrix_folder is not None:
+            shutil.rmtree(self.matrix_folder, ignore_errors=True)
+            self.matrix_folder = None
+
+    def reset_best_model(self, result_monitor, check_on, keep_candidates=False):
+        """
+        Declares the monitored metric and clears the best model before a model search
+
+        Args:
+            result_monitor: (Any) Model metric to monitor best results
+            check_on: (Any) The responsible dataset for model update
+            keep_candidates: (bool) whether every trained model will be kept for an ensemble
+
+        """
         self.result_monitor = result_monitor
         self.check_on = check_on
         self.best_score = np.inf if loss_fn_dict[result_monitor][1] == "-" else 0
         self.is_loss = True if loss_fn_dict[result_monitor][1] == "-" else False
         self.best_model = None
         self.best_model_name = None
-        # Iterating through models
-        for model_name in models.keys():
-            cprint(f"\n{model_name} taken for training...", "blue")
-            # Declaring the model
-            model = models[model_name]()
-            start_time = time.time()
-            # Training the model
-            model.fit(x_train, y_train)
-            # fetching metric_scores
-            metric_scores = fetch_metric_scores((x_train, y_train),
-                                                (x_val, y_val), metrics=metric_list,
-                                                trained_model=model)
-            print(f"Model Metrics :")
-            print({k: '%.5f'%v[0] for k, v in metric_scores.items()})
-            self.model_checkpoint(metric_scores, model_name, model)
+        self.model_fit_times = dict()
+        self.skipped_models = dict()
+        # the trained models are only held in memory when an ensemble is selected from them
+        self.candidates = dict() if keep_candidates else None
+        self.ensemble_weights = None
 
-        print(f"Model training completed...")
-        # Saving the best model
-        if save_model:
-            with open("best_model.pkl", "wb") as outfile:
-                pickle.dump(self.best_model, outfile)
-                outfile.close()
-            # Validating output path
-            output_path = os.path.join(os.getcwd(), "best_model.pkl")
-            assert os.path.isfile(output_path), "Model saved on different location!"
-            print(f"Best model saved at {output_path}")
+    def data_key(self, data):
+        """
+        Args:
+            data: (tuple) (x_train, y_train, x_val, y_val)
+
+        Returns:
+            data_key: (str) Fingerprint of the data, None if no cache is used
+        """
+        return None if self.cache is None else fingerprint(data)
+
+    def model_key(self, model_name, model_class, data_key, metric_list):
+        """
+        Args:
+            model_name: (str) Name of the model inside the model zoo
+            model_class: (Any) Model class which will be instantiated with default arguments
+            data_key: (str) Fingerprint of the data
+            metric_list: (List[Any]) List of metric on which the model will be tested
+
+        Returns:
+            model_key: (str) Cache key of the trained model and its scores
+        """
+        return fingerprint({"model": model_name, "model_class": model_class, "data": data_key,
+                            "metrics": list(metric_list), "train_score_size": self.train_score_size})
+
+    def is_cached(self, model_name, model_class, data_key, metric_list):
+        """
+        Returns:
+            (bool) whether the trained model is cached
+        """
+        return self.cache is not None and \
+            self.cache.contains("model", self.model_key(model_name, model_class, data_key, metric_list))
+
+    def fit_model(self, model_name, model_class, data, metric_list, data_key=None, verbose=True):
+        """
+        Trains and scores a single model, or loads it from the cache
+
+        Args:
+            model_name: (str) Name of the model inside the model zoo
+            model_class: (Any) Model class which will be instantiated with default arguments
+            data: (tuple) (x_train, y_train, x_val, y_val)
+            metric_list: (List[Any]) List of metric on which the model will be tested
+            data_key: (str) Fingerprint of the data, computed if None
+            verbose: (bool) whether the metric scores will be printed while scoring
+
+        Returns:
+            result: (tuple) (model_name, model, metric_scores, fit_time)
+        """
+        if self.cache is None:
+            return fit_and_score_model(model_name, model_class, data, metric_list, verbose=verbose,
+                                       train_score_size=self.train_score_size)
+        model_key = self.model_key(model_name, model_class, data_key or self.data_key(data), metric_list)
+        hit, result = self.cache.load("model", model_key)
+        if hit:
+            print(f"{model_name} loaded from cache...")
+            return result
+        result = fit_and_score_model(model_name, model_class, data, metric_list, verbose=verbose,
+                                     train_score_size=self.train_score_size)
+        self.cache.save("model", model_key, result)
+
+        return result
+
+    def fit_models(self, models, model_names, data, metric_list, n_jobs, data_key=None):
+        """
+        Trains and scores the models, at the same time on a process pool if n_jobs is not 1.
+        Models found on the cache are loaded instead of trained.
+
+        Args:
+            models: (dict) Model zoo of the problem type
+            model_names: (List[str]) Models which will be trained
+            data: (tuple) (x_train, y_train, x_val, y_val)
+            metric_list: (List[Any]) List of metric on which the model will be tested
+            n_jobs: (int) Number of worker processes, -1 uses all cores
+            data_key: (str) Fingerprint of the data, computed if None
+
+        Returns:
+            results: (List[tuple]) (model_name, model, metric_scores, fit_time) on the order of model_names
+        """
+        if n_jobs == 1:
+            data_key = data_key or self.data_key(data)
+            return [self.fit_model(model_name, models[model_name], data, metric_list, data_key=data_key,
+                                   verbose=False)
+                    for model_name in model_names]
+        results = dict()
+        model_keys = dict()
+        if self.cache is not None:
+            data_key = data_key or self.data_key(data)
+            for model_name in model_names:
+                model_keys[model_name] = self.model_key(model_name, models[model_name], data_key, metric_list)
+                hit, result = self.cache.load("model", model_keys[model_name])
+                if hit:
+                    print(f"{model_name} loaded from cache...")
+                    results[model_name] = result
+        missing_model_names = [model_name for model_name in model_names if model_name not in results]
+        if missing_model_names:
+            cprint(f"\nTraining {len(missing_model_names)} models in parallel...", "blue")
+            shared_folder = tempfile.mkdtemp(prefix="tab_automl_")
+            # Writing a single copy of the data which is memory-mapped by every worker
+            try:
+                data_path = share_training_data(data, shared_folder)
+                fitted = Parallel(n_jobs=n_jobs)(
+                    delayed(fit_and_score_shared_model)(model_name, models[model_name], data_path, metric_list,
+                                                        train_score_size=self.train_score_size)
+                    for model_name in missing_model_names)
+            finally:
+                # the shared copy is removed even if a worker failed
+                shutil.rmtree(shared_folder, ignore_errors=True)
+            for model_name, model_bytes, metric_scores, fit_time in fitted:
+                results[model_name] = (model_name, pickle.loads(model_bytes), metric_scores, fit_time)
+                if self.cache is not None:
+                    self.cache.save("model", model_keys[model_name], results[model_name])
+
+        return [results[model_name] for model_name in model_names]
+
+    def save_best_model(self):
+        """
+        Writes the best model into best_model.pkl on the working directory
+
+        """
+        if self.best_model is None:
+            cprint(f"No model trained, nothing to save...", "red")
+            return
+        with open("best_model.pkl", "wb") as outfile:
+            pickle.dump(self.best_model, outfile)
+            outfile.close()
+        # Validating output path
+        output_path = os.path.join(os.getcwd(), "best_model.pkl")
+        assert os.path.isfile(output_path), "Model saved on different location!"
+        print(f"Best model saved at {output_path}")
+
+    def register_result(self, model_name, model, metric_scores, fit_time):
+        """
+        Reports the scores of a trained model and checks it against the current best model
+
+        Args:
+            model_name: (str) Name of the model inside the model zoo
+            model: (Any) Trained model
+            metric_scores: (dict) Train and validation scores of the model
+            fit_time: (float) Wall time taken to train and score the model in seconds
+
+        """
+        self.model_fit_times[model_name] = fit_time
+        if model is not None and self.candidates is not None:
+            # Keeping every trained model as an ensemble candidate
+            self.candidates[model_name] = model
+        print(f"Model Metrics :")
+        print({k: '%.5f'%v[0] for k, v in metric_scores.items()})
+        print(f"Training time : {fit_time:.3f} s")
+        self.model_checkpoint(metric_scores, model_name, model)
+
+    def skip_model(self, model_name, reason):
+        """
+        Logs a model which is left out of the training
+
+        Args:
+            model_name: (str) Name of the model inside the model zoo
+            reason: (str) Why the model is left out
+
+        """
+        self.skipped_models[model_name] = reason
+        cprint(f"\n{model_name} skipped : {reason}", "yellow")
 
     def model_checkpoint(self, metric_dict, model_name, model):
         flag = True
@@ -0,0 +1,503 @@
+"""
+This file holds all codes for the hyperparameter search on top of the model zoo.
+"""
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from joblib import Parallel, cpu_count, delayed
+from termcolor import cprint
+
+from tab_automl.automl.models import boosting_models, samplers, search_spaces
+from tab_automl.utils.cache import fingerprint
+from tab_automl.utils.losses import loss_fn_dict
+from tab_automl.utils.training import continue_boosting, load_shared_data, sample_rows, share_training_data
+
+
+def rung_resources(total, reduction_factor=3, n_rungs=3, min_resource=1):
+    """
+    Args:
+        total: (int) Full resource of a trial, boosting rounds or training rows
+        reduction_factor: (int) Growth of the resource from a rung to the next one
+        n_rungs: (int) Maximum number of rungs
+        min_resource: (int) Smallest resource a rung is given
+
+    Returns:
+        resources: (List[int]) Growing resource of every rung, the last one is the full resource
+    """
+    resources = [max(int(round(total / reduction_factor ** rung)), min(min_resource, total))
+                 for rung in reversed(range(n_rungs))]
+
+    return sorted(set(resources))
+
+
+def run_trial(trial, model_class, data, metric, checkpoints, rung_thresholds, deadline=None, staged=False,
+              stratify=False):
+    """
+    Trains and scores a trial rung by rung, the trial is pruned as soon as its
+    score on a rung falls below the median of the earlier trials on the same resource
+
+    Args:
+        trial: (dict) Number, model name and parameters of the trial
+        model_class: (Any) Model class which will be instantiated with the parameters
+        data: (tuple or str) (x_train, y_train, x_val, y_val) or the path of their shared copy
+        metric: (str) Metric the trials are compared on
+        checkpoints: (List[int]) Resources the trials of the model are compared on, the trial
+            is trained on the ones below its full resource first
+        rung_thresholds: (dict) Objective to reach on every checkpoint, checkpoints without one are not pruned on
+        deadline: (float) Time after which no further rung is trained, no deadline if None
+        staged: (bool) whether the rungs are boosting rounds, else training row subsamples
+        stratify: (bool) whether the class ratio will be kept on the row subsamples
+
+    Returns:
+        trial: (dict) The trial with its state, the score of every rung, its objective and duration
+    """
+
+    # Loading the shared copy of the data if a path is received
+    if isinstance(data, str):
+        data = load_shared_data(data)
+    x_train, y_train, x_val, y_val = data
+    metric_function, metric_type = loss_fn_dict[metric]
+    # the objective is always maximized, losses are negated
+    sign = 1 if metric_type == "+" else -1
+    params = dict(trial["params"])
+    start_time = time.time()
+    scores = list()
+    state = "complete"
+    try:
+        # the model is trained further on every rung of boosting rounds instead of from scratch
+        total = params.pop("n_estimators", 100) if staged else x_train.shape[0]
+        resources = [resource for resource in checkpoints if resource < total] + [total]
+        model = None
+        for rung, resource in enumerate(resources):
+            if staged:
+                next_model = model_class(**params, n_estimators=resource - (resources[rung - 1] if rung else 0))
+                if model is None:
+                    next_model.fit(x_train, y_train)
+                else:
+                    continue_boosting(next_model, model, x_train, y_train)
+                model = next_model
+            else:
+                x_sample, y_sample = sample_rows(x_train, y_train, resource, stratify=stratify)
+                model = model_class(**params)
+                model.fit(x_sample, y_sample)
+            score = float(metric_function(y_val, model.predict(x_val)))
+            scores.append([resource, score])
+            if rung == len(resources) - 1:
+                break
+            # Stopping unpromising trials and every trial which reaches the deadline before the full resource
+            threshold = rung_thresholds.get(resource)
+            if (threshold is not None and sign * score < threshold) or \
+                    (deadline is not None and time.time() > deadline):
+                state = "pruned"
+                break
+    except Exception as error:
+        state = "failed"
+        trial["error"] = str(error)
+    trial.update(state=state, scores=scores, objective=sign * scores[-1][1] if scores else None,
+                 duration=time.time() - start_time)
+
+    return trial
+
+
+class ParameterSampler:
+    """
+
+    Samples the model and the parameters of every trial, either at
+    random or with a tree-structured Parzen estimator (TPE): the earlier
+    trials are split into the best fraction and the rest, and out of
+    candidates drawn around the best trials the one with the highest
+    density ratio of the best trials over the rest is taken.
+
+    """
+
+    def __init__(self, sampler="tpe", n_startup_trials=10, n_startup_model_trials=4, gamma=0.25, n_candidates=24,
+                 random_state=42):
+        """
+        Args:
+            sampler: (str) tpe or random
+            n_startup_trials: (int) Number of trials the models are sampled at random for
+            n_startup_model_trials: (int) Number of trials of a model its parameters are sampled at random for
+            gamma: (float) Fraction of the trials taken as the best trials
+            n_candidates: (int) Number of candidates drawn for every sampled item
+            random_state: (int) Seed of the sampling
+
+        """
+        assert sampler in samplers, f"Sampler not supported, choose one of {samplers}..."
+        self.sampler = sampler
+        self.n_startup_trials = n_startup_trials
+        self.n_startup_model_trials = n_startup_model_trials
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.random_generator = np.random.default_rng(random_state)
+
+    def split(self, trials):
+        """
+        Args:
+            trials: (List[dict]) Scored trials
+
+        Returns:
+            good_trials: (List[dict]) Best fraction of the trials, completed trials rank above pruned ones
+            bad_trials: (List[dict]) The other trials
+        """
+        ranked = sorted(trials, key=lambda trial: (trial["state"] == "complete", trial["objective"]), reverse=True)
+        n_good = max(1, int(math.ceil(self.gamma * len(ranked))))
+
+        return ranked[:n_good], ranked[n_good:]
+
+    def sample_model(self, model_names, trials):
+        """
+        Args:
+            model_names: (List[str]) Models which can be sampled
+            trials: (List[dict]) Scored trials of these models
+
+        Returns:
+            model_name: (str) Model of the next trial
+        """
+        if self.sampler == "random" or len(trials) < self.n_startup_trials:
+            return model_names[self.random_generator.integers(len(model_names))]
+        good_trials, bad_trials = self.split(trials)
+
+        return self.sample_choice(model_names, [trial["model"] for trial in good_trials],
+                                  [trial["model"] for trial in bad_trials])
+
+    def sample_params(self, space, trials):
+        """
+        Args:
+            space: (dict) Search space of the model
+            trials: (List[dict]) Scored trials of the model
+
+        Returns:
+            params: (dict) Parameters of the next trial
+        """
+        use_tpe = self.sampler == "tpe" and len(trials) >= self.n_startup_model_trials
+        good_trials, bad_trials = self.split(trials) if use_tpe else (list(), list())
+        params = dict()
+        for name, spec in space.items():
+            # trials with the default value of a parameter do not tell anything about it
+            good_values = [trial["params"][name] for trial in good_trials if name in trial["params"]]
+            bad_values = [trial["params"][name] for trial in bad_trials if name in trial["params"]]
+            use_parzen = use_tpe and len(good_values) > 0
+            if spec[0] == "choice":
+                params[name] = self.sample_choice(spec[1], good_values, bad_values, use_parzen)
+            else:
+                params[name] = self.sample_number(spec, good_values, bad_values, use_parzen)
+
+        return params
+
+    def sample_choice(self, items, good_items, bad_items, use_parzen=True):
+        """
+        Args:
+            items: (List) Items to choose from
+            good_items: (List) Items of the best trials
+            bad_items: (List) Items of the other trials
+            use_parzen: (bool) whether the items are weighted by the earlier trials, else drawn uniformly
+
+        Returns:
+            item: (Any) Sampled item
+        """
+        if not use_parzen:
+            return items[self.random_generator.integers(len(items))]
+        # counting every item once more so that no item is ever left out
+        good_density = np.array([good_items.count(item) + 1 for item in items], dtype=float)
+        good_density /= good_density.sum()
+        bad_density = np.array([bad_items.count(item) + 1 for item in items], dtype=float)
+        bad_density /= bad_density.sum()
+        candidates = self.random_generator.choice(len(items), self.n_candidates, p=good_density)
+        ratios = np.log(good_density[candidates]) - np.log(bad_density[candidates])
+
+        return items[candidates[np.argmax(ratios)]]
+
+    def sample_number(self, spec, good_values, bad_values, use_parzen=True):
+        """
+        Args:
+            spec: (tuple) ("int" or "float", low, high) and "log" to sample on log scale
+            good_values: (List) Values of the best trials
+            bad_values: (List) Values of the other trials
+            use_parzen: (bool) whether the value is drawn around the best trials, else uniformly
+
+        Returns:
+            value: (Any) Sampled int or float
+        """
+        kind, low, high = spec[:3]
+        log_scale = len(spec) > 3 and spec[3] == "log"
+        scale = math.log if log_scale else float
+        low, high = scale(low), scale(high)
+        if high <= low or not use_parzen:
+            value = self.random_generator.uniform(low, high)
+        else:
+            good_values = np.array([scale(value) for value in good_values])
+            bad_values = np.array([scale(value) for value in bad_values])
+            candidates = self.parzen_sample(good_values, low, high)
+            ratios = self.parzen_log_density(candidates, good_values, low, high) - \
+                self.parzen_log_density(candidates, bad_values, low, high)
+            value = candidates[np.argmax(ratios)]
+        value = math.exp(value) if log_scale else value
+        low, high = spec[1], spec[2]
+        if kind == "int":
+            return int(min(max(round(value), low), high))
+
+        # rounding away the noise of the log scale round trip
+        return float(f"{min(max(value, low), high):.6g}")
+
+    @staticmethod
+    def bandwidth(values, low, high):
+        """
+        Returns:
+            bandwidth: (float) Width of the gaussian around every value, narrower with more values
+        """
+        return (high - low) * max(len(values), 1) ** -0.2 / 3
+
+    def parzen_sample(self, values, low, high):
+        """
+        Args:
+            values: (numpy.ndarray) Values of the earlier trials on sampling scale
+            low: (float) Lower bound on sampling scale
+            high: (float) Upper bound on sampling scale
+
+        Returns:
+            candidates: (numpy.ndarray) Candidates drawn from the gaussians around the values and a uniform prior
+        """
+        components = self.random_generator.integers(len(values) + 1, size=self.n_candidates)
+        uniform = self.random_generator.uniform(low, high, size=self.n_candidates)
+        centers = np.append(values, 0.0)[components]
+        gaussian = self.random_generator.normal(centers, self.bandwidth(values, low, high))
+        # gaussian draws out of the bounds are replaced by the prior instead of piling up on the bounds
+        outside = (components == len(values)) | (gaussian < low) | (gaussian > high)
+
+        return np.where(outside, uniform, gaussian)
+
+    def parzen_log_density(self, candidates, values, low, high):
+        """
+        Args:
+            candidates: (numpy.ndarray) Candidates on sampling scale
+            values: (numpy.ndarray) Values of the earlier trials on sampling scale
+            low: (float) Lower bound on sampling scale
+            high: (float) Upper bound on sampling scale
+
+        Returns:
+            log_density: (numpy.ndarray) Log density of the mixture of the gaussians and the uniform prior
+        """
+        bandwidth = self.bandwidth(values, low, high)
+        log_components = [np.full(len(candidates), -math.log(high - low))]
+        if len(values):
+            distances = (candidates[:, None] - values[None, :]) / bandwidth
+            log_components.append(-0.5 * distances ** 2 - math.log(bandwidth * math.sqrt(2 * math.pi)))
+        log_components = np.column_stack(log_components)
+        maximum = log_components.max(axis=1)
+
+        return maximum + np.log(np.exp(log_components - maximum[:, None]).sum(axis=1)) - math.log(len(values) + 1)
+
+
+class HyperparameterSearch:
+    """
+
+    Hyperparameter search over the models of the model zoo. Every model
+    is first trained with its default arguments, then the models and
+    their parameters are sampled from the search spaces. Trials run in
+    batches on a process pool, are trained rung by rung and pruned on
+    the median of the earlier trials of the same model. Every finished
+    trial is appended to a JSON lines history, so an interrupted search
+    resumes where it stopped.
+
+    """
+
+    def __init__(self, problem_type, models, metric="accuracy_score", sampler="tpe", n_trials=50,
+                 time_budget_s=None, n_jobs=1, history_path="tuning_history.jsonl", spaces=search_spaces,
+                 reduction_factor=3, n_rungs=3, min_trials_to_prune=3, random_state=42):
+        """
+        Args:
+            problem_type: (string) The problem statement of the models
+            models: (dict) Model classes of the problem type
+            metric: (str) Metric the trials are compared on, on the validation data
+            sampler: (str) tpe or random
+            n_trials: (int) Number of trials including the resumed ones
+            time_budget_s: (float) Wall time budget of the search in seconds
+            n_jobs: (int) Number of trials trained at the same time, -1 uses all cores
+            history_path: (str) JSON lines file of the finished trials
+            spaces: (dict) Search space of every model
+            reduction_factor: (int) Growth of the resource from a rung to the next one
+            n_rungs: (int) Maximum number of rungs of a trial
+            min_trials_to_prune: (int) Number of earlier trials on a rung before trials are pruned on it
+            random_state: (int) Seed of the sampling
+
+        """
+        assert n_trials > 0, "Number of trials must be a positive integer..."
+        self.problem_type = problem_type
+        self.models = models
+        self.metric = metric
+        self.sampler = ParameterSampler(sampler=sampler, random_state=random_state)
+        self.n_trials = n_trials
+        self.time_budget_s = time_budget_s
+        self.n_jobs = n_jobs
+        self.history_path = history_path
+        self.spaces = spaces
+        self.reduction_factor = reduction_factor
+        self.n_rungs = n_rungs
+        self.min_trials_to_prune = min_trials_to_prune
+        self.trials = list()
+        self.search_key = None
+
+    def load_history(self):
+        """
+        Reads the earlier trials of the same search from the history
+
+        """
+        if self.history_path is None or not os.path.isfile(self.history_path):
+            return
+        line = "\n"
+        with open(self.history_path) as infile:
+            for line in infile:
+                try:
+                    trial = json.loads(line)
+                except json.JSONDecodeError:
+                    # an interrupted write leaves a truncated last line
+                    continue
+                if trial.get("search") == self.search_key:
+                    self.trials.append(trial)
+        if not line.endswith("\n"):
+            # ending the truncated line so that the next trial is appended on its own line
+            with open(self.history_path, "a") as outfile:
+                outfile.write("\n")
+        if self.trials:
+            cprint(f"Resuming the search from {len(self.trials)} trials of {self.history_path}", "blue")
+
+    def save_trial(self, trial):
+        """
+        Appends a finished trial to the history
+
+        Args:
+            trial: (dict) Finished trial
+
+        """
+        if self.history_path is None:
+            return
+        with open(self.history_path, "a") as outfile:
+            outfile.write(json.dumps(trial) + "\n")
+
+    def next_trial(self, number):
+        """
+        Args:
+            number: (int) Number of the trial
+
+        Returns:
+            trial: (dict) Number, model name and parameters of the trial, None if nothing is left to sample
+        """
+        model_names = list(self.models.keys())
+        if number < len(model_names):
+            # every model is trained once with its default arguments first
+            return {"search": self.search_key, "trial": number, "model": model_names[number], "params": dict()}
+        tunable_models = [model_name for model_name in model_names if self.spaces.get(model_name)]
+        if not tunable_models:
+            return None
+        scored_trials = [trial for trial in self.trials if trial["state"] != "failed"]
+        model_name = self.sampler.sample_model(
+            tunable_models, [trial for trial in scored_trials if trial["model"] in tunable_models])
+        params = self.sampler.sample_params(self.spaces[model_name],
+                                            [trial for trial in scored_trials if trial["model"] == model_name])
+
+        return {"search": self.search_key, "trial": number, "model": model_name, "params": params}
+
+    def rung_schedule(self, model_name, n_rows):
+        """
+        Args:
+            model_name: (str) Name of the model
+            n_rows: (int) Number of training rows
+
+        Returns:
+            checkpoints: (List[int]) Resources every trial of the model is compared on before its full resource
+        """
+        if model_name in boosting_models:
+            # a fixed schedule of rounds from the most rounds of the space, so that trials of any
+            # number of rounds are compared after the same number of rounds
+            spec = self.spaces.get(model_name, dict()).get("n_estimators")
+            return rung_resources(spec[2] if spec else 100, self.reduction_factor, self.n_rungs)[:-1]
+
+        return rung_resources(n_rows, self.reduction_factor, self.n_rungs, min_resource=100)[:-1]
+
+    def rung_thresholds(self, model_name, checkpoints):
+        """
+        Args:
+            model_name: (str) Name of the model
+            checkpoints: (List[int]) Resources the trials of the model are compared on
+
+        Returns:
+            thresholds: (dict) Median objective of the earlier trials of the model on every checkpoint,
+                checkpoints which too few trials reached are left out
+        """
+        sign = 1 if loss_fn_dict[self.metric][1] == "+" else -1
+        thresholds = dict()
+        for checkpoint in checkpoints:
+            # only the scores taken on the same resource are compared
+            objectives = [sign * score for trial in self.trials if trial["model"] == model_name
+                          for resource, score in trial["scores"] if resource == checkpoint]
+            if len(objectives) >= self.min_trials_to_prune:
+                thresholds[checkpoint] = float(np.median(objectives))
+
+        return thresholds
+
+    def run(self, data):
+        """
+        Args:
+            data: (tuple) (x_train, y_train, x_val, y_val)
+
+        Returns:
+            best_trial: (dict) Completed trial with the best objective, None if no trial completed
+        """
+        start_time = time.time()
+        deadline = None if self.time_budget_s is None else start_time + self.time_budget_s
+        # trials of other data, metric or search spaces are never resumed
+        self.search_key = fingerprint(data, {"problem_type": self.problem_type, "metric": self.metric,
+                                             "models": list(self.models.keys()), "spaces": self.spaces})
+        self.load_history()
+        n_workers = cpu_count() if self.n_jobs < 0 else self.n_jobs
+        shared_folder = None
+        shared_data = data
+        try:
+            if n_workers != 1:
+                shared_folder = tempfile.mkdtemp(prefix="tab_automl_")
+                # Writing a single copy of the data which is memory-mapped by every worker
+                shared_data = share_training_data(data, shared_folder)
+            number = len(self.trials)
+            while number < self.n_trials:
+                if deadline is not None and time.time() > deadline:
+                    cprint(f"Time budget of {self.time_budget_s} s reached after {number} trials", "yellow")
+                    break
+                batch = list()
+                while len(batch) < n_workers and number < self.n_trials:
+                    trial = self.next_trial(number)
+                    if trial is None:
+                        break
+                    batch.append(trial)
+                    number += 1
+                if not batch:
+                    break
+                checkpoints = {trial["model"]: self.rung_schedule(trial["model"], data[0].shape[0]) for trial in batch}
+                arguments = [(trial, self.models[trial["model"]], shared_data, self.metric, checkpoints[trial["model"]],
+                              self.rung_thresholds(trial["model"], checkpoints[trial["model"]]), deadline,
+                              trial["model"] in boosting_models, self.problem_type == "classification")
+                             for trial in batch]
+                if n_workers == 1:
+                    results = [run_trial(*argument) for argument in arguments]
+                else:
+                    results = Parallel(n_jobs=n_workers)(delayed(run_trial)(*argument) for argument in arguments)
+                for trial in results:
+                    self.trials.append(trial)
+                    self.save_trial(trial)
+                    score = f"{trial['scores'][-1][1]:.5f}" if trial["scores"] else "-"
+                    print(f"Trial {trial['trial']} {trial['model']} {trial['state']} : {self.metric} = {score} "
+                          f"({trial['duration']:.2f} s) {trial['params']}")
+        finally:
+            # the shared copy is removed even if a worker failed
+            if shared_folder is not None:
+                shutil.rmtree(shared_folder, ignore_errors=True)
+        completed_trials = [trial for trial in self.trials if trial["state"] == "complete"]
+        states = [trial["state"] for trial in self.trials]
+        print(f"Search finished : {states.count('complete')} completed, {states.count('pruned')} pruned, "
+              f"{states.count('failed')} failed trials in {time.time() - start_time:.2f} s")
+
+        return max(completed_trials, key=lambda trial: trial["objective"]) if completed_trials else None
@@ -2,12 +2,28 @@
 This is the main executable file
 """
 import argparse
-from tab_automl.automl import datasets, processing, fet_engineering, training
-from tab_automl.utils.misc import validate_parser_variable
-from tab_automl.utils.training import train_validation_split
+import sys
+# the pipeline modules import pandas and the model libraries, they are imported
+# inside the functions so that --help and argument errors return immediately
+
+class SingleLineUsageFormatter(argparse.HelpFormatter):
+    """
+
+    Help formatter which keeps the usage on a single line, argparse
+    fails to wrap the usage of options with an empty metavar
+
+    """
+
+    def _format_usage(self, usage, actions, groups, prefix):
+        width, self._width = self._width, sys.maxsize
+        try:
+            return super()._format_usage(usage, actions, groups, prefix)
+        finally:
+            self._width = width
+
 
 # Defining parser
-parser = argparse.ArgumentParser(description="automl hyper parameters")
+parser = argparse.ArgumentParser(description="automl hyper parameters", formatter_class=SingleLineUsageFormatter)
 parser.add_argument("-d", "--data-source", type=str, required=True, metavar="", help="File path")
 parser.add_argument("-t", "--problem-type", type=str, required=True, metavar="",
                     help="Problem Type , currently supporting *regression* or *classification*")
@@ -23,6 +39,183 @@ parser.add_argument("-sfd", "--save-fet-data", type=str, default="true", metavar
                     help="Save the feature engineered data")
 parser.add_argument("-sm", "--save-model", type=str, default="true", metavar="",
                     help="Save the best trained model")
+parser.add_argument("-sf", "--save-format", type=str, default="csv", metavar="",
+                    help="Format of the saved processed and feature engineered data, csv, parquet or feather")
+parser.add_argument("-fc", "--feature-columns", type=str, default=None, metavar="",
+                    help="Comma separated feature columns, only these and the target feature are read")
+parser.add_argument("-om", "--optimize-memory", type=str, default="false", metavar="",
+                    help="Downcast numerical columns and turn low-cardinality text columns into category")
+parser.add_argument("-cs", "--chunk-size", type=int, default=None, metavar="",
+                    help="Stream the data source in chunks of this many rows and train on a subsample")
+parser.add_argument("-ss", "--sample-size", type=int, default=100000, metavar="",
+                    help="Number of rows kept in memory when the data source is streamed")
+parser.add_argument("-j", "--n-jobs", type=int, default=1, metavar="",
+                    help="Number of models trained and of columns processed in parallel, -1 uses all cores")
+parser.add_argument("-tb", "--time-budget", type=float, default=None, metavar="",
+                    help="Wall time budget of the model search in seconds")
+parser.add_argument("-sh", "--successive-halving", type=str, default="false", metavar="",
+                    help="Race the models on growing row subsamples instead of training all of them on full data")
+parser.add_argument("-so", "--sparse-one-hot", type=str, default="false", metavar="",
+                    help="Build the one hot columns as a single sparse matrix instead of dense dummy columns")
+parser.add_argument("-e", "--engine", type=str, default="pandas", metavar="",
+                    help="Compute engine of data loading, processing and feature engineering, pandas or polars")
+parser.add_argument("-tss", "--train-score-size", type=int, default=None, metavar="",
+                    help="Score the training metrics on a random subsample of this many rows instead of all rows")
+parser.add_argument("-cv", "--cv-folds", type=int, default=None, metavar="",
+                    help="Pick the model on k-fold cross validation instead of a single validation split")
+parser.add_argument("-cd", "--cache-dir", type=str, default="tab_automl_cache", metavar="",
+                    help="Directory of the cached outputs of data loading, processing, feature engineering and models")
+parser.add_argument("-nc", "--no-cache", type=str, default="false", metavar="",
+                    help="Run every stage from scratch without reading or writing the cache")
+parser.add_argument("-cms", "--cache-max-size", type=float, default=1024, metavar="",
+                    help="Size limit of the cache in megabytes, the least recently used outputs are evicted")
+parser.add_argument("-hs", "--hyperparameter-search", type=str, default="false", metavar="",
+                    help="Search the hyperparameters of the models instead of training them with default arguments")
+parser.add_argument("-nt", "--n-trials", type=int, default=50, metavar="",
+                    help="Number of trials of the hyperparameter search")
+parser.add_argument("-smp", "--sampler", type=str, default="tpe", metavar="",
+                    help="Sampler of the hyperparameter search, tpe or random")
+parser.add_argument("-th", "--tuning-history", type=str, default="tuning_history.jsonl", metavar="",
+                    help="JSON lines file the trials are appended to, an interrupted search resumes from it")
+parser.add_argument("-tm", "--telemetry", type=str, default=None, metavar="",
+                    help="JSON lines file the timing events of every stage, column decision and model are appended to")
+parser.add_argument("-inc", "--incremental", type=str, default="false", metavar="",
+                    help="Update the saved pipeline with the new rows of the data source instead of training from zero")
+parser.add_argument("-pp", "--previous-pipeline", type=str, default="inference_pipeline.pkl", metavar="",
+                    help="Saved inference pipeline updated by the incremental training")
+parser.add_argument("-ir", "--incremental-rounds", type=int, default=100, metavar="",
+                    help="Number of boosting rounds added to a boosting model by the incremental training")
+parser.add_argument("-es", "--ensemble-size", type=int, default=0, metavar="",
+                    help="Selection rounds of a weighted ensemble of the trained models, 0 keeps the single best model")
+parser.add_argument("-ooc", "--out-of-core", type=str, default="false", metavar="",
+                    help="Train on every chunk of the data source from disk, requires the chunk size")
+parser.add_argument("-ep", "--epochs", type=int, default=3, metavar="",
+                    help="Passes over the rows of the out-of-core models trained block by block")
+
+
+def load_dataset(args, columns, optimize_memory, table_name=None):
+    """
+    Args:
+        args: (argparse.Namespace) arguments parsed by main file
+        columns: (List) Columns to read from the source, all columns are read if None
+        optimize_memory: (bool) whether the dtypes will be shrunk after loading
+        table_name: (str) Table to read from a sqlite database
+
+    Returns:
+        dataset: (Any) Dataset of the problem type
+    """
+    from tab_automl.automl import datasets
+
+    if args.chunk_size is not None:
+        # Streaming the data source when it is larger than memory
+        return datasets.StreamingDataset(args.data_source, chunk_size=args.chunk_size,
+                                         sample_size=args.sample_size, table_name=table_name,
+                                         optimize_memory=optimize_memory, columns=columns)
+    elif args.problem_type == "classification":
+        return datasets.ClassificationDataset(args.data_source, optimize_memory=optimize_memory,
+                                              columns=columns, engine=args.engine, table_name=table_name)
+    return datasets.RegressionDataset(args.data_source, optimize_memory=optimize_memory,
+                                      columns=columns, engine=args.engine, table_name=table_name)
+
+
+def incremental_training(args, x, y):
+    """
+    Updates the statistics of the saved transforms with the new rows only and trains
+    the saved model further on them, the updated pipeline replaces the saved one
+
+    Args:
+        args: (argparse.Namespace) arguments parsed by main file
+        x: (pandas.DataFrame) Feature set of the new rows
+        y: (pandas.DataFrame) Target feature of the new rows
+
+    """
+    from tab_automl.automl import training
+    from tab_automl.automl.inference import InferencePipeline
+    from tab_automl.utils.fet_engineering import UNSEEN_CATEGORY_CODE
+    from tab_automl.utils.telemetry import telemetry
+    from tab_automl.utils.training import train_validation_split
+
+    pipeline = InferencePipeline.load(args.previous_pipeline)
+    # rows with null target can not be used for training
+    target_rows = y.notna().all(axis=1).to_numpy()
+    x, y = x[target_rows], y[target_rows]
+    print(f"Updating {args.previous_pipeline} with {x.shape[0]} new records...")
+    with telemetry.span("preprocessing", rows=x.shape[0], incremental=True):
+        x = pipeline.update(x)
+    if pipeline.target_encoding is not None:
+        codes = pipeline.target_encoding.transform(y[args.target_feature])
+        assert (codes != UNSEEN_CATEGORY_CODE).all(), \
+            "New target items found, the models have to be trained on the whole history..."
+        y[args.target_feature] = codes
+    x_train, y_train, x_val, y_val = train_validation_split(x, y)
+    trainer = training.Trainer(problem_type=args.problem_type, train_score_size=args.train_score_size)
+    metric = "accuracy_score" if args.problem_type == "classification" else "mse"
+    save_model = args.save_model == "true"
+    with telemetry.span("training", rows=x.shape[0], incremental=True):
+        trainer.incremental_trainer(pipeline.model, x_train, y_train, x_val, y_val, metric_list=[metric],
+                                    result_monitor=metric, save_model=save_model, n_rounds=args.incremental_rounds)
+    if save_model and trainer.best_model is not None:
+        pipeline.model = trainer.best_model
+        pipeline.save(args.previous_pipeline)
+
+
+def training_chunks(args, dataset, transforms, x_features, target_encoding):
+    """
+    Args:
+        args: (argparse.Namespace) arguments parsed by main file
+        dataset: (StreamingDataset) Dataset streaming the data source
+        transforms: (List) Transforms fitted on the subsample
+        x_features: (List) Columns of the feature set
+        target_encoding: (LabelEncoding) Label encoding of the target, None if the target is numerical
+
+    Returns:
+        chunks: (Iterator[tuple]) Feature matrix and target feature of every chunk, as received by the models
+    """
+    from tab_automl.automl.inference import InferencePipeline
+    from tab_automl.utils.fet_engineering import UNSEEN_CATEGORY_CODE
+
+    pipeline = InferencePipeline(transforms, None, input_columns=x_features)
+    for x, y in dataset.iter_x_and_y(feature_set_columns=x_features, target_column=args.target_feature):
+        y = y[args.target_feature]
+        # rows with null target can not be used for training
+        target_rows = y.notna().to_numpy()
+        x, y = x[target_rows], y[target_rows]
+        if args.problem_type == "classification" and y.dtype in ("float32", "float64"):
+            y = y.astype(int)
+        if target_encoding is not None:
+            y = target_encoding.transform(y)
+            # target items missing from the subsample are left out, the models only know the sampled ones
+            known_rows = (y != UNSEEN_CATEGORY_CODE).to_numpy()
+            x, y = x[known_rows], y[known_rows]
+        if x.shape[0] > 0:
+            yield pipeline.transform(x), y.to_numpy()
+
+
+def fit_stage(stage):
+    """
+    Args:
+        stage: (Any) PreProcessing or FeatureEngineering
+
+    Returns:
+        stage: (Any) The fitted stage, holding its outputs and its transformer
+    """
+    stage.run()
+
+    return stage
+
+
+def run_stage(cache, stage_name, key, function):
+    """
+    Args:
+        cache: (StageCache) Cache of the stage outputs, the stage always runs if None
+        stage_name: (str) Name of the stage
+        key: (str) Fingerprint of the stage inputs and parameters
+        function: (Any) Callable running the stage
+
+    Returns:
+        output: (Any) Cached or computed output of the stage
+    """
+    return function() if cache is None else cache.cached(stage_name, key, function)
 
 
 # Main function
@@ -32,13 +225,40 @@ def main():
     print(f"Parser data collected...")
     # Validating parser variables
     print(f"Parsed Data : {args}")
+    from tab_automl.utils.misc import validate_parser_variable
+
     validate_parser_variable(args)
     print(f"Parser variables validated successfully...")
+    from tab_automl.automl import processing, fet_engineering, training
+    from tab_automl.automl.inference import InferencePipeline
+    from tab_automl.utils.cache import StageCache, file_fingerprint, fingerprint
+    from tab_automl.utils.telemetry import StageSummary, telemetry
+    from tab_automl.utils.training import train_validation_split
+
+    # Recording the timing events of the stages, the spans cost nothing while the telemetry is disabled
+    stage_summary = None
+    if args.telemetry is not None:
+        stage_summary = StageSummary()
+        telemetry.enable(args.telemetry, callback=stage_summary)
+    optimize_memory = args.optimize_memory == "true"  # Defining the dtype optimization
+    # Defining the columns read from the source, all columns are read if not given
+    columns = None
+    if args.feature_columns is not None:
+        columns = [feature.strip() for feature in args.feature_columns.split(",")] + [args.target_feature]
+    # Asking the table of a sqlite source up front, it is a part of the key of the loaded data
+    table_name = input("table name :") if args.data_source.endswith(".sqlite") else None
+    # Defining the cache of the stage outputs, every stage key chains the key of its input data
+    cache = None
+    data_key = None
+    if args.no_cache == "false":
+        cache = StageCache(args.cache_dir, max_size_mb=args.cache_max_size)
+        data_key = fingerprint(file_fingerprint(args.data_source),
+                               {"columns": columns, "optimize_memory": optimize_memory, "engine": args.engine,
+                                "chunk_size": args.chunk_size, "sample_size": args.sample_size,
+                                "problem_type": args.problem_type, "table_name": table_name})
     # Feeding the data to the class of respective problem statement.
-    if args.problem_type == "classification":
-        dataset = datasets.ClassificationDataset(args.data_source)
-    else:
-        dataset = datasets.RegressionDataset(args.data_source)
+    with telemetry.span("load"):
+        dataset = run_stage(cache, "dataset", data_key, lambda: load_dataset(args, columns, optimize_memory, table_name))
 
     # Accessing the feature names to validate the X and y of the data
     features = dataset.data.columns.tolist()
@@ -59,33 +279,90 @@ def main():
             # Updating all feature variable to integers for training purpose
             y[args.target_feature] = y[args.target_feature].astype(int)
 
+    if args.incremental == "true":
+        # Only the new rows are processed, the saved pipeline holds the statistics of the earlier ones
+        incremental_training(args, x, y)
+        if stage_summary is not None:
+            stage_summary.report()
+            telemetry.disable()
+        print(f"AutoML executed successfully...\n")
+        return
+
+    # Fitted transforms which are saved together with the best model
+    transforms = list()
+    target_encoding = None
+    if cache is not None:
+        data_key = fingerprint(data_key, {"features": x_features, "target": args.target_feature})
     if args.pre_proc == "true":
         # Defining data processing class
-        processor = processing.PreProcessing(x, y)
-        # processing data
-        x, y = processor.run()
+        processor = processing.PreProcessing(x, y, engine=args.engine, n_jobs=args.n_jobs)
+        # processing data, or loading the processed data of an earlier run
+        if cache is not None:
+            data_key = fingerprint(data_key, {"stage": "preprocessing"})
+        processor = run_stage(cache, "preprocessing", data_key, lambda: fit_stage(processor))
+        x, y = processor.x, processor.y
+        transforms.append(processor.transformer)
         # Saving the processed data if required
         if args.save_proc_data == "true":
-            processor.save_data()
+            processor.save_data(save_format=args.save_format)
 
     if args.fet_eng == "true":
         # Defining the feature engineering class
-        feature_engineer = fet_engineering.FeatureEngineering(x, y)
-        # engineering features
-        x, y = feature_engineer.run()
+        feature_engineer = fet_engineering.FeatureEngineering(x, y, sparse_one_hot=args.sparse_one_hot == "true",
+                                                              engine=args.engine, n_jobs=args.n_jobs)
+        # engineering features, or loading the engineered data of an earlier run
+        if cache is not None:
+            data_key = fingerprint(data_key, {"stage": "feature engineering",
+                                              "sparse_one_hot": args.sparse_one_hot})
+        feature_engineer = run_stage(cache, "feature_engineering", data_key, lambda: fit_stage(feature_engineer))
+        x, y = feature_engineer.x, feature_engineer.y
+        transforms.append(feature_engineer.transformer)
+        target_encoding = feature_engineer.transformer.target_encoding
         # Saving the feature engineered data if required
         if args.save_fet_data == "true":
-            feature_engineer.save_data()
-
-    # Creating a validation data split from training data
-    x_train, y_train, x_val, y_val = train_validation_split(x, y)
+            feature_engineer.save_data(save_format=args.save_format)
 
     # Defining trainer
-    trainer = training.Trainer(problem_type=args.problem_type)
+    trainer = training.Trainer(problem_type=args.problem_type, cache=cache, train_score_size=args.train_score_size)
     # Training models on the data
     save_model = args.save_model == "true"  # Defining the model saving
-    trainer.single_model_trainer(x_train, y_train, x_val, y_val, save_model=save_model)
+    if args.out_of_core == "true":
+        # Only the subsample is held in memory, the models read every chunk from disk
+        x_train = None
+    elif args.cv_folds is None:
+        # Creating a validation data split from training data, the folds take its place on cross validation
+        x_train, y_train, x_val, y_val = train_validation_split(x, y)
+    with telemetry.span("training", rows=x.shape[0]):
+        if args.out_of_core == "true":
+            metric = "accuracy_score" if args.problem_type == "classification" else "mse"
+            trainer.out_of_core_trainer(training_chunks(args, dataset, transforms, x_features, target_encoding),
+                                        metric_list=[metric], result_monitor=metric, save_model=save_model,
+                                        n_epochs=args.epochs, block_rows=args.chunk_size)
+        elif args.cv_folds is not None:
+            # Every record is used for validation once
+            trainer.cross_validation_trainer(x, y, save_model=save_model, n_jobs=args.n_jobs,
+                                             n_folds=args.cv_folds)
+        elif args.hyperparameter_search == "true":
+            trainer.hyperparameter_search_trainer(x_train, y_train, x_val, y_val, save_model=save_model,
+                                                  n_jobs=args.n_jobs, n_trials=args.n_trials, sampler=args.sampler,
+                                                  time_budget_s=args.time_budget, history_path=args.tuning_history)
+        elif args.successive_halving == "true":
+            trainer.successive_halving_trainer(x_train, y_train, x_val, y_val, save_model=save_model,
+                                               n_jobs=args.n_jobs)
+        else:
+            trainer.single_model_trainer(x_train, y_train, x_val, y_val, save_model=save_model,
+                                         n_jobs=args.n_jobs, time_budget_s=args.time_budget,
+                                         ensemble_size=args.ensemble_size)
+
+    if save_model and trainer.best_model is not None:
+        # Saving the fitted transforms together with the best model for batch prediction
+        pipeline = InferencePipeline(transforms, trainer.best_model, input_columns=x_features,
+                                     target_column=args.target_feature, target_encoding=target_encoding)
+        pipeline.save()
 
+    if stage_summary is not None:
+        stage_summary.report()
+        telemetry.disable()
     print(f"AutoML executed successfully...\n")
 
 
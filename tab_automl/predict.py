@@ -0,0 +1,39 @@
+"""
+This is the batch prediction executable file
+"""
+import argparse
+import os
+
+from tab_automl.automl.inference import InferencePipeline
+
+# Defining parser
+parser = argparse.ArgumentParser(description="automl batch prediction")
+parser.add_argument("-d", "--data-source", type=str, required=True, metavar="", help="File path of the new data")
+parser.add_argument("-m", "--pipeline", type=str, default="inference_pipeline.pkl", metavar="",
+                    help="Saved inference pipeline")
+parser.add_argument("-o", "--output", type=str, default="predictions.csv", metavar="",
+                    help="CSV file the predictions are written into")
+parser.add_argument("-cs", "--chunk-size", type=int, default=100000, metavar="",
+                    help="Number of records predicted at once")
+
+
+# Main function
+def main():
+    # Retrieving parser variables
+    args = parser.parse_args()
+    print(f"Parsed Data : {args}")
+    # Validating parser variables
+    assert os.path.isfile(args.data_source), "Invalid data source, data source is not found..."
+    assert os.path.isfile(args.pipeline), "Invalid pipeline, pipeline is not found..."
+    assert args.chunk_size > 0, "Chunk size must be a positive integer..."
+    table_name = input("table name :") if args.data_source.endswith(".sqlite") else None
+    # Loading the fitted transforms and the best model once
+    pipeline = InferencePipeline.load(args.pipeline)
+    # Predicting the data chunk by chunk
+    row_count = pipeline.predict_file(args.data_source, output_path=args.output, chunk_size=args.chunk_size,
+                                      table_name=table_name)
+    print(f"{row_count} predictions saved at {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
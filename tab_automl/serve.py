@@ -0,0 +1,41 @@
+"""
+This is the prediction server executable file
+"""
+import argparse
+import asyncio
+import os
+
+from tab_automl.automl.inference import InferencePipeline
+from tab_automl.automl.serving import InferenceServer
+
+# Defining parser
+parser = argparse.ArgumentParser(description="automl prediction server")
+parser.add_argument("-m", "--pipeline", type=str, default="inference_pipeline.pkl", metavar="",
+                    help="Saved inference pipeline")
+parser.add_argument("-H", "--host", type=str, default="127.0.0.1", metavar="", help="Interface of the server")
+parser.add_argument("-p", "--port", type=int, default=8000, metavar="", help="Port of the server")
+parser.add_argument("-u", "--unix-socket", type=str, default=None, metavar="",
+                    help="Serve on this Unix socket path instead of the TCP port")
+parser.add_argument("-bs", "--max-batch-size", type=int, default=4096, metavar="",
+                    help="Maximum number of records of concurrent requests predicted at once")
+parser.add_argument("-bw", "--max-batch-wait", type=float, default=5, metavar="",
+                    help="Milliseconds a request waits for other requests to share its batch")
+
+
+# Main function
+def main():
+    # Retrieving parser variables
+    args = parser.parse_args()
+    print(f"Parsed Data : {args}")
+    # Validating parser variables
+    assert os.path.isfile(args.pipeline), "Invalid pipeline, pipeline is not found..."
+    assert args.max_batch_size > 0, "Maximum batch size must be a positive integer..."
+    assert args.max_batch_wait >= 0, "Maximum batch wait must not be negative..."
+    # Loading the fitted transforms and the best model once for all requests
+    pipeline = InferencePipeline.load(args.pipeline)
+    server = InferenceServer(pipeline, max_batch_records=args.max_batch_size, max_wait_ms=args.max_batch_wait)
+    asyncio.run(server.serve(host=args.host, port=args.port, unix_socket=args.unix_socket))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+This file holds the on-disk cache of the stage outputs of the AutoML run.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Changing the layout of any cached output requires a new version, older entries are then never hit
+cache_version = 1
+# Size of the blocks a data source file is hashed on
+hash_block_size = 1 << 20
+
+
+def describe(value):
+    """
+    Args:
+        value: (Any) Stage parameter which is not a plain json item
+
+    Returns:
+        description: (str) Stable description of the parameter e.g. the import path of a model class
+    """
+    if isinstance(value, type):
+        return f"{value.__module__}.{value.__qualname__}"
+    return repr(value)
+
+
+def update_hash(digest, value):
+    """
+    Feeds a value into a hash, data is hashed on its buffers without pickling it
+
+    Args:
+        digest: (hashlib.blake2b) Hash being built
+        value: (Any) Dataframe, series, numpy array, sparse matrix, sequence of those or stage parameters
+
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        # the column names and dtypes are part of the data, not only the items
+        update_hash(digest, [[str(column) for column in frame.columns], [str(dtype) for dtype in frame.dtypes]])
+        # hashing every row with the vectorized hash of pandas, index included
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        update_hash(digest, [str(value.dtype), value.shape])
+        digest.update(np.ascontiguousarray(value).ravel().view(np.uint8).data if value.dtype != object
+                      else pd.util.hash_array(value.ravel()).tobytes())
+    elif sparse.issparse(value):
+        value = value.tocsr()
+        update_hash(digest, ["sparse", value.shape])
+        for array in (value.data, value.indices, value.indptr):
+            update_hash(digest, array)
+    elif isinstance(value, (list, tuple)) and any(isinstance(item, (pd.DataFrame, pd.Series, np.ndarray))
+                                                  or sparse.issparse(item) for item in value):
+        for item in value:
+            update_hash(digest, item)
+    else:
+        # stage parameters, sorted keys keep the hash independent of the argument order
+        digest.update(json.dumps(value, sort_keys=True, default=describe).encode())
+
+
+def fingerprint(*values):
+    """
+    Args:
+        values: (Any) Data and parameters of a stage, see update_hash
+
+    Returns:
+        key: (str) Hex digest of all values, the same values always give the same key
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    update_hash(digest, cache_version)
+    for value in values:
+        update_hash(digest, value)
+
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """
+    Args:
+        path: (str) File path of a data source
+
+    Returns:
+        key: (str) Hex digest of the file content, the file is read block by block
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(hash_block_size), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+
+    Content addressed on-disk cache of stage outputs. Every output is
+    written to its own file named by the stage and the key of its
+    inputs, hits mark the file as recently used and the least recently
+    used files are evicted once the folder grows over its size limit.
+
+    """
+
+    def __init__(self, folder, max_size_mb=1024):
+        """
+        Args:
+            folder: (str) Directory the cached outputs are written to
+            max_size_mb: (float) Size limit of the directory in megabytes
+
+        """
+        self.folder = folder
+        self.max_size = max_size_mb * (1 << 20)
+        os.makedirs(folder, exist_ok=True)
+        # the size limit may have been lowered since the last run
+        self.evict()
+
+    def path(self, stage, key):
+        """
+        Args:
+            stage: (str) Name of the stage
+            key: (str) Fingerprint of the stage inputs
+
+        Returns:
+            path: (str) File path of the cached output
+        """
+        return os.path.join(self.folder, f"{stage}-{key}.joblib")
+
+    def contains(self, stage, key):
+        """
+        Args:
+            stage: (str) Name of the stage
+            key: (str) Fingerprint of the stage inputs
+
+        Returns:
+            (bool) whether an output is cached, without loading it
+        """
+        return os.path.isfile(self.path(stage, key))
+
+    def load(self, stage, key):
+        """
+        Args:
+            stage: (str) Name of the stage
+            key: (str) Fingerprint of the stage inputs
+
+        Returns:
+            hit: (bool) whether the output was found
+            value: (Any) Cached output, None on a miss
+        """
+        path = self.path(stage, key)
+        try:
+            value = joblib.load(path)
+        except FileNotFoundError:
+            return False, None
+        except Exception:
+            # unreadable entries e.g. written by other library versions are dropped
+            self.remove(path)
+            return False, None
+        # marking the entry as recently used for the eviction
+        os.utime(path)
+
+        return True, value
+
+    def save(self, stage, key, value):
+        """
+        Writes an output and evicts the least recently used outputs over the size limit
+
+        Args:
+            stage: (str) Name of the stage
+            key: (str) Fingerprint of the stage inputs
+            value: (Any) Output of the stage, anything picklable
+
+        """
+        # writing on a temporary file first so that a crash never leaves a broken entry
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        os.close(file_descriptor)
+        try:
+            joblib.dump(value, temporary_path)
+            os.replace(temporary_path, self.path(stage, key))
+        except Exception:
+            self.remove(temporary_path)
+            raise
+        self.evict()
+
+    def cached(self, stage, key, function):
+        """
+        Args:
+            stage: (str) Name of the stage
+            key: (str) Fingerprint of the stage inputs
+            function: (Any) Callable computing the output on a miss
+
+        Returns:
+            value: (Any) Cached or computed output of the stage
+        """
+        hit, value = self.load(stage, key)
+        if hit:
+            print(f"{stage} loaded from cache...")
+            return value
+        value = function()
+        self.save(stage, key, value)
+
+        return value
+
+    def evict(self):
+        """
+        Removes the least recently used outputs until the cache fits in its size limit
+
+        """
+        entries = list()
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.name.endswith(".joblib"):
+                status = entry.stat()
+                entries.append((status.st_mtime_ns, status.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        # the oldest used entries go first
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self.remove(path)
+            total_size -= size
+
+    @staticmethod
+    def remove(path):
+        """
+        Args:
+            path: (str) File path to be removed, a missing file is ignored
+
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,3 +1,326 @@
 """
 This file holds all utilities of datasets.
-"""
\ No newline at end of file
+"""
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from tab_automl.utils.engines import get_engine
+
+# Formats the processed and feature engineered data can be written on
+save_formats = ["csv", "parquet", "feather"]
+
+
+def read_data(path, columns=None, table_name=None, engine="pandas"):
+    """
+    Reads the whole data source, only the given columns are read
+    from disk on the formats which support column projection
+
+    Args:
+        path: (str) File path
+        columns: (List) Columns to keep, all columns are kept if None
+        table_name: (str) Table to read from a sqlite database, asked if not given
+        engine: (str) Compute engine csv and parquet sources are parsed on, pandas or polars
+
+    Returns:
+        data: (pandas.DataFrame) Records of the data source
+    """
+
+    if engine != "pandas" and (path.endswith(".csv") or path.endswith(".parquet")):
+        # scanning lazily on the columnar engine, the other formats are read by pandas
+        data = get_engine(engine).scan(path, os.path.splitext(path)[1][1:], columns=columns)
+    elif path.endswith(".txt"):
+        data = pd.read_table(path, delimiter='\s', usecols=columns)
+    elif path.endswith(".json"):
+        data = pd.read_json(path)
+    elif path.endswith(".xlsx"):
+        data = pd.read_excel(path, usecols=columns)
+    elif path.endswith(".sqlite"):
+        if table_name is None:
+            table_name = input("table name :")
+        db = sqlite3.connect(path)
+        selected_columns = ", ".join(f'"{column}"' for column in columns) if columns else "*"
+        data = pd.read_sql_query(f'Select {selected_columns} from {table_name}', db)
+    elif path.endswith(".csv"):
+        data = pd.read_csv(path, usecols=columns)
+    elif path.endswith(".parquet"):
+        # memory-mapping the file instead of reading it into a buffer first
+        data = pd.read_parquet(path, columns=columns, memory_map=True)
+    elif path.endswith(".feather"):
+        from pyarrow import feather
+        # memory-mapped arrow read, the arrow buffers are released column by column while converting
+        data = feather.read_table(path, columns=columns, memory_map=True).to_pandas(split_blocks=True,
+                                                                                     self_destruct=True)
+    else:
+        raise TypeError(f"File type not supported : {path}")
+
+    return data[columns] if columns else data
+
+
+def write_data(data, file_name, save_format="csv"):
+    """
+    Writes a dataframe into the working directory on the required format
+
+    Args:
+        data: (pandas.DataFrame) Dataframe to be written
+        file_name: (str) Name of the file without extension
+        save_format: (str) One of csv, parquet or feather
+
+    Returns:
+        output_path: (str) Path of the written file
+    """
+
+    output_path = os.path.join(os.getcwd(), f"{file_name}.{save_format}")
+    if save_format != "csv":
+        # arrow formats only store text column names e.g. for dummy columns of numerical items
+        data = data.set_axis(data.columns.astype(str), axis=1)
+        # arrow formats have no sparse type, sparse columns are written as regular columns
+        if any(isinstance(dtype, pd.SparseDtype) for dtype in data.dtypes):
+            data = pd.DataFrame({feature: column.sparse.to_dense() if isinstance(column.dtype, pd.SparseDtype)
+                                 else column for feature, column in data.items()})
+    if save_format == "csv":
+        data.to_csv(output_path, index=False)
+    elif save_format == "parquet":
+        data.to_parquet(output_path, index=False)
+    elif save_format == "feather":
+        # feather only stores the default index
+        data.reset_index(drop=True).to_feather(output_path)
+    else:
+        raise TypeError(f"Save format not supported : {save_format}")
+
+    return output_path
+
+
+def read_data_chunks(path, chunk_size, columns=None, table_name=None):
+    """
+    Reads the data source lazily in fixed-size chunks of rows
+
+    Args:
+        path: (str) File path
+        chunk_size: (int) Number of rows on every chunk
+        columns: (List) Columns to keep, all columns are kept if None
+        table_name: (str) Table to read from a sqlite database
+
+    Returns:
+        chunks: (Iterator[pandas.DataFrame]) Chunks of the data source
+    """
+
+    if path.endswith(".txt"):
+        chunks = pd.read_table(path, delimiter='\s', chunksize=chunk_size, usecols=columns)
+    elif path.endswith(".json"):
+        # Only line delimited json records can be read in chunks
+        chunks = pd.read_json(path, lines=True, chunksize=chunk_size)
+    elif path.endswith(".sqlite"):
+        db = sqlite3.connect(path)
+        selected_columns = ", ".join(f'"{column}"' for column in columns) if columns else "*"
+        chunks = pd.read_sql_query(f'Select {selected_columns} from {table_name}', db, chunksize=chunk_size)
+    elif path.endswith(".csv"):
+        chunks = pd.read_csv(path, chunksize=chunk_size, usecols=columns)
+    elif path.endswith(".parquet"):
+        from pyarrow import parquet
+        # reading only the required columns, batch by batch
+        batches = parquet.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_size, columns=columns)
+        chunks = (batch.to_pandas() for batch in batches)
+    elif path.endswith(".feather"):
+        chunks = _read_feather_chunks(path, chunk_size, columns)
+    else:
+        raise TypeError(f"File type not supported for chunked reading : {path}")
+
+    for chunk in chunks:
+        yield chunk[columns] if columns else chunk
+
+
+def optimize_dtypes(data, category_ratio=0.5, verbose=True):
+    """
+    Shrinks the memory of a dataframe without changing its values.
+    Integer columns are downcast to the smallest integer width, float
+    columns to float32 when it is lossless and low-cardinality text
+    columns are turned into category.
+
+    Args:
+        data: (pandas.DataFrame) Dataframe to optimize
+        category_ratio: (float) Maximum ratio of unique items and rows to turn a text column into category
+        verbose: (bool) whether the memory before and after will be printed per column
+
+    Returns:
+        data: (pandas.DataFrame) Dataframe with optimized dtypes
+    """
+
+    memory_before = data.memory_usage(deep=True, index=False)
+    optimized_columns = dict()
+    for feature in data.columns:
+        series = data[feature]
+        if pd.api.types.is_integer_dtype(series):
+            optimized_columns[feature] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            downcast_series = series.astype(np.float32)
+            # Keeping float64 when float32 can not hold the exact values
+            if np.array_equal(downcast_series.to_numpy(dtype=np.float64), series.to_numpy(dtype=np.float64),
+                              equal_nan=True):
+                optimized_columns[feature] = downcast_series
+        elif series.dtype == "object":
+            unique_items = pd.unique(series.dropna())
+            if len(unique_items) <= category_ratio * len(series) and \
+                    all(isinstance(item, str) for item in unique_items):
+                # Keeping the categories on the order of appearance like the unique items of the text column
+                optimized_columns[feature] = pd.Series(pd.Categorical(series, categories=unique_items),
+                                                       index=series.index, name=feature)
+    # Replacing the optimized columns on a shallow copy to avoid duplicating the untouched ones
+    data = data.copy(deep=False)
+    for feature, series in optimized_columns.items():
+        data[feature] = series
+    memory_after = data.memory_usage(deep=True, index=False)
+
+    if verbose:
+        print(f"Memory optimization :")
+        for feature in data.columns:
+            print(f"{feature} : {memory_before[feature] / 1024 ** 2:.3f} MB -> "
+                  f"{memory_after[feature] / 1024 ** 2:.3f} MB ({data[feature].dtype})")
+        print(f"Total memory : {memory_before.sum() / 1024 ** 2:.3f} MB -> {memory_after.sum() / 1024 ** 2:.3f} MB")
+
+    return data
+
+
+def _read_feather_chunks(path, chunk_size, columns=None):
+    """
+    Reads the record batches of a memory-mapped feather file one by one,
+    batches larger than the chunk size are sliced
+
+    Args:
+        path: (str) File path
+        chunk_size: (int) Maximum number of rows on every chunk
+        columns: (List) Columns to keep, all columns are kept if None
+
+    Returns:
+        chunks: (Iterator[pandas.DataFrame]) Chunks of the data source
+    """
+
+    import pyarrow
+    from pyarrow import ipc
+
+    reader = ipc.open_file(pyarrow.memory_map(path))
+    for batch_index in range(reader.num_record_batches):
+        batch = reader.get_batch(batch_index)
+        if columns:
+            batch = batch.select(columns)
+        for offset in range(0, batch.num_rows, chunk_size):
+            yield batch.slice(offset, chunk_size).to_pandas()
+
+
+class ColumnStatistics:
+    """
+
+    Accumulates column statistics chunk by chunk so that they are
+    computed in a single pass over data sources larger than memory.
+    A uniform random sample of rows is kept on the way, it serves as
+    the median sketch of the numerical columns and as the in-memory
+    subsample of the data source.
+
+    """
+
+    def __init__(self, sample_size=100000, max_unique_tracked=10000, random_state=42):
+        """
+        Args:
+            sample_size: (int) Maximum number of rows kept on the random sample
+            max_unique_tracked: (int) Maximum number of unique items tracked per column
+            random_state: (int) Seed of the row sampling
+
+        """
+        self.sample_size = sample_size
+        self.max_unique_tracked = max_unique_tracked
+        self.rng = np.random.default_rng(random_state)
+        self.row_count = 0
+        self.sample = None
+        self.null_counts = dict()
+        self.value_counts = dict()
+        self.value_sums = dict()
+        self.min_values = dict()
+        self.max_values = dict()
+        self.unique_items = dict()
+        self.dtypes = dict()
+
+    def update(self, chunk):
+        """
+        Adds the statistics of a chunk of rows
+
+        Args:
+            chunk: (pandas.DataFrame) Chunk of the data source
+
+        """
+        for feature in chunk.columns:
+            series = chunk[feature]
+            self.dtypes[feature] = str(series.dtype)
+            self.null_counts[feature] = self.null_counts.get(feature, 0) + int(series.isna().sum())
+            # Tracking the unique items until the limit is crossed
+            if self.unique_items.get(feature, set()) is not None:
+                unique_items = self.unique_items.get(feature, set())
+                unique_items.update(series.dropna().unique())
+                self.unique_items[feature] = unique_items if len(unique_items) <= self.max_unique_tracked else None
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                values = series.dropna()
+                if len(values):
+                    self.value_counts[feature] = self.value_counts.get(feature, 0) + len(values)
+                    self.value_sums[feature] = self.value_sums.get(feature, 0.0) + float(values.sum())
+                    self.min_values[feature] = min(self.min_values.get(feature, np.inf), values.min())
+                    self.max_values[feature] = max(self.max_values.get(feature, -np.inf), values.max())
+        self.update_sample(chunk)
+        self.row_count += chunk.shape[0]
+
+    def update_sample(self, chunk):
+        """
+        Updates the random sample of rows with reservoir sampling
+
+        Args:
+            chunk: (pandas.DataFrame) Chunk of the data source
+
+        """
+        seen_rows = self.row_count
+        # Filling the sample until it is full
+        free_slots = self.sample_size - (0 if self.sample is None else self.sample.shape[0])
+        if free_slots > 0:
+            head = chunk.iloc[:free_slots]
+            self.sample = head if self.sample is None else pd.concat([self.sample, head])
+            chunk = chunk.iloc[free_slots:]
+            seen_rows += head.shape[0]
+        if chunk.shape[0] == 0:
+            return
+        # Row k (1-based) of the stream takes a random slot with probability sample_size / k
+        slots = self.rng.integers(0, np.arange(seen_rows + 1, seen_rows + chunk.shape[0] + 1))
+        selected_rows = np.flatnonzero(slots < self.sample_size)
+        # Later rows overwrite earlier rows picking the same slot
+        replaced_slots, last_positions = np.unique(slots[selected_rows][::-1], return_index=True)
+        selected_rows = selected_rows[::-1][last_positions]
+        kept_slots = np.ones(self.sample.shape[0], dtype=bool)
+        kept_slots[replaced_slots] = False
+        self.sample = pd.concat([self.sample.iloc[kept_slots], chunk.iloc[selected_rows]])
+
+    def unique_count(self, feature):
+        """
+        Args:
+            feature: (string) name of the feature
+
+        Returns:
+            unique_count: (int) Number of unique items, None if more than max_unique_tracked
+        """
+        unique_items = self.unique_items.get(feature)
+        return None if unique_items is None else len(unique_items)
+
+    def to_frame(self):
+        """
+        Returns:
+            statistics: (pandas.DataFrame) Statistics of every column, the medians are computed on the sample
+        """
+        statistics = pd.DataFrame(index=list(self.dtypes.keys()))
+        statistics["dtype"] = pd.Series(self.dtypes)
+        statistics["null_count"] = pd.Series(self.null_counts)
+        statistics["unique_count"] = pd.Series({feature: self.unique_count(feature) for feature in self.dtypes})
+        statistics["mean"] = pd.Series({feature: self.value_sums[feature] / self.value_counts[feature]
+                                        for feature in self.value_counts})
+        statistics["median"] = pd.Series({feature: np.nanmedian(self.sample[feature])
+                                          for feature in self.value_counts})
+        statistics["min"] = pd.Series(self.min_values)
+        statistics["max"] = pd.Series(self.max_values)
+
+        return statistics
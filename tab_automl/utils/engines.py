@@ -0,0 +1,221 @@
+"""
+This file holds the compute engines the column scans of data loading, processing and feature engineering run on.
+"""
+import numpy as np
+import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+
+# Supported compute engines
+engines = ["pandas", "polars"]
+# Text items read as null by the installed pandas, polars is given the same items so that both engines read the same
+# nulls, the list changes between pandas versions e.g. "None" is only read as null from pandas 2.0 on
+pandas_null_values = sorted(STR_NA_VALUES)
+
+
+class PandasEngine:
+    """
+
+    Column scans on pandas. Items are always counted with the most
+    abundant first and ties kept on their order of first appearance,
+    so that every engine picks the same mode.
+
+    """
+
+    name = "pandas"
+
+    def null_counts(self, x):
+        """
+        Args:
+            x: (pandas.DataFrame) Feature set / Affecting features
+
+        Returns:
+            null_counts: (pandas.Series) Number of null items of every column
+        """
+        return x.isna().sum()
+
+    def null_mask(self, x):
+        """
+        Args:
+            x: (pandas.DataFrame) Feature set / Affecting features
+
+        Returns:
+            null_mask: (numpy.ndarray) Boolean mask of the null items, rows by columns
+        """
+        return x.isna().to_numpy()
+
+    def unique_count(self, series):
+        """
+        Args:
+            series: (pandas.Series) Feature to be scanned
+
+        Returns:
+            unique_count: (int) Number of unique regular items, null items are not counted
+        """
+        return series.nunique()
+
+    def item_counts(self, series):
+        """
+        Args:
+            series: (pandas.Series) Feature to be scanned
+
+        Returns:
+            item_counts: (pandas.Series) Count of every regular item, the most abundant first
+                and ties on their order of first appearance
+        """
+        # counting on the order of first appearance and sorting with a stable sort keeps that order on ties
+        return series.value_counts(sort=False).sort_values(ascending=False, kind="stable")
+
+    def unique_items(self, series):
+        """
+        Args:
+            series: (pandas.Series) Feature to be scanned
+
+        Returns:
+            unique_items: (Any) Unique items including null, on their order of first appearance
+        """
+        return series.unique()
+
+
+class PolarsEngine(PandasEngine):
+    """
+
+    Column scans on the multithreaded columnar engine Polars. Data
+    sources are scanned lazily, only the required columns are parsed,
+    and the scans return the items of the received pandas series so
+    that the outputs are identical to the pandas engine. Categorical
+    and mixed type features are left to pandas.
+
+    """
+
+    name = "polars"
+
+    def __init__(self):
+        # polars is only required when this engine is selected
+        import polars
+        self.polars = polars
+
+    def scan(self, path, file_type, columns=None):
+        """
+        Reads a csv or parquet source through a lazy scan
+
+        Args:
+            path: (str) File path
+            file_type: (str) csv or parquet
+            columns: (List) Columns to read, all columns are read if None
+
+        Returns:
+            data: (pandas.DataFrame) Data with the dtypes and null items pandas reads
+        """
+        pl = self.polars
+        if file_type == "csv":
+            try:
+                # inferring the dtypes from the leading rows like pandas does for every parsed block
+                frame = self.collect(pl.scan_csv(path, null_values=pandas_null_values, infer_schema_length=10000),
+                                     columns)
+            except pl.exceptions.ComputeError:
+                # the leading rows did not hold every dtype of the source, inferring from all rows
+                frame = self.collect(pl.scan_csv(path, null_values=pandas_null_values, infer_schema_length=None),
+                                     columns)
+        else:
+            frame = self.collect(pl.scan_parquet(path), columns)
+        data = frame.to_pandas()
+        # null text items are NaN on pandas, the null items are read from the null bitmask of polars
+        for feature in data.columns[data.dtypes == object]:
+            if frame[feature].null_count():
+                values = data[feature].to_numpy()
+                values[frame[feature].is_null().to_numpy()] = np.nan
+                data[feature] = values
+
+        return data
+
+    @staticmethod
+    def collect(lazy_frame, columns=None):
+        """
+        Args:
+            lazy_frame: (polars.LazyFrame) Lazy scan of the data source
+            columns: (List) Columns to read, all columns are read if None
+
+        Returns:
+            frame: (polars.DataFrame) Collected data
+        """
+        if columns is not None:
+            # the projection is pushed down into the scan
+            lazy_frame = lazy_frame.select(columns)
+        return lazy_frame.collect()
+
+    def to_polars(self, series):
+        """
+        Args:
+            series: (pandas.Series) Feature to be converted
+
+        Returns:
+            series: (polars.Series) Feature with null for NaN, None if pandas has to scan it
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return None
+        try:
+            return self.polars.from_pandas(series)
+        except (TypeError, ValueError, self.polars.exceptions.PolarsError):
+            # e.g. text features holding numbers as well
+            return None
+
+    def first_positions(self, series):
+        """
+        Args:
+            series: (polars.Series) Feature to be scanned
+
+        Returns:
+            item_frame: (polars.DataFrame) position of first appearance and count of every item, null included
+        """
+        pl = self.polars
+        frame = pl.DataFrame({"item": series}).with_row_index("position")
+        return frame.group_by("item").agg(pl.col("position").first(), pl.len().alias("count"))
+
+    def null_counts(self, x):
+        try:
+            # converting the whole frame once, the null counts of all columns come out of the arrow buffers
+            frame = self.polars.from_pandas(x)
+        except (TypeError, ValueError, self.polars.exceptions.PolarsError):
+            return super().null_counts(x)
+        null_counts = frame.null_count().row(0)
+
+        return pd.Series(null_counts, index=x.columns, dtype=np.int64)
+
+    def unique_count(self, series):
+        polars_series = self.to_polars(series)
+        if polars_series is None:
+            return super().unique_count(series)
+
+        return polars_series.drop_nulls().n_unique()
+
+    def item_counts(self, series):
+        polars_series = self.to_polars(series)
+        if polars_series is None:
+            return super().item_counts(series)
+        item_frame = self.first_positions(polars_series.drop_nulls())
+        item_frame = item_frame.sort(["count", "position"], descending=[True, False])
+        positions = item_frame["position"].to_numpy()
+        # taking the items from the pandas series so that they are the same objects as on the pandas engine
+        items = series.dropna().to_numpy()[positions]
+
+        return pd.Series(item_frame["count"].to_numpy(), index=pd.Index(items), name=series.name)
+
+    def unique_items(self, series):
+        polars_series = self.to_polars(series)
+        if polars_series is None:
+            return super().unique_items(series)
+        positions = np.sort(self.first_positions(polars_series)["position"].to_numpy())
+
+        return series.to_numpy()[positions]
+
+
+def get_engine(engine="pandas"):
+    """
+    Args:
+        engine: (str) Name of the compute engine, one of engines
+
+    Returns:
+        engine: (PandasEngine) Compute engine
+    """
+    assert engine in engines, f"Engine not supported, choose one of {engines}..."
+    return PolarsEngine() if engine == "polars" else PandasEngine()
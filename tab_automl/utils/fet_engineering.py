@@ -1,3 +1,217 @@
 """
 This file holds all utilities for feature engineering.
-"""
\ No newline at end of file
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Code given to the items which were not present while fitting the label encoding
+UNSEEN_CATEGORY_CODE = -1
+
+
+class LabelEncoding:
+    """
+
+    Fitted label encoding of a single feature.
+    The items are coded on their order of appearance and the
+    codes of a whole feature are looked up in a single pass.
+
+    """
+
+    def __init__(self, items):
+        """
+        Args:
+            items: (pandas.Index) Unique items of the feature, the position of an item is its code
+
+        """
+        self.items = items
+
+    @classmethod
+    def fit(cls, series):
+        """
+        Args:
+            series: (pandas.Series) Feature to be encoded
+
+        Returns:
+            (LabelEncoding) Label encoding of the feature
+        """
+        return cls(pd.Index(series.unique()))
+
+    @property
+    def mapping(self):
+        """
+        Returns:
+            mapping: (dict) Code of every item
+        """
+        return dict(zip(self.items, range(len(self.items))))
+
+    def update(self, series):
+        """
+        Appends the unseen regular items of new rows, the codes of the known items do not change
+
+        Args:
+            series: (pandas.Series) New rows of the feature
+
+        Returns:
+            new_items: (pandas.Index) Items which got a code
+        """
+        new_items = pd.Index(series.dropna().unique())
+        new_items = new_items[self.items.get_indexer(new_items) == UNSEEN_CATEGORY_CODE]
+        self.items = self.items.append(new_items)
+
+        return new_items
+
+    def transform(self, series):
+        """
+        Args:
+            series: (pandas.Series) Feature to be encoded
+
+        Returns:
+            codes: (pandas.Series) Codes of the items, UNSEEN_CATEGORY_CODE for unseen items
+        """
+        codes = self.items.get_indexer(series)
+        return pd.Series(codes, index=series.index, name=series.name)
+
+    def inverse_transform(self, codes):
+        """
+        Args:
+            codes: (array-like) Codes of the items
+
+        Returns:
+            items: (numpy.ndarray) Items of the codes, None for UNSEEN_CATEGORY_CODE
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        items = self.items.to_numpy(dtype=object)[codes]
+        items[codes == UNSEEN_CATEGORY_CODE] = None
+        return items
+
+
+def one_hot_matrix(x, one_hot_categories):
+    """
+    Builds the one hot columns of all features at once as a single sparse matrix,
+    items which are not among the categories get no column
+
+    Args:
+        x: (pandas.DataFrame) Feature set holding the one hot encoded features
+        one_hot_categories: (dict) Categories of every one hot encoded feature, the columns are built on this order
+
+    Returns:
+        matrix: (scipy.sparse.csr_matrix) One hot columns of all features
+    """
+    row_blocks, column_blocks = list(), list()
+    column_offset = 0
+    for feature, categories in one_hot_categories.items():
+        # Looking up the column of every row in a single pass, -1 for null and unseen items
+        codes = pd.Categorical(x[feature], categories=categories).codes
+        rows = np.flatnonzero(codes >= 0)
+        row_blocks.append(rows)
+        column_blocks.append(codes[rows].astype(np.int64) + column_offset)
+        column_offset += len(categories)
+    rows = np.concatenate(row_blocks) if row_blocks else np.empty(0, dtype=np.int64)
+    columns = np.concatenate(column_blocks) if column_blocks else np.empty(0, dtype=np.int64)
+
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(x.shape[0], column_offset))
+
+
+class EncodeTransform:
+
+    """
+
+    Fitted feature encoding which can be applied again on new data.
+    It holds the categories of the one hot encoded features, the label
+    encodings and the final column order, unseen items are left out
+    of the one hot columns and get UNSEEN_CATEGORY_CODE as label.
+    With sparse one hot encoding the encoded features come out as a
+    single scipy CSR matrix instead of a dataframe.
+
+    """
+
+    def __init__(self, input_columns, sparse_one_hot=False):
+        """
+        Args:
+            input_columns: (List) Feature columns received while fitting
+            sparse_one_hot: (bool) whether the encoded features are built as a sparse matrix
+
+        """
+        self.input_columns = list(input_columns)
+        self.sparse_one_hot = sparse_one_hot
+        self.one_hot_categories = dict()
+        self.label_encodings = dict()
+        self.target_encoding = None
+        self.output_columns = list()
+
+    def transform(self, x):
+        """
+        Args:
+            x: (pandas.DataFrame) Feature set / Affecting features
+
+        Returns:
+            x: (pandas.DataFrame or scipy.sparse.csr_matrix) Encoded feature set with the columns of the fitted data
+        """
+        # Selecting a copy of the features so that the received frame is left untouched
+        x = x[self.input_columns]
+        if self.sparse_one_hot:
+            # Replacing all label encoded features with their codes
+            for feature, encoding in self.label_encodings.items():
+                x[feature] = encoding.transform(x[feature])
+            return self.to_sparse(x)
+        # Building the dummy columns of every one hot encoded feature on its fitted categories
+        dummy_frames = list()
+        for feature, categories in self.one_hot_categories.items():
+            dummy_frame = pd.get_dummies(pd.Categorical(x[feature], categories=categories))
+            dummy_frame.index = x.index
+            dummy_frames.append(dummy_frame)
+        x = x.drop(columns=list(self.one_hot_categories.keys()))
+        # Replacing all label encoded features with their codes
+        for feature, encoding in self.label_encodings.items():
+            x[feature] = encoding.transform(x[feature])
+        # The dummy columns are appended on the encoding order like while fitting
+        x = pd.concat([x] + dummy_frames, axis=1)
+        assert x.columns.tolist() == self.output_columns, "Encoded columns mismatched with the fitted data!"
+
+        return x
+
+    def update(self, x):
+        """
+        Codes the unseen items of the label encoded features of new rows. The one hot
+        categories are kept, new columns would change the input of the trained model,
+        so that unseen items of one hot encoded features stay without a column.
+
+        Args:
+            x: (pandas.DataFrame) New rows of the feature set
+
+        """
+        for feature, encoding in self.label_encodings.items():
+            new_items = encoding.update(x[feature])
+            if len(new_items):
+                print(f"{feature} : {len(new_items)} new items coded")
+
+    def sparse_output_columns(self, x):
+        """
+        Args:
+            x: (pandas.DataFrame) Feature set with label encoded features and not yet expanded one hot features
+
+        Returns:
+            output_columns: (List) Columns of the sparse matrix, the one hot columns come after the other features
+        """
+        output_columns = [feature for feature in x.columns if feature not in self.one_hot_categories]
+        for categories in self.one_hot_categories.values():
+            output_columns.extend(categories)
+
+        return output_columns
+
+    def to_sparse(self, x):
+        """
+        Args:
+            x: (pandas.DataFrame) Feature set with label encoded features and not yet expanded one hot features
+
+        Returns:
+            matrix: (scipy.sparse.csr_matrix) Encoded feature set, the one hot columns come after the other features
+        """
+        other_features = x.drop(columns=list(self.one_hot_categories.keys()))
+        # Joining the other features and all one hot columns at once without any dense dummy column
+        matrix = sparse.hstack([sparse.csr_matrix(other_features.to_numpy(dtype=np.float64)),
+                                one_hot_matrix(x, self.one_hot_categories)], format="csr")
+        assert matrix.shape[1] == len(self.output_columns), "Encoded columns mismatched with the fitted data!"
+
+        return matrix
@@ -1,4 +1,9 @@
+import numpy as np
+import pandas as pd
 from sklearn.metrics import accuracy_score, f1_score, mean_squared_error, mean_squared_log_error
+from sklearn.utils.multiclass import type_of_target
+
+from tab_automl.utils.telemetry import telemetry
 
 
 loss_fn_dict = {
@@ -14,23 +19,181 @@ def calc_metric(x, y, model, metric):
     return metric(y, pred)
 
 
-def fetch_metric_scores(train_set, val_set, trained_model, metrics=None):
-    metric_dict = dict()
+def sample_score_rows(x, y, n_rows, random_state=42):
+    """
+    Draws a fixed random subsample of rows to score a split on
+
+    Args:
+        x: (Any) Feature set, dataframe, numpy array or sparse matrix
+        y: (Any) Target feature
+        n_rows: (int) Number of rows to keep, all rows are kept if None
+        random_state: (int) Seed of the sampling
+
+    Returns:
+        x: (Any) Subsampled feature set
+        y: (Any) Subsampled target feature
+    """
+    if n_rows is None or n_rows >= x.shape[0]:
+        return x, y
+    # sorted positions keep the memory access of the subsample sequential
+    rows = np.sort(np.random.default_rng(random_state).choice(x.shape[0], n_rows, replace=False))
+    x = x.iloc[rows] if isinstance(x, (pd.DataFrame, pd.Series)) else x[rows]
+    y = y.iloc[rows] if isinstance(y, (pd.DataFrame, pd.Series)) else y[rows]
+
+    return x, y
+
+
+def fetch_metric_scores(train_set, val_set, trained_model, metrics=None, verbose=True, train_score_size=None):
     x_train, y_train = train_set
     x_val, y_val = val_set
     if y_train.shape[1] > 1:
         y_train = y_train.iloc[:, 0]
     if y_val.shape[1] > 1:
         y_val = y_val.iloc[:, 0]
+    # training metrics can be scored on a bounded subsample, the cost of predicting grows with the rows
+    x_train, y_train = sample_score_rows(x_train, y_train, train_score_size)
+    # predicting every split once, all metrics are calculated from the same predictions
+    with telemetry.span("predict", rows=x_train.shape[0], split="train"):
+        train_pred = trained_model.predict(x_train)
+    with telemetry.span("predict", rows=x_val.shape[0], split="val"):
+        val_pred = trained_model.predict(x_val)
 
+    return score_predictions((y_train, train_pred), (y_val, val_pred), metrics=metrics, verbose=verbose)
+
+
+def score_predictions(train_set, val_set, metrics=None, verbose=True):
+    """
+    Args:
+        train_set: (tuple) Target feature and predictions of the training rows
+        val_set: (tuple) Target feature and predictions of the validation rows
+        metrics: (List[str]) Metrics to calculate
+        verbose: (bool) whether the metric scores will be printed while scoring
+
+    Returns:
+        metric_dict: (dict) Train and validation score and type of every metric
+    """
+    metric_dict = dict()
+    y_train, train_pred = train_set
+    y_val, val_pred = val_set
     for metric_name in metrics:
-        print(f"Scoring on {metric_name}")
+        if verbose:
+            print(f"Scoring on {metric_name}")
         metric, metric_type = loss_fn_dict[metric_name]
-        train_metric_score = calc_metric(x_train, y_train, trained_model, metric)
-        val_metric_score = calc_metric(x_val, y_val, trained_model, metric)
-        print(f"train set score : {train_metric_score}   ||  "
-              f"validation set score : {val_metric_score}")
+        with telemetry.span("metric", rows=len(train_pred) + len(val_pred), metric=metric_name):
+            train_metric_score = metric(y_train, train_pred)
+            val_metric_score = metric(y_val, val_pred)
+        if verbose:
+            print(f"train set score : {train_metric_score}   ||  "
+                  f"validation set score : {val_metric_score}")
         metric_dict[f"train_{metric_name}"] = [train_metric_score, metric_type]
         metric_dict[f"val_{metric_name}"] = [val_metric_score, metric_type]
 
     return metric_dict
+
+
+class StreamingMetric:
+    """
+
+    Metric of loss_fn_dict accumulated block by block, only a few counters
+    are kept so that any number of rows can be scored in bounded memory.
+    The binary f1 score is taken on the positive label 1 like f1_score.
+
+    """
+
+    def __init__(self, metric_name):
+        """
+        Args:
+            metric_name: (str) Name of the metric inside loss_fn_dict
+
+        """
+        assert metric_name in loss_fn_dict, f"{metric_name} not found in the metrics..."
+        self.metric_name = metric_name
+        self.count = 0
+        self.total = 0.0
+        # true positives, false positives and false negatives of the f1 score
+        self.counts = np.zeros(3, dtype=np.int64)
+        self.labels = set()
+
+    def update(self, y_true, y_pred):
+        """
+        Args:
+            y_true: (numpy.ndarray) Target feature of a block of rows
+            y_pred: (numpy.ndarray) Predictions of the block
+
+        """
+        y_true = np.asarray(y_true).ravel()
+        y_pred = np.asarray(y_pred).ravel()
+        if self.metric_name in ("accuracy_score", "f1_score") and \
+                "continuous" in (type_of_target(y_true), type_of_target(y_pred)):
+            # like the classification metrics of sklearn, counting exact matches of floats would score 0
+            raise ValueError("Classification metrics can't handle continuous targets")
+        self.count += len(y_true)
+        if self.metric_name == "accuracy_score":
+            self.total += float(np.sum(y_true == y_pred))
+        elif self.metric_name == "mse":
+            self.total += float(np.sum((y_true.astype(np.float64) - y_pred) ** 2))
+        elif self.metric_name == "msle":
+            if (y_true < 0).any() or (y_pred < 0).any():
+                raise ValueError("Mean Squared Logarithmic Error cannot be used when targets contain negative values.")
+            self.total += float(np.sum((np.log1p(y_true.astype(np.float64)) - np.log1p(y_pred)) ** 2))
+        else:
+            self.labels.update(np.unique(y_true).tolist())
+            self.labels.update(np.unique(y_pred).tolist())
+            if len(self.labels) > 2:
+                raise ValueError("Target is multiclass but average='binary'.")
+            self.counts += [np.sum((y_true == 1) & (y_pred == 1)), np.sum((y_true != 1) & (y_pred == 1)),
+                            np.sum((y_true == 1) & (y_pred != 1))]
+
+    def value(self):
+        """
+        Returns:
+            score: (float) Score of all rows seen so far
+        """
+        if self.metric_name == "f1_score":
+            true_positives, false_positives, false_negatives = self.counts
+            denominator = 2 * true_positives + false_positives + false_negatives
+            return 2 * true_positives / denominator if denominator else 0.0
+
+        return self.total / max(self.count, 1)
+
+
+def fetch_streaming_metric_scores(train_set, val_set, trained_model, metrics=None, verbose=True,
+                                  train_score_size=None, block_rows=65536):
+    """
+    Scores a trained model block by block, the predictions of a block are
+    dropped once its rows are counted, so the splits can be larger than memory
+
+    Args:
+        train_set: (tuple) Feature matrix and target feature of the training rows e.g. memory-mapped
+        val_set: (tuple) Feature matrix and target feature of the validation rows
+        trained_model: (Any) Trained model
+        metrics: (List[str]) Metrics to calculate
+        verbose: (bool) whether the metric scores will be printed while scoring
+        train_score_size: (int) Number of training rows the training metrics are scored on, all rows if None
+        block_rows: (int) Number of rows predicted at once
+
+    Returns:
+        metric_dict: (dict) Train and validation score and type of every metric
+    """
+    # training metrics can be scored on a bounded subsample, the cost of predicting grows with the rows
+    train_set = sample_score_rows(*train_set, train_score_size)
+    split_scores = dict()
+    for split, (x, y) in (("train", train_set), ("val", val_set)):
+        split_metrics = [StreamingMetric(metric_name) for metric_name in metrics]
+        with telemetry.span("predict", rows=x.shape[0], split=split):
+            for start in range(0, x.shape[0], block_rows):
+                y_pred = trained_model.predict(x[start:start + block_rows])
+                for metric in split_metrics:
+                    metric.update(y[start:start + block_rows], y_pred)
+        split_scores[split] = [metric.value() for metric in split_metrics]
+    metric_dict = dict()
+    for index, metric_name in enumerate(metrics):
+        train_metric_score, val_metric_score = split_scores["train"][index], split_scores["val"][index]
+        if verbose:
+            print(f"Scoring on {metric_name}")
+            print(f"train set score : {train_metric_score}   ||  "
+                  f"validation set score : {val_metric_score}")
+        metric_dict[f"train_{metric_name}"] = [train_metric_score, loss_fn_dict[metric_name][1]]
+        metric_dict[f"val_{metric_name}"] = [val_metric_score, loss_fn_dict[metric_name][1]]
+
+    return metric_dict
@@ -3,6 +3,10 @@ This file will hold miscellaneous utilities.
 """
 import os
 
+from tab_automl.automl.models import samplers
+from tab_automl.utils.datasets import save_formats
+from tab_automl.utils.engines import engines
+
 
 def check_true_false(variable):
     """
@@ -35,3 +39,42 @@ def validate_parser_variable(args):
     assert check_true_false(args.save_proc_data), "Variable must be named true or false"
     assert check_true_false(args.save_fet_data), "Variable must be named true or false"
     assert check_true_false(args.save_model), "Variable must be named true or false"
+    assert check_true_false(args.successive_halving), "Variable must be named true or false"
+    assert check_true_false(args.sparse_one_hot), "Variable must be named true or false"
+    assert args.engine in engines, f"Engine must be one of {engines}..."
+    assert args.save_format in save_formats, f"Save format must be one of {save_formats}..."
+    assert check_true_false(args.optimize_memory), "Variable must be named true or false"
+    assert args.chunk_size is None or args.chunk_size > 0, "Chunk size must be a positive integer..."
+    assert args.sample_size > 0, "Sample size must be a positive integer..."
+    assert args.n_jobs != 0, "Number of jobs must be a positive integer or -1..."
+    assert args.train_score_size is None or args.train_score_size > 0, \
+        "Train score size must be a positive integer..."
+    assert args.cv_folds is None or args.cv_folds >= 2, "Cross validation needs at least 2 folds..."
+    assert args.cv_folds is None or (args.successive_halving == "false" and args.time_budget is None), \
+        "Cross validation can not be combined with successive halving or a time budget..."
+    assert check_true_false(args.no_cache), "Variable must be named true or false"
+    assert args.cache_max_size > 0, "Cache size must be a positive number of megabytes..."
+    assert args.time_budget is None or args.time_budget > 0, "Time budget must be a positive number of seconds..."
+    assert args.time_budget is None or args.successive_halving == "false", \
+        "Successive halving can not be combined with a time budget..."
+    assert check_true_false(args.hyperparameter_search), "Variable must be named true or false"
+    assert args.n_trials > 0, "Number of trials must be a positive integer..."
+    assert args.sampler in samplers, f"Sampler must be one of {samplers}..."
+    assert args.hyperparameter_search == "false" or (args.cv_folds is None and args.successive_halving == "false"), \
+        "Hyperparameter search can not be combined with cross validation or successive halving..."
+    assert check_true_false(args.incremental), "Variable must be named true or false"
+    assert args.incremental == "false" or os.path.isfile(args.previous_pipeline), \
+        "Invalid previous pipeline, pipeline is not found..."
+    assert args.incremental_rounds > 0, "Incremental rounds must be a positive integer..."
+    assert args.ensemble_size >= 0, "Ensemble size must be a positive integer or 0..."
+    assert args.ensemble_size == 0 or (args.cv_folds is None and args.successive_halving == "false"
+                                       and args.hyperparameter_search == "false"), \
+        "Ensemble is only built on the default model training..."
+    assert check_true_false(args.out_of_core), "Variable must be named true or false"
+    assert args.out_of_core == "false" or args.chunk_size is not None, \
+        "Out-of-core training reads the data source in chunks, chunk size is required..."
+    assert args.out_of_core == "false" or (args.cv_folds is None and args.successive_halving == "false"
+                                           and args.hyperparameter_search == "false" and args.ensemble_size == 0
+                                           and args.incremental == "false" and args.time_budget is None), \
+        "Out-of-core training can not be combined with other training modes or a time budget..."
+    assert args.epochs > 0, "Number of epochs must be a positive integer..."
@@ -1,3 +1,393 @@
 """
 This file holds all utilities of data processing
-"""
\ No newline at end of file
+"""
+import contextvars
+import math
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, cpu_count, delayed
+
+from tab_automl.utils.engines import PandasEngine
+
+
+def is_categorical_feature(series):
+    """
+    Checks if the feature holds categorical items, either as text or as pandas category
+
+    Args:
+        series: (pandas.Series) Feature to be checked
+
+    Returns:
+        (bool) whether the feature is categorical
+    """
+    return series.dtype == "object" or isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def map_column_chunks(function, features, n_jobs=1, chunks_per_worker=4):
+    """
+    Runs a function on chunks of columns on a thread pool, a few chunks
+    per worker keep the scheduling overhead low on wide dataframes
+
+    Args:
+        function: (Any) Function taking a list of features and returning a dict keyed by feature
+        features: (List) Features to be processed
+        n_jobs: (int) Number of threads, -1 uses all cores
+        chunks_per_worker: (int) Number of column chunks given to every thread
+
+    Returns:
+        results: (dict) Results of all features, on the order of the features
+    """
+    features = list(features)
+    n_workers = cpu_count() if n_jobs < 0 else n_jobs
+    if n_workers == 1 or len(features) < 2:
+        return function(features)
+    chunk_size = math.ceil(len(features) / (n_workers * chunks_per_worker))
+    chunks = [features[start:start + chunk_size] for start in range(0, len(features), chunk_size)]
+    # threads share the dataframe without copying it, pandas and numpy release the GIL on the heavy scans
+    # every chunk runs on a copy of the caller context, so that telemetry spans nest under the calling stage
+    chunk_results = Parallel(n_jobs=n_workers, prefer="threads")(
+        delayed(contextvars.copy_context().run)(function, chunk) for chunk in chunks)
+    results = dict()
+    for chunk_result in chunk_results:
+        results.update(chunk_result)
+
+    return results
+
+
+class ColumnProfile:
+
+    """
+
+    Profile of the columns of a dataframe. Null counts and dtypes of all
+    columns are taken at once, unique counts and most abundant items of
+    a column are only computed on the first decision which needs them
+    and are kept until the rows of the profile change. Rows can be left
+    out of the profile with a boolean mask, without copying the data,
+    and a column can still be counted on the rows kept at an earlier
+    point, so that the counts of many columns can be taken later at once.
+
+    """
+
+    def __init__(self, x, top_k=3, max_counted_items=1000, engine=None):
+        """
+        Args:
+            x: (pandas.DataFrame) Feature set / Affecting features
+            top_k: (int) Number of most abundant items kept per column for reporting
+            max_counted_items: (int) Number of most abundant items whose counts are kept until the profile is released
+            engine: (PandasEngine) Compute engine the columns are scanned on, pandas if None
+
+        """
+        self.top_k = top_k
+        self.max_counted_items = max_counted_items
+        self.engine = engine or PandasEngine()
+        self.null_counts = None
+        self.unique_counts = dict()
+        self.top_items = dict()
+        self.counted_items = dict()
+        self.refresh(x)
+
+    def refresh(self, x):
+        """
+        Profiles the dataframe again e.g. after some rows or columns were dropped
+
+        Args:
+            x: (pandas.DataFrame) Feature set / Affecting features
+
+        """
+        self.x = x
+        self.dtypes = x.dtypes
+        if self.null_counts is None:
+            # counting the null values of all columns at once
+            self.null_counts = self.engine.null_counts(x)
+        else:
+            # dropping rows or columns can not add null values, only the columns which had some are counted again
+            self.null_counts = self.null_counts.reindex(x.columns, fill_value=0)
+        null_features = self.null_counts.index[self.null_counts.to_numpy() > 0]
+        # null mask of the columns with null values, so that dropped rows can be counted out without the data
+        self.null_features = null_features
+        self.null_mask = self.engine.null_mask(x[null_features])
+        self.null_counts[null_features] = self.null_mask.sum(axis=0)
+        # boolean mask of the kept rows, None while every row is kept
+        self.rows = None
+        self.length = x.shape[0]
+        self.unique_counts.clear()
+        self.top_items.clear()
+        self.counted_items.clear()
+
+    def drop_rows(self, row_mask):
+        """
+        Leaves rows out of the profile, the dataframe itself is not changed
+
+        Args:
+            row_mask: (numpy.ndarray) Boolean mask of the rows to be left out
+
+        """
+        self.rows = ~row_mask if self.rows is None else self.rows & ~row_mask
+        self.length = int(self.rows.sum())
+        self.null_counts[self.null_features] = self.null_mask[self.rows].sum(axis=0)
+        self.unique_counts.clear()
+        self.top_items.clear()
+        self.counted_items.clear()
+
+    def release(self):
+        """
+        Drops the reference to the profiled dataframe, the counted columns are kept for reporting
+
+        """
+        self.x = None
+        self.null_mask = None
+        self.counted_items.clear()
+
+    def kept_rows(self):
+        """
+        Returns:
+            rows: (Any) Boolean mask of the kept rows, or a slice of all rows if no row was left out
+        """
+        return slice(None) if self.rows is None else self.rows
+
+    def column(self, feature, rows=None):
+        """
+        Args:
+            feature: (string) name of the feature
+            rows: (Any) Rows taken from kept_rows() earlier, the currently kept rows if None
+
+        Returns:
+            column: (pandas.Series) Kept rows of the feature
+        """
+        rows = self.kept_rows() if rows is None else rows
+        column = self.x[feature]
+        # masking the values directly, a boolean indexing on the series is much slower
+        return column if isinstance(rows, slice) else pd.Series(column.to_numpy()[rows], dtype=column.dtype)
+
+    def count_items(self, feature, rows=None):
+        """
+        Counts the items of a column once and keeps its unique count and most abundant items
+
+        Args:
+            feature: (string) name of the feature
+            rows: (Any) Rows taken from kept_rows() earlier, the currently kept rows if None
+
+        """
+        if feature in self.top_items:
+            return
+        # null values are left out of the count like on pandas.Series.nunique, ties keep their order of appearance
+        item_counts = self.engine.item_counts(self.column(feature, rows))
+        if isinstance(self.dtypes[feature], pd.CategoricalDtype):
+            # categories which are not present are left out like on text features
+            item_counts = item_counts[item_counts > 0]
+        self.unique_counts[feature] = len(item_counts)
+        self.top_items[feature] = item_counts.iloc[:self.top_k]
+        self.counted_items[feature] = item_counts.iloc[:self.max_counted_items]
+
+    def null_ratio(self, feature):
+        """
+        Args:
+            feature: (string) name of the feature
+
+        Returns:
+            null_ratio: (float) Ratio of null and total items
+        """
+        return self.null_counts[feature] / self.length
+
+    def unique_count(self, feature, rows=None):
+        """
+        Args:
+            feature: (string) name of the feature
+            rows: (Any) Rows taken from kept_rows() earlier, the currently kept rows if None
+
+        Returns:
+            unique_count: (int) Number of unique regular items of the feature
+        """
+        if feature not in self.unique_counts:
+            # a unique count is cheaper than counting every item, null values are left out
+            self.unique_counts[feature] = self.engine.unique_count(self.column(feature, rows))
+        return self.unique_counts[feature]
+
+    def mode(self, feature, rows=None):
+        """
+        Args:
+            feature: (string) name of the feature
+            rows: (Any) Rows taken from kept_rows() earlier, the currently kept rows if None
+
+        Returns:
+            mode: (Any) Most abundant regular item of the feature, None if the feature has only null values
+        """
+        self.count_items(feature, rows)
+        top_items = self.top_items[feature]
+        return top_items.index[0] if len(top_items) else None
+
+    def item_counts(self, feature, rows=None):
+        """
+        Args:
+            feature: (string) name of the feature
+            rows: (Any) Rows taken from kept_rows() earlier, the currently kept rows if None
+
+        Returns:
+            item_counts: (pandas.Series) Counts of the most abundant regular items of the feature
+        """
+        self.count_items(feature, rows)
+        return self.counted_items[feature]
+
+    def to_frame(self):
+        """
+        Returns:
+            profile: (pandas.DataFrame) Profile of every column for reporting, the item
+                statistics are empty for the columns which were never counted
+        """
+        return pd.DataFrame({
+            "dtype": self.dtypes.astype(str),
+            "null_count": self.null_counts,
+            "null_ratio": self.null_counts / max(self.length, 1),
+            "unique_count": pd.Series(self.unique_counts, dtype=float),
+            "top_items": pd.Series({feature: top_items.index.tolist()
+                                    for feature, top_items in self.top_items.items()}, dtype=object),
+        })
+
+
+class FillStatistic:
+
+    """
+
+    Running statistic the fill value of a feature is read from. It keeps
+    the count and sum of the values for a mean, the counts of the most
+    abundant items for a mode and a fixed number of evenly spaced
+    quantiles as the median sketch, so that the fill value can be
+    updated with the regular items of new rows only and the statistic
+    stays small whatever the data size is.
+
+    """
+
+    def __init__(self, kind, n_quantiles=101, max_items=1000):
+        """
+        Args:
+            kind: (str) median, mean or mode
+            n_quantiles: (int) Number of evenly spaced quantiles kept on the median sketch, odd to hold the median
+            max_items: (int) Maximum number of items counted for a mode, the least abundant are left out
+
+        """
+        self.kind = kind
+        self.n_quantiles = n_quantiles
+        self.max_items = max_items
+        self.count = 0
+        self.total = 0.0
+        self.quantiles = np.empty(0)
+        self.item_counts = pd.Series(dtype=np.int64, index=pd.Index([], dtype=object))
+
+    def update(self, values):
+        """
+        Args:
+            values: (pandas.Series) Regular items of new rows
+
+        """
+        if self.kind == "mode":
+            self.add_counts(values.value_counts())
+            return
+        if len(values) == 0:
+            return
+        if self.kind == "mean":
+            self.total += float(values.sum())
+        else:
+            self.update_sketch(values.to_numpy(dtype=np.float64))
+        self.count += len(values)
+
+    def add_counts(self, item_counts):
+        """
+        Args:
+            item_counts: (pandas.Series) Counts of the regular items of new rows
+
+        """
+        self.count += int(item_counts.sum())
+        item_counts = pd.Series(item_counts.to_numpy(dtype=np.int64), index=item_counts.index.astype(object))
+        item_counts = self.item_counts.add(item_counts, fill_value=0).astype(np.int64)
+        # keeping the most abundant items only, the counts of a rare item can restart from zero later
+        self.item_counts = item_counts.sort_values(ascending=False, kind="stable").iloc[:self.max_items]
+
+    def update_sketch(self, values):
+        """
+        Merges the quantiles of new values into the median sketch, every quantile
+        stands for an equal share of the values it was taken on
+
+        Args:
+            values: (numpy.ndarray) Regular values of new rows
+
+        """
+        levels = np.linspace(0, 1, self.n_quantiles)
+        new_quantiles = np.quantile(values, levels)
+        if self.count == 0:
+            # the sketch of the first values holds their exact median
+            self.quantiles = new_quantiles
+            return
+        points = np.concatenate([self.quantiles, new_quantiles])
+        weights = np.repeat([self.count / self.n_quantiles, len(values) / self.n_quantiles], self.n_quantiles)
+        order = np.argsort(points, kind="stable")
+        # reading the merged quantiles on the middle rank of every weighted point
+        ranks = np.cumsum(weights[order]) - weights[order] / 2
+        self.quantiles = np.interp(levels * (self.count + len(values)), ranks, points[order])
+
+    def value(self):
+        """
+        Returns:
+            fill_value: (Any) Current value of the statistic, None if no value was counted
+        """
+        if self.count == 0:
+            return None
+        if self.kind == "mode":
+            return self.item_counts.index[0]
+        if self.kind == "mean":
+            return self.total / self.count
+
+        return float(self.quantiles[self.n_quantiles // 2])
+
+
+class NullTransform:
+
+    """
+
+    Fitted null processing which can be applied again on new data.
+    It only holds the dropped features and the fill value of every
+    kept feature, so it stays small whatever the data size is.
+
+    """
+
+    def __init__(self, input_columns):
+        """
+        Args:
+            input_columns: (List) Feature columns received while fitting
+
+        """
+        self.input_columns = list(input_columns)
+        self.dropped_features = list()
+        self.fill_values = dict()
+        # running statistic of every fill value, for updating the fill values with new rows
+        self.fill_statistics = dict()
+
+    def transform(self, x):
+        """
+        Drops the dropped features and fills the null values of the kept features.
+        Rows are never dropped, features whose null rows were dropped while fitting
+        are filled with their most abundant item instead.
+
+        Args:
+            x: (pandas.DataFrame) Feature set / Affecting features
+
+        Returns:
+            x: (pandas.DataFrame) Processed feature set
+        """
+        kept_features = [feature for feature in self.input_columns if feature not in self.dropped_features]
+        x = x[kept_features]
+        # Filling all features at once
+        fill_values = {feature: value for feature, value in self.fill_values.items() if x[feature].hasnans}
+        return x.fillna(fill_values) if fill_values else x
+
+    def update(self, x):
+        """
+        Updates the fill values with the regular items of new rows, the dropped features stay dropped
+
+        Args:
+            x: (pandas.DataFrame) New rows of the feature set
+
+        """
+        for feature, statistic in self.fill_statistics.items():
+            statistic.update(x[feature].dropna())
+            self.fill_values[feature] = statistic.value()
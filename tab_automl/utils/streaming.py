@@ -0,0 +1,262 @@
+"""
+This file holds all utilities of the out-of-core training, on data sources larger than memory.
+"""
+import os
+
+import numpy as np
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from tab_automl.utils.training import to_dense
+
+
+def write_chunk_matrices(chunks, folder, val_ratio=0.2, random_state=42):
+    """
+    Appends the chunks to float32 training and validation matrices on disk, every
+    row goes to the validation matrix with probability val_ratio, so that only a
+    single chunk is held in memory at a time
+
+    Args:
+        chunks: (Iterator[tuple]) Feature matrix and target feature of every chunk, numerical
+        folder: (str) Directory of the matrix files
+        val_ratio: (float) Ratio of rows kept for validation
+        random_state: (int) Seed of the validation rows
+
+    Returns:
+        matrices: (tuple) Memory-mapped (x_train, y_train, x_val, y_val)
+    """
+    rng = np.random.default_rng(random_state)
+    outfiles = {name: open(os.path.join(folder, f"{name}.bin"), "wb") for name in ("x_train", "y_train", "x_val",
+                                                                                     "y_val")}
+    row_counts = {"train": 0, "val": 0}
+    n_columns = None
+    try:
+        for x, y in chunks:
+            x = np.ascontiguousarray(to_dense(x), dtype=np.float32)
+            # the targets are kept as float64, class labels are exact on it
+            y = np.asarray(y, dtype=np.float64).ravel()
+            n_columns = x.shape[1] if n_columns is None else n_columns
+            assert x.shape[1] == n_columns, "Chunks with different columns found..."
+            val_rows = rng.random(x.shape[0]) < val_ratio
+            for split, rows in (("train", ~val_rows), ("val", val_rows)):
+                outfiles[f"x_{split}"].write(x[rows].tobytes())
+                outfiles[f"y_{split}"].write(y[rows].tobytes())
+                row_counts[split] += int(rows.sum())
+    finally:
+        for outfile in outfiles.values():
+            outfile.close()
+    assert row_counts["train"] > 0 and row_counts["val"] > 0, "Not enough records to train and validate on..."
+
+    return tuple(np.memmap(os.path.join(folder, f"{name}.bin"), dtype=dtype, mode="r", shape=shape)
+                 for name, dtype, shape in (("x_train", np.float32, (row_counts["train"], n_columns)),
+                                            ("y_train", np.float64, (row_counts["train"],)),
+                                            ("x_val", np.float32, (row_counts["val"], n_columns)),
+                                            ("y_val", np.float64, (row_counts["val"],))))
+
+
+def fit_scaler(x, block_rows=65536):
+    """
+    Args:
+        x: (numpy.ndarray) Feature matrix e.g. memory-mapped
+        block_rows: (int) Number of rows read at once
+
+    Returns:
+        scaler: (sklearn.preprocessing.StandardScaler) Scaler fitted block by block
+    """
+    scaler = StandardScaler()
+    for start in range(0, x.shape[0], block_rows):
+        scaler.partial_fit(x[start:start + block_rows])
+
+    return scaler
+
+
+class BoosterModel:
+    """
+
+    Booster trained without the scikit-learn wrapper of its library, it
+    predicts class labels, class probabilities or values like a fitted
+    wrapper. Class labels are mapped on the positions of the classes.
+
+    """
+
+    def __init__(self, booster, classes=None):
+        """
+        Args:
+            booster: (Any) Trained lightgbm.Booster or xgboost.Booster
+            classes: (numpy.ndarray) Sorted class labels on classification, None on regression
+
+        """
+        self.booster = booster
+        self.classes_ = classes
+
+    def predict_raw(self, x):
+        """
+        Args:
+            x: (numpy.ndarray) Feature matrix
+
+        Returns:
+            predictions: (numpy.ndarray) Output of the booster, probabilities on classification
+        """
+        if type(self.booster).__module__.split(".")[0] == "xgboost":
+            import xgboost
+
+            return self.booster.predict(xgboost.DMatrix(x))
+
+        return self.booster.predict(x)
+
+    def predict_proba(self, x):
+        """
+        Args:
+            x: (numpy.ndarray) Feature matrix
+
+        Returns:
+            probabilities: (numpy.ndarray) Probability of every class, on the columns of the classes
+        """
+        probabilities = self.predict_raw(x)
+        # binary objectives give the probability of the second class only
+        return np.column_stack([1 - probabilities, probabilities]) if probabilities.ndim == 1 else probabilities
+
+    def predict(self, x):
+        """
+        Args:
+            x: (numpy.ndarray) Feature matrix
+
+        Returns:
+            predictions: (numpy.ndarray) Class labels on classification, values on regression
+        """
+        if self.classes_ is None:
+            return self.predict_raw(x)
+
+        return self.classes_[np.argmax(self.predict_proba(x), axis=1)]
+
+
+def train_lightgbm(model, x, y, classes=None, block_rows=65536):
+    """
+    Builds the LightGBM dataset from a sequence of row blocks, the rows are binned block by
+    block and only the binned dataset is kept in memory, it is a fraction of the raw matrix
+
+    Args:
+        model: (Any) Unfitted LGBMClassifier or LGBMRegressor holding the parameters
+        x: (numpy.ndarray) Feature matrix e.g. memory-mapped
+        y: (numpy.ndarray) Target feature
+        classes: (numpy.ndarray) Sorted class labels on classification, None on regression
+        block_rows: (int) Number of rows read at once
+
+    Returns:
+        model: (BoosterModel) Trained booster
+    """
+    import lightgbm
+
+    class MatrixSequence(lightgbm.Sequence):
+        batch_size = block_rows
+
+        def __getitem__(self, rows):
+            # lightgbm bins the sequences from double rows only
+            return np.asarray(x[rows], dtype=np.float64)
+
+        def __len__(self):
+            return x.shape[0]
+
+    # the parameters of the wrapper are aliases of the booster parameters
+    params = {key: value for key, value in model.get_params().items()
+              if value is not None and key not in ("importance_type", "class_weight", "n_estimators", "objective")}
+    params["verbosity"] = -1
+    if classes is None:
+        params["objective"] = model.objective or "regression"
+        labels = y
+    else:
+        params["objective"] = "binary" if len(classes) == 2 else "multiclass"
+        if len(classes) > 2:
+            params["num_class"] = len(classes)
+        labels = np.searchsorted(classes, y)
+    dataset = lightgbm.Dataset(MatrixSequence(), label=labels, params={"verbosity": -1})
+    booster = lightgbm.train(params, dataset, num_boost_round=model.n_estimators)
+
+    return BoosterModel(booster, classes)
+
+
+def train_xgboost(model, x, y, classes=None, block_rows=65536, cache_prefix=None):
+    """
+    Trains on an external memory DMatrix, XGBoost reads the row blocks through an
+    iterator and keeps its quantized pages in cache files next to the matrices
+
+    Args:
+        model: (Any) Unfitted XGBClassifier or XGBRegressor holding the parameters
+        x: (numpy.ndarray) Feature matrix e.g. memory-mapped
+        y: (numpy.ndarray) Target feature
+        classes: (numpy.ndarray) Sorted class labels on classification, None on regression
+        block_rows: (int) Number of rows read at once
+        cache_prefix: (str) Path prefix of the cache files
+
+    Returns:
+        model: (BoosterModel) Trained booster
+    """
+    import xgboost
+
+    labels = y if classes is None else np.searchsorted(classes, y)
+
+    class MatrixIterator(xgboost.DataIter):
+
+        def __init__(self):
+            self.position = 0
+            super().__init__(cache_prefix=cache_prefix)
+
+        def next(self, input_data):
+            if self.position >= x.shape[0]:
+                return False
+            rows = slice(self.position, self.position + block_rows)
+            input_data(data=np.asarray(x[rows]), label=labels[rows])
+            self.position += block_rows
+            return True
+
+        def reset(self):
+            self.position = 0
+
+    params = model.get_xgb_params()
+    # external memory pages are built for the histogram tree method
+    params["tree_method"] = "hist"
+    if classes is not None:
+        params["objective"] = "binary:logistic" if len(classes) == 2 else "multi:softprob"
+        if len(classes) > 2:
+            params["num_class"] = len(classes)
+    booster = xgboost.train(params, xgboost.DMatrix(MatrixIterator()), num_boost_round=model.n_estimators or 100)
+
+    return BoosterModel(booster, classes)
+
+
+def fit_out_of_core(model, x, y, classes=None, n_epochs=3, block_rows=65536, folder=None, scaler=None):
+    """
+    Trains a model on row blocks of a matrix larger than memory, LightGBM and XGBoost
+    models are trained on their own chunked datasets, the other models take shuffled
+    row blocks with partial_fit on every epoch
+
+    Args:
+        model: (Any) Unfitted model
+        x: (numpy.ndarray) Feature matrix e.g. memory-mapped
+        y: (numpy.ndarray) Target feature
+        classes: (numpy.ndarray) Sorted class labels on classification, None on regression
+        n_epochs: (int) Number of passes over the rows of the partial_fit models
+        block_rows: (int) Number of rows read at once
+        folder: (str) Directory of the external memory cache files
+        scaler: (StandardScaler) Scaler of the partial_fit models fitted on x, fitted if None
+
+    Returns:
+        model: (Any) Trained model, the partial_fit models come with their scaler as a pipeline
+    """
+    library = type(model).__module__.split(".")[0]
+    if library == "lightgbm":
+        return train_lightgbm(model, x, y, classes, block_rows=block_rows)
+    if library == "xgboost":
+        return train_xgboost(model, x, y, classes, block_rows=block_rows,
+                             cache_prefix=None if folder is None else os.path.join(folder, "xgboost_cache"))
+    assert hasattr(model, "partial_fit"), f"{type(model).__name__} can not be trained out of core..."
+    # gradient based models need features on the same scale
+    scaler = scaler or fit_scaler(x, block_rows)
+    rng = np.random.default_rng(42)
+    fit_params = dict() if classes is None else {"classes": classes}
+    for _ in range(n_epochs):
+        for start in rng.permutation(np.arange(0, x.shape[0], block_rows)):
+            model.partial_fit(scaler.transform(x[start:start + block_rows]), y[start:start + block_rows],
+                              **fit_params)
+
+    return make_pipeline(scaler, model)
@@ -0,0 +1,281 @@
+"""
+This file holds the telemetry of the pipeline, timing events of the stages emitted as JSON lines.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+
+# Environment variable carrying the JSON lines path to the worker processes
+telemetry_variable = "TAB_AUTOML_TELEMETRY"
+# Name and fields of the enclosing span, the nested spans inherit the fields
+enclosing_span = contextvars.ContextVar("enclosing_span", default=(None, {}))
+
+
+def current_rss_mb():
+    """
+    Returns:
+        rss: (float) Current resident memory of the process in megabytes, None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as infile:
+            # the second field is the number of resident pages
+            return int(infile.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RSSSampler:
+    """
+
+    Samples the resident memory of the process on a background thread
+    while blocks are measured and keeps the peak of every running block.
+    Unlike the peak of the whole process, the peak of a block is not
+    hidden by an earlier larger block. The thread stops once no block
+    is left running.
+
+    """
+
+    def __init__(self, interval=0.01):
+        """
+        Args:
+            interval: (float) Seconds between two samples
+
+        """
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.peaks = dict()
+        self.thread = None
+
+    def start(self, key):
+        """
+        Args:
+            key: (Any) Hashable item identifying the block e.g. the span
+
+        Returns:
+            rss: (float) Resident memory in megabytes at the start of the block, None where it is not available
+        """
+        rss = current_rss_mb()
+        if rss is None:
+            return None
+        with self.lock:
+            self.peaks[key] = rss
+            # a forked process does not inherit the thread of its parent
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.sample, daemon=True)
+                self.thread.start()
+
+        return rss
+
+    def stop(self, key):
+        """
+        Args:
+            key: (Any) Item the block was started with
+
+        Returns:
+            rss: (float) Resident memory in megabytes at the end of the block
+            peak_rss: (float) Sampled peak of the resident memory in megabytes within the block
+        """
+        rss = current_rss_mb()
+        with self.lock:
+            peak_rss = self.peaks.pop(key, None)
+        if rss is None or peak_rss is None:
+            return rss, None
+
+        return rss, max(peak_rss, rss)
+
+    def sample(self):
+        while True:
+            time.sleep(self.interval)
+            rss = current_rss_mb()
+            with self.lock:
+                if not self.peaks:
+                    self.thread = None
+                    return
+                for key, peak_rss in self.peaks.items():
+                    self.peaks[key] = max(peak_rss, rss)
+
+
+class NullSpan:
+    """
+
+    Span returned while the telemetry is disabled, it records nothing
+
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setitem__(self, key, value):
+        pass
+
+
+null_span = NullSpan()
+
+
+class Span:
+    """
+
+    Times a block and emits a single event when the block exits. The
+    cpu time and the resident memory are the ones of the whole process,
+    blocks running at the same time on threads count the cpu time and
+    the allocations of each other as well.
+
+    """
+
+    def __init__(self, telemetry, name, rows, fields):
+        """
+        Args:
+            telemetry: (Telemetry) Telemetry the event is emitted on
+            name: (str) Name of the event
+            rows: (int) Number of rows the block processes, rows per second are reported if given
+            fields: (dict) Fields of the event e.g. the model or the feature
+
+        """
+        self.telemetry = telemetry
+        self.name = name
+        self.rows = rows
+        self.fields = fields
+
+    def __setitem__(self, key, value):
+        # fields which are only known inside the block e.g. the decision taken on a feature
+        self.fields[key] = value
+
+    def __enter__(self):
+        parent, inherited_fields = enclosing_span.get()
+        self.parent = parent
+        self.fields = {**inherited_fields, **self.fields}
+        self.token = enclosing_span.set((self.name, dict(self.fields)))
+        self.start_rss = self.telemetry.rss_sampler.start(self)
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self.start_time
+        cpu_time = time.process_time() - self.start_cpu_time
+        end_rss, peak_rss = self.telemetry.rss_sampler.stop(self)
+        enclosing_span.reset(self.token)
+        # memory the block kept and the sampled peak it reached, both over the memory at its start
+        event = {"event": self.name, "parent": self.parent, **self.fields, "wall_s": wall_time, "cpu_s": cpu_time,
+                 "rss_mb": end_rss, "rss_delta_mb": end_rss - self.start_rss if self.start_rss is not None else None,
+                 "peak_rss_delta_mb": peak_rss - self.start_rss if self.start_rss is not None else None,
+                 "pid": os.getpid(), "timestamp": time.time()}
+        if self.rows is not None:
+            event["rows"] = int(self.rows)
+            event["rows_per_s"] = self.rows / wall_time if wall_time > 0 else None
+        if exc_type is not None:
+            event["error"] = exc_type.__name__
+        self.telemetry.emit(event)
+
+        return False
+
+
+class Telemetry:
+    """
+
+    Collects the timing events of the pipeline stages and hands them to
+    callbacks, a JSON lines file is one of them. While disabled a span
+    costs a single attribute check.
+
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.callbacks = list()
+        self.lock = threading.Lock()
+        self.outfile = None
+        self.rss_sampler = RSSSampler()
+
+    def enable(self, path=None, callback=None):
+        """
+        Args:
+            path: (str) JSON lines file the events are appended to, worker processes append to it as well
+            callback: (Any) Callable receiving every event dict of this process
+
+        """
+        if path is not None and self.outfile is None:
+            # line buffering writes every event at once, so that processes appending together never mix lines
+            self.outfile = open(path, "a", buffering=1)
+            self.callbacks.append(self.write_event)
+            os.environ[telemetry_variable] = os.path.abspath(path)
+        if callback is not None:
+            self.callbacks.append(callback)
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stops recording, closes the JSON lines file and removes the callbacks
+
+        """
+        self.enabled = False
+        self.callbacks = list()
+        if self.outfile is not None:
+            self.outfile.close()
+            self.outfile = None
+        os.environ.pop(telemetry_variable, None)
+
+    def span(self, name, rows=None, **fields):
+        """
+        Args:
+            name: (str) Name of the event
+            rows: (int) Number of rows the block processes
+            fields: (Any) Fields of the event
+
+        Returns:
+            span: (Any) Context manager timing the block, a no-op while disabled
+        """
+        if not self.enabled:
+            return null_span
+
+        return Span(self, name, rows, fields)
+
+    def emit(self, event):
+        """
+        Args:
+            event: (dict) Event handed to every callback
+
+        """
+        with self.lock:
+            for callback in self.callbacks:
+                callback(event)
+
+    def write_event(self, event):
+        self.outfile.write(json.dumps(event, default=str) + "\n")
+
+
+class StageSummary:
+    """
+
+    Callback adding up the wall time of the top level events, to report the share of every stage
+
+    """
+
+    def __init__(self):
+        self.wall_times = dict()
+
+    def __call__(self, event):
+        if event["parent"] is None:
+            self.wall_times[event["event"]] = self.wall_times.get(event["event"], 0.0) + event["wall_s"]
+
+    def report(self):
+        """
+        Prints the wall time and share of every stage
+
+        """
+        total_time = sum(self.wall_times.values())
+        print(f"Stage wall times :")
+        for stage, wall_time in sorted(self.wall_times.items(), key=lambda item: -item[1]):
+            print(f"{stage} : {wall_time:.3f} s ({100 * wall_time / max(total_time, 1e-12):.1f} %)")
+
+
+# Telemetry of the process, the pipeline modules record their spans on it
+telemetry = Telemetry()
+# Worker processes started by an instrumented run append their events to the same file
+if os.environ.get(telemetry_variable):
+    telemetry.enable(os.environ[telemetry_variable])
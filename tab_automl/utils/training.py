@@ -1,7 +1,29 @@
 """
 This file holds all utilities for training.
 """
-from sklearn.model_selection import train_test_split
+import math
+import os
+import pickle
+import tempfile
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.model_selection import KFold, StratifiedKFold, train_test_split
+from sklearn.base import clone
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+from tab_automl.utils.cache import describe
+from tab_automl.utils.losses import fetch_metric_scores, sample_score_rows, score_predictions
+from tab_automl.utils.telemetry import telemetry
+warnings.filterwarnings("ignore")
+
+# Holds the memory-mapped training data already loaded by the current (worker) process
+_shared_data_cache = dict()
 
 
 def train_validation_split(x, y):
@@ -31,8 +53,507 @@ def train_validation_split(x, y):
         val_ratio = 0.1
 
     # Splitting dataset into train and validation
-    x_train, x_val, y_train, y_val = train_test_split(x, y, test_size=val_ratio, random_state=42)
+    with telemetry.span("split", rows=x.shape[0]):
+        x_train, x_val, y_train, y_val = train_test_split(x, y, test_size=val_ratio, random_state=42)
     print(f"Validation data prepared."
           f" Train - Validation ratio taken {int(100 - val_ratio * 100)} % - {int(val_ratio * 100)} % .")
 
     return x_train, y_train, x_val, y_val
+
+
+def cross_validation_folds(y, n_folds=5, stratify=False, random_state=42):
+    """
+    Prepares the folds of a k-fold cross validation as row positions,
+    so every fold addresses the same feature matrix without copying it
+
+    Args:
+        y: (pandas.Dataframe) Target set / dependent feature
+        n_folds: (int) Number of folds
+        stratify: (bool) whether the class ratio of y will be kept on every fold
+        random_state: (int) Seed of the shuffling
+
+    Returns:
+        folds: (List[tuple]) Training and validation row positions of every fold
+    """
+
+    assert n_folds >= 2, "Cross validation needs at least 2 folds..."
+    assert y.shape[0] >= n_folds, "Less records than folds..."
+    # Every class needs a row on every fold to be stratified
+    if stratify and y.iloc[:, 0].value_counts().min() >= n_folds:
+        splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    else:
+        splitter = KFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    folds = list(splitter.split(np.zeros((y.shape[0], 1)), y.iloc[:, 0]))
+    print(f"{n_folds} cross validation folds prepared on {y.shape[0]} records"
+          f"{', stratified' if isinstance(splitter, StratifiedKFold) else ''}.")
+
+    return folds
+
+
+def take_rows(x, rows):
+    """
+    Args:
+        x: (Any) Feature set or target set, dataframe, numpy array or sparse matrix
+        rows: (numpy.ndarray) Row positions
+
+    Returns:
+        x: (Any) Rows of x
+    """
+    return x.iloc[rows] if isinstance(x, (pd.DataFrame, pd.Series)) else x[rows]
+
+
+def to_dense(x):
+    """
+    Args:
+        x: (Any) Feature set, sparse or dense
+
+    Returns:
+        x: (Any) Dense feature set, dense input is returned as is
+    """
+    return x.toarray() if sparse.issparse(x) else x
+
+
+class DenseInput:
+    """
+
+    Model factory for models which only accept dense input, the model
+    is built inside a pipeline which converts sparse input to dense
+    right before fitting and predicting, so the dense copy only lives
+    as long as the call needs it
+
+    """
+
+    def __init__(self, model_class):
+        """
+        Args:
+            model_class: (Any) Model class which will be instantiated with the received arguments
+
+        """
+        self.model_class = model_class
+
+    def __repr__(self):
+        return f"DenseInput({describe(self.model_class)})"
+
+    def __call__(self, **params):
+        return make_pipeline(FunctionTransformer(to_dense, accept_sparse=True), self.model_class(**params))
+
+
+def matrix_dtype(x, block_rows=65536):
+    """
+    Args:
+        x: (Any) Numerical feature set, dataframe, numpy array or sparse matrix
+        block_rows: (int) Number of rows checked at once
+
+    Returns:
+        dtype: (numpy.dtype) float32 if it holds the exact values of every feature, float64 otherwise
+    """
+    if sparse.issparse(x):
+        x = x.tocsr().data.reshape(-1, 1)
+    dtypes = x.dtypes if isinstance(x, pd.DataFrame) else [x.dtype]
+    # booleans, small integers and float32 features always fit
+    if all(dtype.kind == "b" or (dtype.kind in "iu" and dtype.itemsize <= 2) or dtype == np.float32
+           for dtype in dtypes):
+        return np.dtype(np.float32)
+    for start in range(0, x.shape[0], block_rows):
+        block = x.iloc[start:start + block_rows].to_numpy(dtype=np.float64, na_value=np.nan) \
+            if isinstance(x, pd.DataFrame) else np.asarray(x[start:start + block_rows], dtype=np.float64)
+        # Keeping float64 when float32 can not hold the exact values e.g. decimals or ids above 2**24
+        if not np.array_equal(block.astype(np.float32), block, equal_nan=True):
+            return np.dtype(np.float64)
+
+    return np.dtype(np.float32)
+
+
+def to_training_matrix(x, folder=None, memmap_min_mb=256, block_rows=65536):
+    """
+    Materializes a feature set once as a C-contiguous float matrix, the
+    layout most estimators train and predict on without another copy.
+    The matrix is float32 only when it holds the exact values of every
+    feature, so that the scores never change with the layout. Large
+    matrices are written block by block into a memory-mapped file, so
+    the whole matrix does not have to fit in memory.
+
+    Args:
+        x: (Any) Feature set, dataframe, numpy array or sparse matrix
+        folder: (str) Directory of the memory-mapped file, matrices are kept in memory if None
+        memmap_min_mb: (float) Minimum size of the matrix in megabytes to memory-map it
+        block_rows: (int) Number of rows converted at once
+
+    Returns:
+        x: (Any) float32 or float64 matrix, CSR matrix for sparse input, or x itself if it
+            holds non-numerical features
+    """
+    if sparse.issparse(x):
+        return x.tocsr().astype(matrix_dtype(x, block_rows))
+    dtypes = x.dtypes if isinstance(x, pd.DataFrame) else [x.dtype]
+    if not all(dtype.kind in "biuf" for dtype in dtypes):
+        # categorical or text features are left to the estimators which support them
+        return x
+    dtype = matrix_dtype(x, block_rows)
+    if isinstance(x, np.ndarray) and x.dtype == dtype and x.flags.c_contiguous:
+        return x
+    n_bytes = x.shape[0] * x.shape[1] * dtype.itemsize
+    if folder is None or n_bytes < memmap_min_mb * (1 << 20):
+        matrix = np.empty(x.shape, dtype=dtype)
+    else:
+        file_descriptor, path = tempfile.mkstemp(dir=folder, suffix=f".{dtype.name}")
+        os.close(file_descriptor)
+        matrix = np.memmap(path, dtype=dtype, mode="w+", shape=x.shape)
+    for start in range(0, x.shape[0], block_rows):
+        block = x.iloc[start:start + block_rows] if isinstance(x, pd.DataFrame) else x[start:start + block_rows]
+        # converting a block of rows at once keeps the intermediate copy small
+        matrix[start:start + block_rows] = block.to_numpy(dtype=dtype, na_value=np.nan) \
+            if isinstance(block, pd.DataFrame) else block
+    if isinstance(matrix, np.memmap):
+        matrix.flush()
+        # reopening read-only, every fit, prediction and worker shares the same pages
+        matrix = np.memmap(matrix.filename, dtype=dtype, mode="r", shape=x.shape)
+
+    return matrix
+
+
+class MappedMatrix:
+    """
+
+    Reference to a matrix memory-mapped from its own file, it is
+    pickled without its items and mapped again by the worker process
+
+    """
+
+    def __init__(self, matrix):
+        """
+        Args:
+            matrix: (numpy.memmap) Matrix mapped from the whole file
+
+        """
+        self.path = matrix.filename
+        self.dtype = matrix.dtype
+        self.shape = matrix.shape
+
+    @staticmethod
+    def is_mapped(matrix):
+        """
+        Args:
+            matrix: (Any) Item of the training data
+
+        Returns:
+            (bool) whether the matrix is mapped from the whole of its own file
+        """
+        return isinstance(matrix, np.memmap) and matrix.filename is not None and matrix.offset == 0 and \
+            matrix.flags.c_contiguous and matrix.nbytes == os.path.getsize(matrix.filename)
+
+    def open(self):
+        """
+        Returns:
+            matrix: (numpy.memmap) Read-only mapping of the matrix
+        """
+        return np.memmap(self.path, dtype=self.dtype, mode="r", shape=self.shape)
+
+
+def share_training_data(data, folder):
+    """
+    Dumps the training matrices once on disk so that every
+    worker process can memory-map the same copy, matrices
+    which are already memory-mapped are only referenced
+
+    Args:
+        data: (tuple) Training matrices e.g. (x_train, y_train, x_val, y_val)
+        folder: (str) Directory where the shared copy will be written
+
+    Returns:
+        data_path: (str) Path of the shared copy
+    """
+
+    data_path = os.path.join(folder, "shared_training_data.pkl")
+    joblib.dump(tuple(MappedMatrix(matrix) if MappedMatrix.is_mapped(matrix) else matrix for matrix in data),
+                data_path)
+
+    return data_path
+
+
+def load_shared_data(data_path):
+    """
+    Memory-maps the shared training matrices, only once per process
+
+    Args:
+        data_path: (str) Path returned by share_training_data
+
+    Returns:
+        data: (tuple) Memory-mapped training matrices
+    """
+
+    if data_path not in _shared_data_cache:
+        data = joblib.load(data_path, mmap_mode="r")
+        _shared_data_cache[data_path] = tuple(matrix.open() if isinstance(matrix, MappedMatrix) else matrix
+                                              for matrix in data)
+
+    return _shared_data_cache[data_path]
+
+
+def fit_and_score_model(model_name, model_class, data, metric_list, verbose=True, train_score_size=None):
+    """
+    Trains a single model of the model zoo and scores it on train and validation data
+
+    Args:
+        model_name: (str) Name of the model inside the model zoo
+        model_class: (Any) Model class which will be instantiated with default arguments
+        data: (tuple or str) (x_train, y_train, x_val, y_val) or the path of their shared copy
+        metric_list: (List[Any]) List of metric on which the model will be tested
+        verbose: (bool) whether the metric scores will be printed while scoring
+        train_score_size: (int) Number of training rows the training metrics are scored on, all rows if None
+
+    Returns:
+        model_name: (str) Name of the model inside the model zoo
+        model: (Any) Trained model
+        metric_scores: (dict) Train and validation scores of the model
+        fit_time: (float) Wall time taken to train and score the model in seconds
+    """
+
+    # Loading the shared copy of the data if a path is received
+    if isinstance(data, str):
+        data = load_shared_data(data)
+    x_train, y_train, x_val, y_val = data
+    start_time = time.time()
+    with telemetry.span("model", model=model_name):
+        # Declaring the model
+        model = model_class()
+        # Training the model
+        with telemetry.span("fit", rows=x_train.shape[0]):
+            model.fit(x_train, y_train)
+        # fetching metric_scores
+        metric_scores = fetch_metric_scores((x_train, y_train),
+                                            (x_val, y_val), metrics=metric_list,
+                                            trained_model=model, verbose=verbose,
+                                            train_score_size=train_score_size)
+    fit_time = time.time() - start_time
+
+    return model_name, model, metric_scores, fit_time
+
+
+def fit_and_score_shared_model(model_name, model_class, data_path, metric_list, train_score_size=None):
+    """
+    Worker side of fit_and_score_model on the shared copy of the data.
+    The trained model is sent back as pickled bytes so that it does
+    not keep any reference to the memory-mapped copy of the worker
+
+    Args:
+        model_name: (str) Name of the model inside the model zoo
+        model_class: (Any) Model class which will be instantiated with default arguments
+        data_path: (str) Path of the shared copy of (x_train, y_train, x_val, y_val)
+        metric_list: (List[Any]) List of metric on which the model will be tested
+        train_score_size: (int) Number of training rows the training metrics are scored on, all rows if None
+
+    Returns:
+        model_name: (str) Name of the model inside the model zoo
+        model_bytes: (bytes) Pickled trained model
+        metric_scores: (dict) Train and validation scores of the model
+        fit_time: (float) Wall time taken to train and score the model in seconds
+    """
+
+    model_name, model, metric_scores, fit_time = fit_and_score_model(model_name, model_class, data_path,
+                                                                     metric_list, verbose=False,
+                                                                     train_score_size=train_score_size)
+
+    return model_name, pickle.dumps(model), metric_scores, fit_time
+
+
+def fit_and_score_fold(model_name, model_class, data, train_index, val_index, metric_list, train_score_size=None):
+    """
+    Trains a single model on the training rows of a fold and scores it on the validation rows of the fold
+
+    Args:
+        model_name: (str) Name of the model inside the model zoo
+        model_class: (Any) Model class which will be instantiated with default arguments
+        data: (tuple or str) (x, y) or the path of their shared copy
+        train_index: (numpy.ndarray) Training row positions of the fold
+        val_index: (numpy.ndarray) Validation row positions of the fold
+        metric_list: (List[Any]) List of metric on which the model will be tested
+        train_score_size: (int) Number of training rows the training metrics are scored on, all rows if None
+
+    Returns:
+        model_name: (str) Name of the model inside the model zoo
+        metric_scores: (dict) Train and validation scores of the fold
+        val_pred: (numpy.ndarray) Predictions of the validation rows of the fold
+        fit_time: (float) Wall time taken to train and score the model in seconds
+    """
+
+    # Loading the shared copy of the data if a path is received
+    if isinstance(data, str):
+        data = load_shared_data(data)
+    x, y = data
+    start_time = time.time()
+    with telemetry.span("model", model=model_name, fold_rows=len(val_index)):
+        # Only the rows of the fold are gathered, the shared matrix itself is never copied
+        x_train, y_train = take_rows(x, train_index), take_rows(y, train_index)
+        model = model_class()
+        with telemetry.span("fit", rows=len(train_index)):
+            model.fit(x_train, y_train)
+        with telemetry.span("predict", rows=len(val_index), split="val"):
+            val_pred = model.predict(take_rows(x, val_index))
+        x_score, y_score = sample_score_rows(x_train, y_train, train_score_size)
+        with telemetry.span("predict", rows=x_score.shape[0], split="train"):
+            train_pred = model.predict(x_score)
+        metric_scores = score_predictions((y_score, train_pred), (take_rows(y, val_index), val_pred),
+                                          metrics=metric_list, verbose=False)
+    fit_time = time.time() - start_time
+
+    return model_name, metric_scores, val_pred, fit_time
+
+
+def continue_boosting(model, previous_model, x_train, y_train):
+    """
+    Trains more boosting rounds on top of the rounds of an earlier model
+
+    Args:
+        model: (Any) Model holding the number of additional rounds
+        previous_model: (Any) Trained model of the earlier rounds
+        x_train: (Any) Feature set / Affecting features for training
+        y_train: (Any) Target set / dependent feature for training
+
+    """
+    if hasattr(previous_model, "booster_"):
+        # LightGBM keeps the trees of the initial model on the continued booster
+        model.fit(x_train, y_train, init_model=previous_model.booster_)
+    else:
+        # XGBoost
+        model.fit(x_train, y_train, xgb_model=previous_model.get_booster())
+
+
+def continue_training(model, x_train, y_train, n_rounds=100):
+    """
+    Trains a fitted model further on new rows without the rows it was trained on before.
+    Boosting models get more boosting rounds on top of their trees, models with partial_fit
+    take a pass over the new rows, the members of an ensemble are trained further one by one.
+
+    Args:
+        model: (Any) Trained model
+        x_train: (Any) Feature set / Affecting features of the new rows
+        y_train: (Any) Target set / dependent feature of the new rows
+        n_rounds: (int) Number of additional boosting rounds
+
+    Returns:
+        model: (Any) Updated model, the received model itself if it can not be trained further
+        technique: (str) boosting, partial_fit or ensemble, None if the model can not be trained further
+    """
+    y_train = np.asarray(y_train).ravel()
+    if hasattr(model, "members"):
+        # an ensemble keeps its weights, the members which can not be trained further stay as they are
+        techniques = dict()
+        for model_name, member in model.members.items():
+            model.members[model_name], techniques[model_name] = continue_training(member, x_train, y_train, n_rounds)
+        return model, "ensemble" if any(techniques.values()) else None
+    if isinstance(model, Pipeline):
+        # the steps before the model e.g. the dense conversion only transform the rows
+        estimator, technique = continue_training(model[-1], model[:-1].transform(x_train), y_train, n_rounds)
+        model.steps[-1] = (model.steps[-1][0], estimator)
+        return model, technique
+    if hasattr(model, "booster_") or hasattr(model, "get_booster"):
+        next_model = clone(model).set_params(n_estimators=n_rounds)
+        continue_boosting(next_model, model, x_train, y_train)
+        return next_model, "boosting"
+    if hasattr(model, "partial_fit"):
+        model.partial_fit(x_train, y_train)
+        return model, "partial_fit"
+
+    return model, None
+
+
+def sample_rows(x, y, n_rows, stratify=False, random_state=42):
+    """
+    Draws a random subsample of rows keeping x and y aligned
+
+    Args:
+        x: (pandas.DataFrame) Feature set / Affecting features
+        y: (pandas.Dataframe) Target set / dependent feature
+        n_rows: (int) Number of rows in the subsample
+        stratify: (bool) whether the class ratio of y will be kept on the subsample
+        random_state: (int) Seed of the sampling
+
+    Returns:
+        x_sample: (pandas.DataFrame) Subsampled feature set
+        y_sample: (pandas.Dataframe) Subsampled target feature
+    """
+
+    # Returning the full data when the subsample is not smaller
+    if n_rows >= x.shape[0]:
+        return x, y
+    stratify_on = None
+    if stratify:
+        class_counts = y.iloc[:, 0].value_counts()
+        # Every class needs at least two rows and one row for each class on the subsample
+        if class_counts.min() >= 2 and n_rows >= len(class_counts):
+            stratify_on = y.iloc[:, 0]
+    x_sample, _, y_sample, _ = train_test_split(x, y, train_size=n_rows, stratify=stratify_on,
+                                                random_state=random_state)
+
+    return x_sample, y_sample
+
+
+def estimate_fit_times(models, data, metric_list, complexity=None, sample_size=1000, stratify=False):
+    """
+    Projects the full training and scoring time of every model
+    from a quick fit on a small sample of the data
+
+    Args:
+        models: (dict) Model zoo of the problem type
+        data: (tuple) (x_train, y_train, x_val, y_val)
+        metric_list: (List[Any]) List of metric on which the model will be tested
+        complexity: (dict) Growth exponent of the time with the number of rows for each model
+        sample_size: (int) Number of training rows used for the quick fit
+        stratify: (bool) whether the class ratio will be kept on the sample
+
+    Returns:
+        projected_times: (dict) Projected wall time in seconds for each model, inf if the quick fit failed
+        errors: (dict) Error raised by the quick fit of the failed models
+    """
+
+    complexity = complexity or dict()
+    x_train, y_train, x_val, y_val = data
+    x_sample, y_sample = sample_rows(x_train, y_train, sample_size, stratify=stratify)
+    x_val_sample, y_val_sample = sample_rows(x_val, y_val, max(sample_size // 5, 1), stratify=stratify)
+    scale = x_train.shape[0] / x_sample.shape[0]
+    projected_times = dict()
+    errors = dict()
+    for model_name, model_class in models.items():
+        try:
+            *_, sample_time = fit_and_score_model(model_name, model_class,
+                                                  (x_sample, y_sample, x_val_sample, y_val_sample),
+                                                  metric_list, verbose=False)
+        except Exception as error:
+            projected_times[model_name] = math.inf
+            errors[model_name] = error
+            continue
+        projected_times[model_name] = sample_time * scale ** complexity.get(model_name, 1)
+
+    return projected_times, errors
+
+
+def schedule_within_budget(model_names, projected_times, time_budget, n_workers):
+    """
+    Assigns the models to the earliest free worker in the given
+    order and keeps the ones which are projected to finish in time
+
+    Args:
+        model_names: (List[str]) Models in the order they will be submitted
+        projected_times: (dict) Projected wall time in seconds for each model
+        time_budget: (float) Available wall time in seconds
+        n_workers: (int) Number of models trained at the same time
+
+    Returns:
+        scheduled: (List[str]) Models which fit in the budget
+        skipped: (dict) Projected finishing time of the models which do not fit in the budget
+    """
+
+    worker_free_at = [0.0] * max(n_workers, 1)
+    scheduled = list()
+    skipped = dict()
+    for model_name in model_names:
+        worker = worker_free_at.index(min(worker_free_at))
+        finish_time = worker_free_at[worker] + projected_times[model_name]
+        if finish_time > time_budget:
+            skipped[model_name] = finish_time
+            continue
+        worker_free_at[worker] = finish_time
+        scheduled.append(model_name)
+
+    return scheduled, skipped
@@ -1,7 +1,16 @@
 """
 This file is for testing the integration of the library classes and functions.
 """
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
 from tab_automl.automl.datasets import Iris, Wine
+from tab_automl.automl.inference import InferencePipeline
+from tab_automl.automl.serving import InferenceServer, MicroBatcher
 from tab_automl.automl.training import Trainer
 from tab_automl.automl.processing import PreProcessing
 from tab_automl.automl.fet_engineering import FeatureEngineering
@@ -66,11 +75,140 @@ def regression_test():
     print(f"Regression test completed successfully...\n")
 
 
+# Directory of the repository, the CLI runs import the package from it
+root = os.path.dirname(os.path.abspath(__file__))
+iris_path = os.path.join(root, "tab_automl", "datasets", "Iris.csv")
+wine_path = os.path.join(root, "tab_automl", "datasets", "wine.csv")
+
+
+def run_automl(workdir, *arguments):
+    """
+    Runs the CLI in its own process and checks that a model was trained
+
+    Args:
+        workdir: (str) Working directory of the run, the outputs are written there
+        arguments: (str) Parser variables of the run
+
+    Returns:
+        output: (str) Printed output of the run
+    """
+    process = subprocess.run([sys.executable, "-m", "tab_automl.main", *arguments, "-spd", "false", "-sfd", "false",
+                              "-nc", "true"], cwd=workdir, env={**os.environ, "PYTHONPATH": root},
+                             capture_output=True, text=True)
+    assert process.returncode == 0, process.stdout + process.stderr
+    assert "No model trained" not in process.stdout, process.stdout
+
+    return process.stdout
+
+
+def sparse_one_hot_test():
+    print(f"Testing through the sparse one hot encoding ...")
+    with tempfile.TemporaryDirectory() as workdir:
+        run_automl(workdir, "-d", iris_path, "-t", "classification", "-tf", "Species", "-so", "true")
+    print(f"Sparse one hot test completed successfully...\n")
+
+
+def cross_validation_test():
+    print(f"Testing through the cross validation ...")
+    with tempfile.TemporaryDirectory() as workdir:
+        run_automl(workdir, "-d", iris_path, "-t", "classification", "-tf", "Species", "-cv", "3")
+    print(f"Cross validation test completed successfully...\n")
+
+
+def hyperparameter_search_test():
+    print(f"Testing through the hyperparameter search ...")
+    with tempfile.TemporaryDirectory() as workdir:
+        arguments = ("-d", iris_path, "-t", "classification", "-tf", "Species", "-hs", "true")
+        run_automl(workdir, *arguments, "-nt", "10")
+        history_path = os.path.join(workdir, "tuning_history.jsonl")
+        assert os.path.isfile(history_path), "Tuning history not written..."
+        # an interrupted write leaves a truncated last line, the search resumes from the earlier trials
+        with open(history_path, "a") as outfile:
+            outfile.write('{"search": "')
+        output = run_automl(workdir, *arguments, "-nt", "12")
+        assert "Resuming the search from 10 trials" in output, output
+        with open(history_path) as infile:
+            assert all(json.loads(line)["trial"] in (10, 11) for line in infile.readlines()[-2:]), \
+                "Resumed trials not readable..."
+    print(f"Hyperparameter search test completed successfully...\n")
+
+
+def ensemble_test():
+    print(f"Testing through the ensemble selection ...")
+    with tempfile.TemporaryDirectory() as workdir:
+        output = run_automl(workdir, "-d", iris_path, "-t", "classification", "-tf", "Species", "-es", "20")
+        assert "Ensemble weights" in output, output
+        InferencePipeline.load(os.path.join(workdir, "inference_pipeline.pkl"))
+    print(f"Ensemble test completed successfully...\n")
+
+
+def incremental_test():
+    print(f"Testing through the incremental training ...")
+    with tempfile.TemporaryDirectory() as workdir:
+        run_automl(workdir, "-d", iris_path, "-t", "classification", "-tf", "Species")
+        output = run_automl(workdir, "-d", iris_path, "-t", "classification", "-tf", "Species", "-inc", "true",
+                            "-pp", "inference_pipeline.pkl", "-ir", "10")
+        assert "Updating inference_pipeline.pkl" in output, output
+        InferencePipeline.load(os.path.join(workdir, "inference_pipeline.pkl"))
+    print(f"Incremental training test completed successfully...\n")
+
+
+def out_of_core_test():
+    print(f"Testing through the out-of-core training ...")
+    with tempfile.TemporaryDirectory() as workdir:
+        output = run_automl(workdir, "-d", wine_path, "-t", "regression", "-tf", "quality", "-cs", "500",
+                            "-ooc", "true", "-ep", "2")
+        assert "Best model validator : val_mse" in output, output
+        InferencePipeline.load(os.path.join(workdir, "inference_pipeline.pkl"))
+    print(f"Out-of-core training test completed successfully...\n")
+
+
+def serving_test():
+    print(f"Testing through the prediction server batches ...")
+    with tempfile.TemporaryDirectory() as workdir:
+        run_automl(workdir, "-d", iris_path, "-t", "classification", "-tf", "Species")
+        pipeline = InferencePipeline.load(os.path.join(workdir, "inference_pipeline.pkl"))
+    records = [{"Id": 1, "SepalLengthCm": 5.1, "SepalWidthCm": 3.5, "PetalLengthCm": 1.4, "PetalWidthCm": 0.2}]
+    valid_body = json.dumps({"records": records}).encode()
+    # a request missing a feature must be refused whether it is predicted alone or together with others
+    invalid_body = json.dumps({"records": [{key: value for key, value in records[0].items()
+                                            if key != "PetalWidthCm"}]}).encode()
+
+    async def requests():
+        server = InferenceServer(pipeline, max_wait_ms=200)
+        server.batcher = MicroBatcher(pipeline, server.metrics, max_wait_ms=200)
+        batcher_task = asyncio.create_task(server.batcher.run())
+        alone = await server.respond("POST", "/predict", invalid_body)
+        together = await asyncio.gather(server.respond("POST", "/predict", valid_body),
+                                        server.respond("POST", "/predict", invalid_body))
+        batcher_task.cancel()
+        return alone, together
+
+    alone, (valid, invalid) = asyncio.run(requests())
+    assert alone[0] == 400 and invalid[0] == 400, (alone, invalid)
+    assert valid == (200, {"predictions": ["Iris-setosa"]}), valid
+    print(f"Serving test completed successfully...\n")
+
+
 def test():
     # Testing classification
     classification_test()
     # Testing Regression
     regression_test()
+    # Testing the sparse one hot encoding
+    sparse_one_hot_test()
+    # Testing the cross validation
+    cross_validation_test()
+    # Testing the hyperparameter search
+    hyperparameter_search_test()
+    # Testing the ensemble selection
+    ensemble_test()
+    # Testing the incremental training
+    incremental_test()
+    # Testing the out-of-core training
+    out_of_core_test()
+    # Testing the prediction server
+    serving_test()
    
 
 if __name__ == "__main__":